@@ -0,0 +1,215 @@
+"""Municipality adjacency graph (CSR) derived from shared boundary vertices.
+
+Vértices são quantizados em uma grade inteira e combinados em uma chave int64;
+municípios que compartilham pelo menos um vértice são vizinhos (contiguidade
+"queen"). Nenhum teste par-a-par entre polígonos é necessário.
+
+Arquivo binário (little-endian):
+    MAGIC | uint32 tamanho do cabeçalho | cabeçalho JSON {version, codes}
+    | uint32[n + 1] indptr | uint32[nnz] indices
+
+Uso (executado também ao final de combine_geojson.py):
+    python adjacency.py [--quantization 1000000]
+"""
+import argparse
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from feature_index import FeatureIndex, get_feature_index
+from memory_budget import budget
+
+logger = logging.getLogger(__name__)
+
+ADJACENCY_PATH = os.environ.get('ADJACENCY_PATH', 'data/municipality_adjacency.bin')
+# Passos da grade por grau: 1e6 equivale às 6 casas decimais dos arquivos do IBGE
+DEFAULT_QUANTIZATION = 1000000
+MAX_HOPS = int(os.environ.get('ADJACENCY_MAX_HOPS', '5'))
+
+MAGIC = b'GEOADJ01'
+HEADER_LENGTH = struct.Struct('<I')
+
+
+def _feature_vertices(geometry, quantization):
+    if not geometry:
+        return None
+    if geometry.get('type') == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif geometry.get('type') == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        return None
+    rings = [np.asarray(ring, dtype=np.float64)[:, :2] for polygon in polygons for ring in polygon if ring]
+    if not rings:
+        return None
+    points = np.rint(np.vstack(rings) * quantization).astype(np.int64)
+    # Chave única por vértice: x e y deslocados para inteiros sem sinal de 32 bits
+    return np.unique(((points[:, 0] + 2 ** 31) << 32) | (points[:, 1] + 2 ** 31))
+
+
+class Adjacency:
+    """Symmetric adjacency in CSR form over the municipalities of the feature index"""
+
+    def __init__(self, version, codes, indptr, indices):
+        self.version = version
+        self.codes = list(codes)
+        self.position = {code: index for index, code in enumerate(self.codes)}
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        # Linha de cada entrada não nula, para o produto matriz-vetor com bincount
+        self._entry_rows = np.repeat(np.arange(len(self.codes)), np.diff(self.indptr))
+
+    @classmethod
+    def build(cls, feature_index, quantization=DEFAULT_QUANTIZATION):
+        """Hash every quantized vertex and link the municipalities that share one"""
+        keys, owners = [], []
+        codes = []
+        for entry, raw in feature_index.read_features(range(len(feature_index.entries))):
+            vertices = _feature_vertices(json.loads(raw).get('geometry'), quantization)
+            if vertices is None:
+                continue
+            keys.append(vertices)
+            owners.append(np.full(len(vertices), len(codes), dtype=np.int64))
+            codes.append(entry[0])
+
+        if not codes:
+            return cls(feature_index.version, [], [0], [])
+
+        keys = np.concatenate(keys)
+        owners = np.concatenate(owners)
+        order = np.lexsort((owners, keys))
+        keys, owners = keys[order], owners[order]
+
+        # Vértices compartilhados por k municípios aparecem em k posições consecutivas
+        sources, targets = [], []
+        distance = 1
+        while distance < len(keys):
+            same = keys[distance:] == keys[:-distance]
+            if not same.any():
+                break
+            sources.append(owners[:-distance][same])
+            targets.append(owners[distance:][same])
+            distance += 1
+
+        count = len(codes)
+        if sources:
+            sources = np.concatenate(sources)
+            targets = np.concatenate(targets)
+            pairs = np.unique(np.concatenate([sources * count + targets, targets * count + sources]))
+            pairs = pairs[pairs // count != pairs % count]
+        else:
+            pairs = np.zeros(0, dtype=np.int64)
+        rows, columns = pairs // count, pairs % count
+        indptr = np.searchsorted(rows, np.arange(count + 1))
+        return cls(feature_index.version, codes, indptr, columns)
+
+    def save(self, path=ADJACENCY_PATH):
+        header = json.dumps({'version': self.version, 'codes': self.codes},
+                            ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(HEADER_LENGTH.pack(len(header)))
+            f.write(header)
+            f.write(self.indptr.astype('<u4').tobytes())
+            f.write(self.indices.astype('<u4').tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=ADJACENCY_PATH):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        if raw[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a municipality adjacency file")
+        position = len(MAGIC)
+        (header_length,) = HEADER_LENGTH.unpack_from(raw, position)
+        position += HEADER_LENGTH.size
+        header = json.loads(raw[position:position + header_length].decode('utf-8'))
+        position += header_length
+        count = len(header['codes'])
+        indptr = np.frombuffer(raw, dtype='<u4', count=count + 1, offset=position)
+        position += (count + 1) * 4
+        indices = np.frombuffer(raw, dtype='<u4', count=int(indptr[-1]), offset=position)
+        return cls(header['version'], header['codes'], indptr, indices)
+
+    @classmethod
+    def load_or_build(cls, feature_index, path=ADJACENCY_PATH):
+        """Reuse the stored graph while the GeoJSON is unchanged, otherwise rebuild it"""
+        try:
+            adjacency = cls.load(path)
+            if adjacency.version == feature_index.version:
+                return adjacency
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+        started = time.perf_counter()
+        adjacency = cls.build(feature_index)
+        logger.info(f"Grafo de vizinhança construído em {time.perf_counter() - started:.2f}s "
+                    f"({len(adjacency.codes)} municípios, {len(adjacency.indices) // 2} fronteiras)")
+        if adjacency.codes:
+            adjacency.save(path)
+        return adjacency
+
+    def matvec(self, vector):
+        """A @ vector (sum over each municipality's neighbours)"""
+        return np.bincount(self._entry_rows, weights=vector[self.indices], minlength=len(self.codes))
+
+    def neighbours(self, position):
+        return self.indices[self.indptr[position]:self.indptr[position + 1]]
+
+    def hops(self, position, k):
+        """Hop distance (0..k) of every municipality within k hops; -1 elsewhere"""
+        distance = np.full(len(self.codes), -1, dtype=np.int64)
+        distance[position] = 0
+        reached = np.zeros(len(self.codes))
+        reached[position] = 1
+        for hop in range(1, k + 1):
+            frontier = (self.matvec(reached) > 0) & (distance < 0)
+            if not frontier.any():
+                break
+            distance[frontier] = hop
+            reached[frontier] = 1
+        return distance
+
+
+_adjacency = None
+_adjacency_lock = threading.Lock()
+budget.register('adjacency', lambda: _adjacency)
+
+
+def get_adjacency():
+    """Adjacency of the current GeoJSON (rebuilt together with the feature index)"""
+    global _adjacency
+    feature_index = get_feature_index()
+    adjacency = _adjacency
+    if adjacency is not None and adjacency.version == feature_index.version:
+        return adjacency
+    with _adjacency_lock:
+        if _adjacency is None or _adjacency.version != feature_index.version:
+            _adjacency = Adjacency.load_or_build(feature_index)
+        return _adjacency
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerar o grafo de vizinhança dos municípios")
+    parser.add_argument('--quantization', type=int, default=DEFAULT_QUANTIZATION)
+    parser.add_argument('--output', default=ADJACENCY_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    feature_index = FeatureIndex.load_or_build()
+    started = time.perf_counter()
+    adjacency = Adjacency.build(feature_index, args.quantization)
+    adjacency.save(args.output)
+    print(f"{len(adjacency.codes)} municípios, {len(adjacency.indices) // 2} fronteiras "
+          f"em {time.perf_counter() - started:.1f}s -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
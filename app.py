@@ -1,18 +1,73 @@
 import os
+import time
 import logging
+
+_startup_started = time.perf_counter()
+
 from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask import jsonify
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging (DEBUG global deixava todas as requisições mais lentas)
+logging.basicConfig(level=getattr(logging, os.environ.get("LOG_LEVEL", "INFO").upper(), logging.INFO))
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+db = SQLAlchemy(model_class=Base)
+
+
+def database_engine_options(database_uri):
+    """Connection pool settings for the configured database"""
+    if database_uri.startswith('sqlite'):
+        # SQLite: conexões locais, sem necessidade de pool grande
+        return {
+            "pool_pre_ping": True,
+            "connect_args": {"check_same_thread": False}
+        }
+
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", "10")),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "300")),
+        "pool_pre_ping": True
+    }
+
 
 # Create the app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
+# Database configuration
+app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///geografico.db")
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = database_engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+
+# Origem dos dados das rotas do mapa: "json" (snapshot em memória) ou "db"
+app.config["DATA_BACKEND"] = os.environ.get("DATA_BACKEND", "json")
+
+db.init_app(app)
 
+# Request instrumentation (latency, response sizes, opt-in profiling)
+import metrics
+metrics.init_app(app)
+
+if app.config["DATA_BACKEND"] == "db":
+    with app.app_context():
+        import models
+        db.create_all()
 
 # Import routes
-import routes
\ No newline at end of file
+import routes
+
+# Pré-calcular as respostas das culturas principais (CACHE_WARMUP=background|sync|off)
+import warmup
+warmup.start(app)
+
+metrics.metrics.set_gauge('startup_seconds', time.perf_counter() - _startup_started,
+                          help_text='Time to import the application and register routes')
@@ -0,0 +1,88 @@
+"""Compare the JSON snapshot and the indexed database backend for map queries.
+
+Uso:
+    python -m benchmarks.db_backend [--snapshot data/crop_data_static.json] [--repeat 5]
+
+SQLite é usado como substituto do banco de produção.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def timed(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(label, timings):
+    print(f"{label:<28} p50={statistics.median(timings):8.2f}ms  "
+          f"p95={percentile(timings, 95):8.2f}ms  max={max(timings):8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--snapshot', default='data/crop_data_static.json')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    database_path = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{database_path}'
+    os.environ['DATA_BACKEND'] = 'db'
+    os.environ['CROP_DATA_PATH'] = args.snapshot
+    os.environ.setdefault('DATASET_RELOAD_INTERVAL', '0')
+
+    from app import app, db
+    from data_processor import import_crop_data_json, get_crop_data_for_map
+    from dataset import dataset
+
+    with open(args.snapshot, 'r', encoding='utf-8') as f:
+        crop_data = json.load(f)
+
+    with app.app_context():
+        started = time.perf_counter()
+        result = import_crop_data_json(crop_data)
+        print(f"Carga SQLite: {result.get('processed')} registros em {time.perf_counter() - started:.2f}s")
+
+        plan = db.session.execute(db.text(
+            "EXPLAIN QUERY PLAN SELECT m.code, f.harvested_area FROM crop_data f "
+            "JOIN municipality m ON f.municipality_id = m.id "
+            "WHERE f.crop_id = :crop_id AND m.is_valid = 1"
+        ), {"crop_id": 1}).fetchall()
+        print("Plano de consulta:", "; ".join(str(row[-1]) for row in plan))
+
+        snapshot = dataset.current()
+        crops = snapshot.crops
+
+        json_timings, db_timings, state_timings = [], [], []
+        for crop_name in crops:
+            json_timings += timed(lambda: snapshot.layer(crop_name), args.repeat)
+            db_timings += timed(lambda: get_crop_data_for_map(crop_name), args.repeat)
+            state_timings += timed(lambda: get_crop_data_for_map(crop_name, 'MT'), args.repeat)
+            db.session.expunge_all()
+
+        print(f"\n{len(crops)} culturas x {args.repeat} repetições")
+        report("JSON snapshot (memória)", json_timings)
+        report("DB indexado", db_timings)
+        report("DB indexado (UF=MT)", state_timings)
+
+    os.remove(database_path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
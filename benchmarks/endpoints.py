@@ -0,0 +1,197 @@
+"""Benchmark every /api/* endpoint on a synthetic dataset.
+
+Uso:
+    python -m benchmarks.endpoints [--preset small|state|national] [--requests 50] [--concurrency 8]
+    python -m benchmarks.endpoints --data /tmp/geo-bench --save-baseline
+
+Cada endpoint é exercitado pelo cliente de teste do Flask, primeiro em série
+(latência p50/p95/p99) e depois por um gerador de carga concorrente (vazão).
+Os resultados são comparados com benchmarks/baseline.json.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+REGRESSION_THRESHOLD = 0.20
+# Prefixos, nomes completos e erros de digitação
+SEARCH_QUERIES = ('sao', 'rio verde', 'campinas', 'xapeco', 'mogi mirin', 'cidade 01', 'cidad 02')
+
+
+def endpoint_cases(crops, states, municipalities):
+    """(name, url factory) for every read endpoint; factories pick random parameters"""
+    def crop():
+        return quote(random.choice(crops))
+
+    return [
+        ('brazilian-states', lambda: '/api/brazilian-states'),
+        ('statistics', lambda: '/api/statistics'),
+        ('crops', lambda: '/api/crops'),
+        ('crop-data', lambda: f'/api/crop-data/{crop()}'),
+        ('crop-data-columnar', lambda: f'/api/crop-data/{crop()}?format=columnar'),
+        ('crop-data-binary', lambda: f'/api/crop-data/{crop()}?format=binary'),
+        ('municipalities-metadata', lambda: '/api/municipalities/metadata'),
+        ('crop-chart-data', lambda: f'/api/crop-chart-data/{crop()}'),
+        ('statistical-summary', lambda: f'/api/analysis/statistical-summary/{crop()}'),
+        ('by-state', lambda: f'/api/analysis/by-state/{crop()}'),
+        ('comparison', lambda: f'/api/analysis/comparison/{crop()}/{crop()}'),
+        ('chatbot-query', lambda: f"/api/chatbot/query?q={quote(random.choice(crops) + ' em ' + random.choice(states))}"),
+        ('features-state', lambda: f'/api/features/{crop()}?state={random.choice(states)}'),
+        ('neighbours-k2', lambda: f'/api/municipality/{random.choice(municipalities)}/neighbours?k=2&crop={crop()}'),
+        ('hotspots-state', lambda: f'/api/hotspots/{crop()}?state={random.choice(states)}'),
+        ('municipality-search', lambda: f"/api/municipalities/search?q={quote(random.choice(SEARCH_QUERIES))}"),
+        ('municipality-profile', lambda: f'/api/municipality/{random.choice(municipalities)}'),
+        ('municipality-similar', lambda: f'/api/municipality/{random.choice(municipalities)}/similar?k=10'),
+        ('indicator-lq', lambda: f'/api/indicators/location_quotient?crop={crop()}&state={random.choice(states)}'),
+        ('query', lambda: f'/api/query?crop={quote(crop())}&state={random.choice(states)}&min_area=100&limit=50'),
+        # Tiles z=5 que cobrem o Brasil
+        ('tile', lambda: f'/tiles/{crop()}/5/{random.randint(9, 12)}/{random.randint(14, 18)}.png'),
+        ('export-crop-analysis', lambda: f'/api/export/crop-analysis/{crop()}?state={random.choice(states)}'),
+        ('metrics', lambda: '/metrics'),
+    ]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    # ru_maxrss: KB no Linux, bytes no macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_serial(client, url_factory, count):
+    timings = []
+    response_bytes = 0
+    for _ in range(count):
+        url = url_factory()
+        started = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - started) * 1000)
+        response_bytes += len(response.data)
+        if response.status_code >= 500:
+            raise RuntimeError(f"{url} -> {response.status_code}")
+    return timings, response_bytes / count
+
+
+def run_concurrent(app, url_factory, count, concurrency):
+    def worker(requests):
+        client = app.test_client()
+        for _ in range(requests):
+            client.get(url_factory())
+
+    per_worker = max(1, count // concurrency)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, [per_worker] * concurrency))
+    return per_worker * concurrency / (time.perf_counter() - started)
+
+
+def compare_with_baseline(results, baseline):
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        change = (result['p95_ms'] - previous['p95_ms']) / max(previous['p95_ms'], 1e-6)
+        result['p95_change'] = change
+        if change > REGRESSION_THRESHOLD:
+            regressions.append((name, change))
+    return regressions
+
+
+def main():
+    from benchmarks.synthetic import PRESETS, generate_dataset
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', help="Diretório com crop_data_static.json (gerado se omitido)")
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    parser.add_argument('--requests', type=int, default=30, help="Requisições por endpoint")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--only', nargs='*', help="Executar apenas estes endpoints")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    data_dir = args.data or tempfile.mkdtemp(prefix='geo-bench-')
+    os.environ['CROP_DATA_PATH'] = os.path.join(data_dir, 'crop_data_static.json')
+    os.environ['GEOJSON_PATH'] = os.path.join(data_dir, 'brazil_municipalities_all.geojson')
+    os.environ['FEATURE_INDEX_PATH'] = os.path.join(data_dir, 'municipality_features.idx.json')
+    os.environ['TILE_CACHE_DIR'] = os.path.join(data_dir, 'tiles')
+    os.environ['ADJACENCY_PATH'] = os.path.join(data_dir, 'municipality_adjacency.bin')
+    os.environ.setdefault('DATASET_RELOAD_INTERVAL', '0')
+    os.environ.setdefault('CACHE_WARMUP', 'off')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    if not args.data:
+        started = time.perf_counter()
+        generate_dataset(data_dir, workbooks=False, seed=args.seed, **PRESETS[args.preset])
+        print(f"Dataset sintético '{args.preset}' gerado em {time.perf_counter() - started:.1f}s: {data_dir}")
+
+    started = time.perf_counter()
+    from app import app
+    from dataset import dataset
+    snapshot = dataset.current()
+    print(f"Inicialização (imports + dataset): {time.perf_counter() - started:.2f}s, "
+          f"{len(snapshot.crops)} culturas, RSS {peak_rss_mb():.0f} MB")
+
+    crops = snapshot.crops
+    states = sorted({state for _, state in snapshot.municipalities.values()}) or ['MT']
+    municipalities = sorted(snapshot.municipalities) or ['5107925']
+    client = app.test_client()
+
+    results = {}
+    for name, url_factory in endpoint_cases(crops, states, municipalities):
+        if args.only and name not in args.only:
+            continue
+        client.get(url_factory())  # aquecimento
+        timings, average_bytes = run_serial(client, url_factory, args.requests)
+        throughput = run_concurrent(app, url_factory, args.requests, args.concurrency)
+        results[name] = {
+            'p50_ms': statistics.median(timings),
+            'p95_ms': percentile(timings, 95),
+            'p99_ms': percentile(timings, 99),
+            'throughput_rps': throughput,
+            'avg_bytes': average_bytes
+        }
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get('results', {})
+    regressions = compare_with_baseline(results, baseline)
+
+    print(f"\n{'endpoint':<26}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'KB':>9}{'Δp95':>8}")
+    for name, result in results.items():
+        change = f"{result['p95_change']:+.0%}" if 'p95_change' in result else '-'
+        print(f"{name:<26}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+              f"{result['throughput_rps']:>9.0f}{result['avg_bytes'] / 1024:>9.1f}{change:>8}")
+    print(f"\nPico de RSS: {peak_rss_mb():.0f} MB")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'preset': args.preset, 'requests': args.requests, 'results': results}, f, indent=2)
+        print(f"Baseline salvo em {args.baseline}")
+
+    if regressions:
+        for name, change in regressions:
+            print(f"REGRESSÃO: {name} p95 {change:+.0%}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Profile application startup: import time per module and dataset load.
+
+Uso:
+    python -m benchmarks.startup [--budget-ms 1500] [--top 15]
+
+Executa ``import app`` num processo novo com ``python -X importtime`` e carrega
+o dataset de forma síncrona, reportando onde o tempo de boot é gasto. Sai com
+código 1 se o tempo total exceder o orçamento.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BOOT_SCRIPT = '''
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+from dataset import dataset
+dataset.reload()
+loaded = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "dataset_ms": (loaded - imported) * 1000,
+    "crops": len(dataset.current().crops),
+    "pandas_loaded": __import__("sys").modules.get("pandas") is not None
+}))
+'''
+
+
+def parse_importtime(stderr):
+    """Parse ``-X importtime`` lines into (module, self_us, cumulative_us)"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        self_us, cumulative_us, module = int(fields[0]), int(fields[1]), fields[2]
+        modules.append((module.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=1500)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    env = dict(os.environ, DATASET_PRELOAD='lazy', CACHE_WARMUP='off', DATASET_RELOAD_INTERVAL='0', LOG_LEVEL='WARNING')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        return result.returncode
+
+    summary = json.loads(result.stdout.strip().splitlines()[-1])
+    modules = parse_importtime(result.stderr)
+
+    # Apenas pacotes de topo (sem ponto) para uma visão por dependência
+    top_level = sorted((m for m in modules if '.' not in m[0]), key=lambda m: m[2], reverse=True)
+    print(f"{'módulo':<32}{'cumulativo ms':>15}")
+    for module, _, cumulative_us in top_level[:args.top]:
+        print(f"{module:<32}{cumulative_us / 1000:>15.1f}")
+
+    total_ms = summary['import_ms'] + summary['dataset_ms']
+    print(f"\nImports da aplicação: {summary['import_ms']:.0f} ms")
+    print(f"Carga do dataset:     {summary['dataset_ms']:.0f} ms ({summary['crops']} culturas)")
+    print(f"Total:                {total_ms:.0f} ms (orçamento {args.budget_ms:.0f} ms)")
+    print(f"pandas importado no boot: {'sim' if summary['pandas_loaded'] else 'não'}")
+
+    return 0 if total_ms <= args.budget_ms else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
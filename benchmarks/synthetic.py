@@ -0,0 +1,180 @@
+"""Generate a synthetic, IBGE-shaped dataset at configurable scale.
+
+Uso:
+    python -m benchmarks.synthetic --output /tmp/geo-bench --municipalities 5570 --crops 300 --years 20
+
+Gera:
+    crop_data_static.json          snapshot servido por routes.py
+    ibge/IBGE - <ano> - BRASIL HECTARES COLHIDOS.xlsx   planilhas no formato da PAM
+    brazil_municipalities_all.geojson                   um polígono quadrado por município
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+
+PRESETS = {
+    'small': {'municipalities': 500, 'crops': 20, 'years': 1},
+    'state': {'municipalities': 1000, 'crops': 70, 'years': 3},
+    'national': {'municipalities': 5570, 'crops': 300, 'years': 20},
+}
+
+# Extensão aproximada do Brasil (lon/lat) para a grade de polígonos
+BBOX = (-73.99, -33.75, -28.84, 5.27)
+
+
+def generate_municipalities(count, seed=0):
+    """Synthetic municipalities spread over the states, with valid IBGE-style codes"""
+    # Import tardio: dataset lê CROP_DATA_PATH etc. ao ser importado, e quem importa
+    # este módulo (benchmarks.endpoints) define essas variáveis antes de gerar os dados
+    from dataset import STATE_IBGE_CODES
+
+    rng = random.Random(seed)
+    states = list(STATE_IBGE_CODES)
+    municipalities = []
+    per_state = {}
+    for index in range(count):
+        state = states[index % len(states)]
+        per_state[state] = per_state.get(state, 0) + 1
+        code = f"{STATE_IBGE_CODES[state]}{per_state[state]:04d}{rng.randint(0, 9)}"
+        municipalities.append({
+            'code': code,
+            'name': f"Cidade {index:04d}",
+            'state_code': state
+        })
+    return municipalities
+
+
+def generate_crop_names(count):
+    return [f"Cultura {index:03d}" for index in range(count)]
+
+
+def generate_areas(municipalities, crops, density, seed=0):
+    """{crop: {code: area}} with a heavy-tailed area distribution"""
+    rng = random.Random(seed)
+    areas = {}
+    for crop_name in crops:
+        crop_areas = {}
+        for municipality in municipalities:
+            if rng.random() < density:
+                crop_areas[municipality['code']] = float(round(rng.lognormvariate(6, 2)) + 1)
+        areas[crop_name] = crop_areas
+    return areas
+
+
+def write_snapshot(path, municipalities, areas):
+    by_code = {m['code']: m for m in municipalities}
+    crop_data = {
+        crop_name: {
+            code: {
+                'municipality_name': by_code[code]['name'],
+                'state_code': by_code[code]['state_code'],
+                'harvested_area': area
+            }
+            for code, area in crop_areas.items()
+        }
+        for crop_name, crop_areas in areas.items()
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(crop_data, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def write_workbook(path, municipalities, areas):
+    import pandas as pd
+
+    rows = []
+    for municipality in municipalities:
+        row = {
+            'CÓDIGO IBGE': int(municipality['code']),
+            'MUNICÍPIO - UF': f"{municipality['name']} ({municipality['state_code']})"
+        }
+        for crop_name, crop_areas in areas.items():
+            row[crop_name] = crop_areas.get(municipality['code'], '-')
+        rows.append(row)
+    pd.DataFrame(rows).to_excel(path, sheet_name='Tabela', index=False)
+
+
+def write_geojson(path, municipalities):
+    """Square polygons on a regular grid; neighbours share their edges"""
+    columns = math.ceil(math.sqrt(len(municipalities)))
+    rows = math.ceil(len(municipalities) / columns)
+    min_lon, min_lat, max_lon, max_lat = BBOX
+    width = (max_lon - min_lon) / columns
+    height = (max_lat - min_lat) / rows
+
+    features = []
+    for index, municipality in enumerate(municipalities):
+        x0 = min_lon + (index % columns) * width
+        y0 = min_lat + (index // columns) * height
+        ring = [[x0, y0], [x0 + width, y0], [x0 + width, y0 + height], [x0, y0 + height], [x0, y0]]
+        features.append({
+            'type': 'Feature',
+            'properties': {
+                'GEOCODIGO': municipality['code'],
+                'NOME': municipality['name'],
+                'UF': municipality['state_code']
+            },
+            'geometry': {'type': 'Polygon', 'coordinates': [[[round(v, 6) for v in p] for p in ring]]}
+        })
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def generate_dataset(output, municipalities=500, crops=20, years=1, density=0.3,
+                     workbooks=True, geojson=True, seed=0):
+    """Generate every synthetic artifact into ``output`` and return their paths"""
+    os.makedirs(output, exist_ok=True)
+    municipality_list = generate_municipalities(municipalities, seed)
+    crop_names = generate_crop_names(crops)
+
+    paths = {'snapshot': os.path.join(output, 'crop_data_static.json')}
+    latest_areas = None
+    if workbooks:
+        os.makedirs(os.path.join(output, 'ibge'), exist_ok=True)
+    for offset in range(years):
+        year = 2023 - years + 1 + offset
+        year_areas = generate_areas(municipality_list, crop_names, density, seed + offset)
+        if workbooks:
+            write_workbook(os.path.join(output, 'ibge', f'IBGE - {year} - BRASIL HECTARES COLHIDOS.xlsx'),
+                           municipality_list, year_areas)
+        latest_areas = year_areas
+
+    write_snapshot(paths['snapshot'], municipality_list, latest_areas)
+    if workbooks:
+        paths['workbooks'] = os.path.join(output, 'ibge')
+    if geojson:
+        paths['geojson'] = os.path.join(output, 'brazil_municipalities_all.geojson')
+        write_geojson(paths['geojson'], municipality_list)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    parser.add_argument('--municipalities', type=int)
+    parser.add_argument('--crops', type=int)
+    parser.add_argument('--years', type=int)
+    parser.add_argument('--density', type=float, default=0.3, help="Fração de municípios com cada cultura")
+    parser.add_argument('--no-workbooks', action='store_true')
+    parser.add_argument('--no-geojson', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    scale = dict(PRESETS[args.preset])
+    for key in ('municipalities', 'crops', 'years'):
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+
+    paths = generate_dataset(args.output, density=args.density, workbooks=not args.no_workbooks,
+                             geojson=not args.no_geojson, seed=args.seed, **scale)
+    for name, path in paths.items():
+        print(f"{name}: {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Measure per-worker memory under gunicorn for each dataset storage mode.
+
+Uso:
+    python -m benchmarks.workers [--workers 4] [--storage dict shared] [--data /tmp/geo-bench]
+
+Sobe ``gunicorn -c gunicorn.conf.py main:app`` para cada modo de armazenamento,
+aquece os workers com algumas requisições e lê /proc/<pid>/smaps_rollup
+(somente Linux). A memória privada (USS) é o custo real de cada worker extra;
+a PSS divide as páginas compartilhadas com o master.
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def memory_kb(pid):
+    """(rss, pss, private) in KB from smaps_rollup"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 3 and fields[2] == 'kB':
+                values[fields[0].rstrip(':')] = int(fields[1])
+    private = values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+    return values.get('Rss', 0), values.get('Pss', 0), private
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children', 'r') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def wait_until_ready(base_url, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'{base_url}/api/crops', timeout=5).read()
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError("gunicorn não respondeu a tempo")
+
+
+def measure(storage, worker_count, crop_data_path, requests):
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, DATASET_STORAGE=storage, CROP_DATA_PATH=crop_data_path, BIND=f'127.0.0.1:{port}',
+               WEB_CONCURRENCY=str(worker_count), DATASET_RELOAD_INTERVAL='0', LOG_LEVEL='WARNING')
+    master = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'main:app'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(base_url)
+        crops = __import__('json').loads(urllib.request.urlopen(f'{base_url}/api/crops').read())['crops']
+        # Requisições espalhadas pelos workers para materializar camadas
+        for index in range(requests):
+            crop_name = quote(crops[index % len(crops)])
+            urllib.request.urlopen(f'{base_url}/api/crop-data/{crop_name}').read()
+            urllib.request.urlopen(f'{base_url}/api/crop-data/{crop_name}?format=binary').read()
+
+        master_memory = memory_kb(master.pid)
+        worker_memory = [memory_kb(pid) for pid in children(master.pid)]
+        return master_memory, worker_memory
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--storage', nargs='*', default=['dict', 'shared'])
+    parser.add_argument('--data', help="Diretório com crop_data_static.json (gerado se omitido)")
+    parser.add_argument('--preset', default='state')
+    parser.add_argument('--requests', type=int, default=40)
+    args = parser.parse_args()
+
+    if not sys.platform.startswith('linux'):
+        print("Requer /proc/<pid>/smaps_rollup (Linux)")
+        return 1
+
+    data_dir = args.data
+    if not data_dir:
+        from benchmarks.synthetic import PRESETS, generate_dataset
+        data_dir = tempfile.mkdtemp(prefix='geo-workers-')
+        generate_dataset(data_dir, workbooks=False, geojson=False, **PRESETS[args.preset])
+    crop_data_path = os.path.join(data_dir, 'crop_data_static.json')
+
+    print(f"{'modo':<8}{'processo':<10}{'RSS MB':>10}{'PSS MB':>10}{'USS MB':>10}")
+    for storage in args.storage:
+        master_memory, worker_memory = measure(storage, args.workers, crop_data_path, args.requests)
+        rows = [('master', master_memory)] + [(f'worker{i}', m) for i, m in enumerate(worker_memory)]
+        for name, (rss, pss, private) in rows:
+            print(f"{storage:<8}{name:<10}{rss / 1024:>10.1f}{pss / 1024:>10.1f}{private / 1024:>10.1f}")
+        total_pss = (master_memory[1] + sum(m[1] for m in worker_memory)) / 1024
+        average_private = sum(m[2] for m in worker_memory) / max(1, len(worker_memory)) / 1024
+        print(f"{storage:<8}{'total':<10}{'':>10}{total_pss:>10.1f}{average_private:>10.1f} (USS médio/worker)\n")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
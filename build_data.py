@@ -0,0 +1,433 @@
+"""Data build pipeline: IBGE spreadsheets and state GeoJSONs -> artifacts served by the app.
+
+Estágios [dependências]:
+    ingest       planilhas do IBGE -> crop_data_static.json, ibge_consolidated.json
+    validate     [ingest] códigos, UFs, áreas e número de municípios; erro interrompe o build
+    snapshot     [ingest, validate] -> crop_data.snapshot
+    geometry     GeoJSON de cada UF -> brazil_municipalities_all.geojson
+    simplify     [geometry] -> topologia com arcos simplificados (.topo.json)
+    precompress  [geometry, simplify] -> .gz dos arquivos do mapa servidos em /static/data
+    stats        [geometry] -> índice de geometrias e grafo de vizinhança
+
+Cada estágio grava em .build/<estágio>/<chave>/, onde a chave é o sha256 do
+nome e versão do estágio, dos parâmetros, do conteúdo das entradas e das chaves
+das dependências: estágios sem mudança são reaproveitados e os independentes
+rodam em paralelo (um processo por estágio). Só depois que todos terminam os
+artefatos são publicados, cada um com cópia temporária + os.replace, e por
+último o data/build_manifest.json.
+
+Uso:
+    python build_data.py [--only snapshot,stats] [--force] [--jobs 4] [--dry-run]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from adjacency import ADJACENCY_PATH, Adjacency
+from combine_geojson import STATE_GEOJSON_DIR, combine_geojson_files, state_geojson_paths
+from dataset import STATE_IBGE_CODES, is_valid_municipality
+from feature_index import FEATURE_INDEX_PATH, GEOJSON_PATH, FeatureIndex
+from snapshot_format import write_binary_snapshot
+from topology import DEFAULT_QUANTIZATION, build_topology_file, topology_path
+
+logger = logging.getLogger(__name__)
+
+BUILD_DIR = os.environ.get('BUILD_DIR', '.build')
+DATA_DIR = 'data'
+MANIFEST_PATH = os.path.join(DATA_DIR, 'build_manifest.json')
+# Tolerância da simplificação, em passos da grade da topologia (~45 m com a quantização padrão)
+SIMPLIFY_TOLERANCE = 1.0
+# Menos municípios que isso indica uma base parcial (ex.: a amostra de expand_crop_data.py)
+MIN_MUNICIPALITIES = 5000
+HASH_CHUNK = 1024 * 1024
+
+
+class BuildError(Exception):
+    """A stage failed; nothing is published"""
+
+
+def _load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_json(path, value):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(value, f, ensure_ascii=False, indent=2)
+
+
+# Estágios: run(inputs, output_dir, params), com inputs = {'sources': [...], '<estágio>': {arquivo: caminho}}
+
+def run_ingest(inputs, output_dir, params):
+    from process_full_ibge_data import process_ibge_directory
+
+    result = process_ibge_directory(params['ibge_dir'], output_dir, params['workers'], write_snapshot=False)
+    if not result['success'] or not result['crops']:
+        raise BuildError(f"Falha na leitura das planilhas: {result.get('error') or result['errors']}")
+
+
+def run_validate(inputs, output_dir, params):
+    crop_data = _load_json(inputs['ingest']['crop_data_static.json'])
+    prefixes = {str(prefix) for prefix in STATE_IBGE_CODES.values()}
+    errors, warnings = [], []
+    valid_municipalities = set()
+    for crop_name, municipalities in crop_data.items():
+        for code, data in municipalities.items():
+            area = data.get('harvested_area')
+            if not isinstance(area, (int, float)) or not math.isfinite(area) or area < 0:
+                errors.append(f"{crop_name}/{code}: área inválida ({area!r})")
+            if not is_valid_municipality(code, data):
+                continue
+            valid_municipalities.add(code)
+            state = data.get('state_code')
+            if code[:2] not in prefixes or STATE_IBGE_CODES.get(state) != int(code[:2]):
+                warnings.append(f"{crop_name}/{code}: UF {state} não corresponde ao código")
+    if not crop_data:
+        errors.append("Nenhuma cultura encontrada")
+    if len(valid_municipalities) < params['min_municipalities']:
+        errors.append(f"Apenas {len(valid_municipalities)} municípios válidos "
+                      f"(mínimo {params['min_municipalities']}): base parcial?")
+
+    report = {
+        'crops': len(crop_data),
+        'municipalities': len(valid_municipalities),
+        'records': sum(len(municipalities) for municipalities in crop_data.values()),
+        'errors': errors[:100],
+        'warnings': warnings[:100],
+        'warning_count': len(warnings)
+    }
+    _write_json(os.path.join(output_dir, 'validation.json'), report)
+    if errors:
+        raise BuildError(f"Validação falhou com {len(errors)} erros, ex.: {errors[0]}")
+
+
+def run_snapshot(inputs, output_dir, params):
+    crop_data = _load_json(inputs['ingest']['crop_data_static.json'])
+    write_binary_snapshot(crop_data, os.path.join(output_dir, 'crop_data.snapshot'))
+
+
+def run_geometry(inputs, output_dir, params):
+    output_path = os.path.join(output_dir, os.path.basename(params['geojson_path']))
+    combine_geojson_files(params['state_dir'], output_path, derived=False)
+
+
+def run_simplify(inputs, output_dir, params):
+    geojson = next(iter(inputs['geometry'].values()))
+    build_topology_file(geojson, os.path.join(output_dir, os.path.basename(topology_path(geojson))),
+                        params['quantization'], params['tolerance'])
+
+
+def run_precompress(inputs, output_dir, params):
+    for stage in ('geometry', 'simplify'):
+        for name, path in inputs[stage].items():
+            # mtime=0: mesmo conteúdo gera sempre o mesmo .gz
+            with open(path, 'rb') as source, open(os.path.join(output_dir, f'{name}.gz'), 'wb') as raw, \
+                    gzip.GzipFile(filename='', mode='wb', fileobj=raw, compresslevel=9, mtime=0) as target:
+                shutil.copyfileobj(source, target, HASH_CHUNK)
+
+
+def run_stats(inputs, output_dir, params):
+    geojson = next(iter(inputs['geometry'].values()))
+    built = FeatureIndex.build(geojson)
+    # A versão é o (mtime, tamanho) do arquivo, preservados na publicação (copy2)
+    index = FeatureIndex(params['geojson_path'], built.version, built.entries)
+    index.save(os.path.join(output_dir, os.path.basename(params['feature_index_path'])))
+    Adjacency.build(built).save(os.path.join(output_dir, os.path.basename(params['adjacency_path'])))
+
+
+class Stage:
+    """One build step: what it reads, what it writes and where each output is published"""
+
+    def __init__(self, name, run, version, deps=(), sources=None, params=(), outputs=None):
+        self.name = name
+        self.run = run
+        # Incrementar ao mudar o código do estágio invalida o cache
+        self.version = version
+        self.deps = deps
+        self.sources = sources or (lambda options: [])
+        self.params = params
+        self.outputs = outputs or (lambda options: {})
+
+
+def _workbooks(options):
+    from process_full_ibge_data import ibge_workbooks
+    return ibge_workbooks(options['ibge_dir'])
+
+
+def _geometry_outputs(options):
+    geojson = options['geojson_path']
+    return {os.path.basename(geojson): geojson}
+
+
+def _simplify_outputs(options):
+    topology = topology_path(options['geojson_path'])
+    return {os.path.basename(topology): topology}
+
+
+def _precompress_outputs(options):
+    paths = list(_geometry_outputs(options).values()) + list(_simplify_outputs(options).values())
+    return {f'{os.path.basename(path)}.gz': f'{path}.gz' for path in paths}
+
+
+STAGES = [
+    Stage('ingest', run_ingest, 1, sources=_workbooks,
+          outputs=lambda options: {
+              'crop_data_static.json': os.path.join(options['data_dir'], 'crop_data_static.json'),
+              'ibge_consolidated.json': os.path.join(options['data_dir'], 'ibge_consolidated.json')
+          }),
+    Stage('validate', run_validate, 1, deps=('ingest',), params=('min_municipalities',)),
+    Stage('snapshot', run_snapshot, 1, deps=('ingest', 'validate'),
+          outputs=lambda options: {'crop_data.snapshot': os.path.join(options['data_dir'], 'crop_data.snapshot')}),
+    Stage('geometry', run_geometry, 1, sources=lambda options: state_geojson_paths(options['state_dir']),
+          params=('geojson_path',), outputs=_geometry_outputs),
+    Stage('simplify', run_simplify, 1, deps=('geometry',), params=('quantization', 'tolerance'),
+          outputs=_simplify_outputs),
+    Stage('precompress', run_precompress, 1, deps=('geometry', 'simplify'), outputs=_precompress_outputs),
+    Stage('stats', run_stats, 2, deps=('geometry',),
+          params=('geojson_path', 'feature_index_path', 'adjacency_path'),
+          outputs=lambda options: {
+              os.path.basename(options['feature_index_path']): options['feature_index_path'],
+              os.path.basename(options['adjacency_path']): options['adjacency_path']
+          }),
+]
+STAGES_BY_NAME = {stage.name: stage for stage in STAGES}
+
+
+class HashCache:
+    """sha256 of files, remembered by (mtime, size) between builds"""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            self._hashes = _load_json(path)
+        except (FileNotFoundError, ValueError):
+            self._hashes = {}
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        fingerprint = [stat.st_mtime_ns, stat.st_size]
+        cached = self._hashes.get(path)
+        if cached and cached[:2] == fingerprint:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+                digest.update(chunk)
+        self._hashes[path] = fingerprint + [digest.hexdigest()]
+        return digest.hexdigest()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        _write_json(tmp_path, self._hashes)
+        os.replace(tmp_path, self.path)
+
+
+def stage_keys(options, hashes):
+    """Cache key of every stage, from its own inputs and its dependencies' keys"""
+    keys = {}
+    for stage in STAGES:
+        sources = stage.sources(options)
+        description = {
+            'stage': stage.name,
+            'version': stage.version,
+            'params': {name: options[name] for name in stage.params},
+            'sources': [[path, hashes.file_hash(path) if os.path.exists(path) else None] for path in sources],
+            'deps': {dep: keys[dep] for dep in stage.deps}
+        }
+        keys[stage.name] = hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()[:20]
+    return keys
+
+
+def _stage_dir(name, key):
+    return os.path.join(BUILD_DIR, name, key)
+
+
+def _stage_outputs(name, key):
+    manifest = _load_json(os.path.join(_stage_dir(name, key), 'stage.json'))
+    return {file_name: os.path.join(_stage_dir(name, key), file_name) for file_name in manifest['files']}
+
+
+def _execute_stage(name, key, inputs, options):
+    """Run one stage into a temporary dir and move it into the cache (runs in a worker process)"""
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    stage = STAGES_BY_NAME[name]
+    final_dir = _stage_dir(name, key)
+    work_dir = f'{final_dir}.tmp-{os.getpid()}'
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    started = time.perf_counter()
+    try:
+        stage.run(inputs, work_dir, options)
+        files = sorted(file_name for file_name in os.listdir(work_dir) if file_name != 'stage.json')
+        elapsed = time.perf_counter() - started
+        _write_json(os.path.join(work_dir, 'stage.json'), {'stage': name, 'key': key, 'files': files,
+                                                            'elapsed': round(elapsed, 3)})
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(work_dir, final_dir)
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    return elapsed
+
+
+def _required_stages(only):
+    """Selected stages plus everything they depend on, in declaration order"""
+    if not only:
+        return [stage.name for stage in STAGES]
+    required = set()
+    pending = list(only)
+    while pending:
+        name = pending.pop()
+        if name not in required:
+            required.add(name)
+            pending.extend(STAGES_BY_NAME[name].deps)
+    return [stage.name for stage in STAGES if stage.name in required]
+
+
+def run_stages(names, keys, options, jobs, force=False):
+    """Run the stages whose cache entry is missing, in parallel as dependencies allow"""
+    status = {}
+    for name in names:
+        cached = os.path.exists(os.path.join(_stage_dir(name, keys[name]), 'stage.json'))
+        status[name] = 'cached' if cached and not force else 'pending'
+    for name in names:
+        if status[name] == 'cached':
+            logger.info(f"[{name}] sem mudanças ({keys[name]})")
+
+    running = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        while True:
+            for name in names:
+                stage = STAGES_BY_NAME[name]
+                if status[name] != 'pending' or any(status[dep] not in ('cached', 'done') for dep in stage.deps):
+                    continue
+                inputs = {'sources': stage.sources(options)}
+                inputs.update({dep: _stage_outputs(dep, keys[dep]) for dep in stage.deps})
+                logger.info(f"[{name}] executando ({keys[name]})")
+                running[executor.submit(_execute_stage, name, keys[name], inputs, options)] = name
+                status[name] = 'running'
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    elapsed = future.result()
+                except Exception as e:
+                    for other in running:
+                        other.cancel()
+                    raise BuildError(f"Estágio {name} falhou: {e}") from e
+                status[name] = 'done'
+                logger.info(f"[{name}] concluído em {elapsed:.1f}s")
+    return status
+
+
+def publish(names, keys, options, hashes):
+    """Copy the stage outputs to their destinations (temporary copy + os.replace, one file at a time)"""
+    try:
+        previous = _load_json(options['manifest_path']).get('artifacts', {})
+    except (FileNotFoundError, ValueError):
+        previous = {}
+
+    artifacts = dict(previous)
+    published = 0
+    for name in names:
+        stage = STAGES_BY_NAME[name]
+        outputs = _stage_outputs(name, keys[name])
+        for file_name, destination in stage.outputs(options).items():
+            source = outputs[file_name]
+            digest = hashes.file_hash(source)
+            if os.path.exists(destination) and previous.get(destination, {}).get('sha256') == digest \
+                    and hashes.file_hash(destination) == digest:
+                continue
+            os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+            tmp_path = f'{destination}.tmp'
+            # copy2 preserva o mtime: o índice de geometrias continua válido para o GeoJSON publicado
+            shutil.copy2(source, tmp_path)
+            os.replace(tmp_path, destination)
+            artifacts[destination] = {'stage': name, 'key': keys[name], 'sha256': digest,
+                                      'bytes': os.path.getsize(destination)}
+            published += 1
+            logger.info(f"Publicado {destination}")
+
+    manifest = {
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'stages': {name: keys[name] for name in names},
+        'artifacts': artifacts
+    }
+    tmp_path = f"{options['manifest_path']}.tmp"
+    os.makedirs(os.path.dirname(tmp_path) or '.', exist_ok=True)
+    _write_json(tmp_path, manifest)
+    os.replace(tmp_path, options['manifest_path'])
+    return published
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerar os artefatos de dados servidos pela aplicação")
+    parser.add_argument('--only', help="Estágios separados por vírgula (as dependências entram junto)")
+    parser.add_argument('--force', action='store_true', help="Reexecutar mesmo com cache válido")
+    parser.add_argument('--dry-run', action='store_true', help="Apenas mostrar as chaves e o que seria executado")
+    parser.add_argument('--jobs', type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument('--ibge-dir', default=DATA_DIR, help="Diretório com as planilhas do IBGE")
+    parser.add_argument('--state-dir', default=STATE_GEOJSON_DIR, help="Diretório com os GeoJSON por UF")
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--geojson-path', default=GEOJSON_PATH)
+    parser.add_argument('--tolerance', type=float, default=SIMPLIFY_TOLERANCE)
+    parser.add_argument('--min-municipalities', type=int, default=MIN_MUNICIPALITIES)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    options = {
+        'ibge_dir': args.ibge_dir,
+        'state_dir': args.state_dir,
+        'data_dir': args.data_dir,
+        'geojson_path': args.geojson_path,
+        'feature_index_path': FEATURE_INDEX_PATH,
+        'adjacency_path': ADJACENCY_PATH,
+        'manifest_path': os.path.join(args.data_dir, os.path.basename(MANIFEST_PATH)),
+        'quantization': DEFAULT_QUANTIZATION,
+        'tolerance': args.tolerance,
+        'min_municipalities': args.min_municipalities,
+        'workers': args.jobs
+    }
+    only = [name.strip() for name in args.only.split(',')] if args.only else []
+    unknown = [name for name in only if name not in STAGES_BY_NAME]
+    if unknown:
+        parser.error(f"Estágio desconhecido: {', '.join(unknown)} (use {', '.join(STAGES_BY_NAME)})")
+
+    started = time.perf_counter()
+    hashes = HashCache(os.path.join(BUILD_DIR, 'hashes.json'))
+    keys = stage_keys(options, hashes)
+    names = _required_stages(only)
+    if args.dry_run:
+        for name in names:
+            cached = os.path.exists(os.path.join(_stage_dir(name, keys[name]), 'stage.json'))
+            print(f"{name:12} {keys[name]}  {'cache' if cached and not args.force else 'executar'}")
+        return 0
+
+    try:
+        status = run_stages(names, keys, options, args.jobs, args.force)
+        published = publish(names, keys, options, hashes)
+    except BuildError as e:
+        logger.error(f"Build interrompido, nada publicado: {e}")
+        return 1
+    finally:
+        hashes.save()
+
+    executed = sum(1 for value in status.values() if value == 'done')
+    print(f"{len(names)} estágios ({executed} executados, {len(names) - executed} do cache), "
+          f"{published} artefatos publicados em {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
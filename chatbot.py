@@ -0,0 +1,178 @@
+import re
+import unicodedata
+
+from dataset import STATE_NAMES
+
+# Termos populares -> nome da cultura no IBGE (mesmo mapeamento que o chatbot usava no navegador)
+CROP_ALIASES = {
+    'soja': 'Soja (em grão)', 'grao de soja': 'Soja (em grão)',
+    'milho': 'Milho (em grão)',
+    'banana': 'Banana (cacho)', 'bananeira': 'Banana (cacho)',
+    'cafe': 'Café (em grão) Total', 'cafeeiro': 'Café (em grão) Total', 'cafeicultura': 'Café (em grão) Total',
+    'cana': 'Cana-de-açúcar', 'cana de acucar': 'Cana-de-açúcar', 'canavieiro': 'Cana-de-açúcar',
+    'arroz': 'Arroz (em casca)', 'arrozal': 'Arroz (em casca)', 'rizicultura': 'Arroz (em casca)',
+    'feijao': 'Feijão (em grão)', 'feijoes': 'Feijão (em grão)',
+    'algodao': 'Algodão herbáceo (em caroço)', 'algodoeiro': 'Algodão herbáceo (em caroço)',
+    'cotonicultura': 'Algodão herbáceo (em caroço)',
+    'laranja': 'Laranja', 'laranjeira': 'Laranja', 'citrus': 'Laranja',
+    'uva': 'Uva', 'viticultura': 'Uva', 'parreira': 'Uva',
+    'maca': 'Maçã', 'macieira': 'Maçã',
+    'tomate': 'Tomate', 'tomateiro': 'Tomate',
+    'batata': 'Batata-inglesa', 'bataticultura': 'Batata-inglesa',
+    'mandioca': 'Mandioca', 'aipim': 'Mandioca', 'macaxeira': 'Mandioca'
+}
+
+# Apelidos de estados além dos nomes oficiais
+STATE_ALIASES = {
+    'brasilia': 'DF', 'distrito federal': 'DF',
+    'goiania': 'GO',
+    'minas': 'MG',
+    'sampa': 'SP', 'paulista': 'SP',
+    'amazonia': 'AM'
+}
+
+# Siglas que também são palavras comuns: só valem em maiúsculas ("soja em SE")
+AMBIGUOUS_STATE_TOKENS = {'se', 'to', 'pa', 'es', 'am', 'ma', 'al', 'ac', 'pi', 'pe', 'ro'}
+# "para" só é o estado depois de uma preposição ("no Pará", "do Pará")
+STATE_PREPOSITIONS = {'no', 'do', 'em', 'estado do'}
+
+NATIONAL_TERMS = ('brasil', 'nacional', 'todo o pais')
+
+ACTION_TERMS = (
+    ('compare', ('compare', 'comparar', 'versus', 'vs')),
+    ('analyze', ('analise', 'analisa', 'analizar', 'estudo')),
+    ('show', ('mostre', 'mostra', 'exibe', 'apresente')),
+)
+
+
+def fold(text):
+    """Lowercase, strip accents and punctuation, collapse whitespace"""
+    text = unicodedata.normalize('NFD', str(text).lower())
+    text = ''.join(char for char in text if unicodedata.category(char) != 'Mn')
+    return re.sub(r'[^a-z0-9]+', ' ', text).strip()
+
+
+def crop_head(crop_name):
+    """Folded crop name without the IBGE qualifiers: 'Soja (em grão)' -> 'soja'"""
+    return fold(re.split(r'[(*]', crop_name, maxsplit=1)[0])
+
+
+class QueryIndex:
+    """Accent-folded phrase indexes for the crops of one dataset version"""
+
+    def __init__(self, crops):
+        self.crop_phrases = {}
+        for crop_name in sorted(crops):
+            head = crop_head(crop_name)
+            for phrase in (fold(crop_name), head, head + 's'):
+                # Nomes ambíguos ("cafe") ficam com a primeira cultura em ordem alfabética
+                self.crop_phrases.setdefault(phrase, crop_name)
+        available = set(crops)
+        for alias, crop_name in CROP_ALIASES.items():
+            if crop_name in available:
+                self.crop_phrases[alias] = crop_name
+                self.crop_phrases.setdefault(alias + 's', crop_name)
+
+        # Prefixo de 3 letras -> cabeças de cultura, para termos incompletos ("milh", "soj")
+        self.heads_by_prefix = {}
+        for phrase, crop_name in self.crop_phrases.items():
+            if ' ' not in phrase and len(phrase) >= 3:
+                self.heads_by_prefix.setdefault(phrase[:3], []).append((phrase, crop_name))
+
+        self.state_phrases = {fold(name): code for code, name in STATE_NAMES.items()}
+        self.state_phrases.update(STATE_ALIASES)
+        del self.state_phrases['para']
+
+        # Frases mais longas primeiro: "mato grosso do sul" antes de "mato grosso"
+        self._crop_order = sorted(self.crop_phrases, key=len, reverse=True)
+        self._state_order = sorted(self.state_phrases, key=len, reverse=True)
+
+    @staticmethod
+    def _longest_phrase(padded, ordered_phrases):
+        for phrase in ordered_phrases:
+            if f' {phrase} ' in padded:
+                return phrase
+        return None
+
+    def find_crop(self, folded):
+        """(crop, matched term) for the longest crop phrase in the message, then by prefix"""
+        padded = f' {folded} '
+        phrase = self._longest_phrase(padded, self._crop_order)
+        if phrase:
+            return self.crop_phrases[phrase], phrase
+
+        best, best_score = None, 0.7
+        for word in folded.split():
+            if len(word) < 3:
+                continue
+            for head, crop_name in self.heads_by_prefix.get(word[:3], ()):
+                if head.startswith(word) or word.startswith(head):
+                    score = min(len(word), len(head)) / max(len(word), len(head))
+                    if score > best_score:
+                        best, best_score = (crop_name, word), score
+        return best or (None, None)
+
+    def find_states(self, message, folded):
+        """UF codes mentioned in the message (full name, alias or sigla), in order of mention"""
+        words = folded.split()
+        used = [False] * len(words)
+        found = []
+
+        def claim(position, length, code):
+            if not any(used[position:position + length]):
+                used[position:position + length] = [True] * length
+                found.append((position, code))
+
+        # Frases mais longas primeiro: as palavras de "mato grosso do sul" não contam de novo como "mato grosso"
+        for phrase in self._state_order:
+            phrase_words = phrase.split()
+            length = len(phrase_words)
+            for position in range(len(words) - length + 1):
+                if words[position:position + length] == phrase_words:
+                    claim(position, length, self.state_phrases[phrase])
+
+        original_tokens = set(re.findall(r'\b[A-Z]{2}\b', message))
+        for position, word in enumerate(words):
+            if used[position]:
+                continue
+            if word == 'para':
+                if position > 0 and (words[position - 1] in STATE_PREPOSITIONS or
+                                     ' '.join(words[max(0, position - 2):position]) in STATE_PREPOSITIONS):
+                    claim(position, 1, 'PA')
+                continue
+            code = word.upper()
+            if len(word) == 2 and code in STATE_NAMES:
+                if word not in AMBIGUOUS_STATE_TOKENS or code in original_tokens:
+                    claim(position, 1, code)
+
+        states = []
+        for _, code in sorted(found):
+            if code not in states:
+                states.append(code)
+        return states
+
+
+def parse_query(message, index):
+    """Crop, state and action mentioned in a free-text chatbot question"""
+    folded = fold(message)
+    crop_name, crop_term = index.find_crop(folded)
+
+    padded = f' {folded} '
+    national = any(f' {term} ' in padded for term in NATIONAL_TERMS)
+    # Várias UFs ("soja em são paulo e mt") filtram pela união; 'state' junta as siglas como o ?state= das rotas
+    states = [] if national else sorted(index.find_states(message, folded))
+
+    action = 'analyze'
+    for name, terms in ACTION_TERMS:
+        if any(f' {term} ' in padded for term in terms):
+            action = name
+            break
+
+    return {
+        'crop': crop_name,
+        'crop_term': crop_term,
+        'state': ','.join(states) or None,
+        'states': states,
+        'national': national or not states,
+        'action': action
+    }
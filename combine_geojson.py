@@ -1,19 +1,30 @@
 import json
 import os
 
-def combine_geojson_files():
+from adjacency import Adjacency
+from feature_index import FeatureIndex
+from topology import build_topology_file
+
+STATE_GEOJSON_DIR = 'static/data'
+OUTPUT_PATH = 'static/data/brazil_municipalities_all.geojson'
+
+# All Brazilian states
+STATES = [
+    'AC', 'AL', 'AP', 'AM', 'BA', 'CE', 'DF', 'ES', 'GO',
+    'MA', 'MT', 'MS', 'MG', 'PA', 'PB', 'PR', 'PE', 'PI',
+    'RJ', 'RN', 'RS', 'RO', 'RR', 'SC', 'SP', 'SE', 'TO'
+]
+
+def state_geojson_paths(input_dir=STATE_GEOJSON_DIR):
+    """static/data/<UF>.geojson of every state, in the order they are combined"""
+    return [os.path.join(input_dir, f'{state}.geojson') for state in STATES]
+
+def combine_geojson_files(input_dir=STATE_GEOJSON_DIR, output_path=OUTPUT_PATH, derived=True):
     """Combine multiple state GeoJSON files into one"""
     combined_features = []
     
-    # All Brazilian states
-    states = [
-        'AC', 'AL', 'AP', 'AM', 'BA', 'CE', 'DF', 'ES', 'GO', 
-        'MA', 'MT', 'MS', 'MG', 'PA', 'PB', 'PR', 'PE', 'PI', 
-        'RJ', 'RN', 'RS', 'RO', 'RR', 'SC', 'SP', 'SE', 'TO'
-    ]
-    
-    for state in states:
-        file_path = f'static/data/{state}.geojson'
+    for file_path in state_geojson_paths(input_dir):
+        state = os.path.splitext(os.path.basename(file_path))[0]
         if os.path.exists(file_path):
             try:
                 with open(file_path, 'r', encoding='utf-8') as f:
@@ -33,11 +44,22 @@ def combine_geojson_files():
     }
     
     # Save combined file
-    output_path = 'static/data/brazil_municipalities_all.geojson'
     with open(output_path, 'w', encoding='utf-8') as f:
         json.dump(combined_geojson, f, ensure_ascii=False, separators=(',', ':'))
     
     print(f"Combined {len(combined_features)} municipalities from all Brazil saved to {output_path}")
+    if not derived:
+        # build_data.py gera topologia, índice e grafo em estágios próprios
+        return output_path
+
+    # Arcos compartilhados + coordenadas quantizadas, servidos junto com o GeoJSON
+    topology_path = build_topology_file(output_path)
+    print(f"Topology saved to {topology_path} ({os.path.getsize(topology_path) / 1024:.0f} KB)")
+
+    # Índice de geometrias e grafo de vizinhança (CSR binário) da nova malha
+    adjacency = Adjacency.load_or_build(FeatureIndex.load_or_build(output_path))
+    print(f"Adjacency graph: {len(adjacency.codes)} municipalities, {len(adjacency.indices) // 2} borders")
+    return output_path
 
 if __name__ == "__main__":
     combine_geojson_files()
\ No newline at end of file
@@ -0,0 +1,87 @@
+import logging
+import time
+
+import numpy as np
+
+from indicators import component_crops
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_METRICS = ('cosine', 'euclidean')
+SIMILAR_DEFAULT_K = 10
+SIMILAR_MAX_K = 50
+
+
+class CropMixIndex:
+    """k-nearest municipalities by crop mix (share of each crop in the municipality's harvested area)
+
+    As participações usam as mesmas áreas totais dos indicadores de diversidade
+    (componentes de subtotais do IBGE ficam fora). Cada consulta é um único
+    produto matriz x vetor sobre os candidatos (~5 mil x ~65 em float32), abaixo
+    de 1 ms, por isso não há árvore espacial: com ~65 dimensões ela descartaria
+    pouco e custaria mais que o produto.
+    """
+
+    def __init__(self, table):
+        started = time.perf_counter()
+        self.table = table
+        count, crop_count = len(table.codes), len(table.crops)
+
+        matrix = np.zeros((count, crop_count), dtype=np.float64)
+        matrix[table.rows, table.crop_ids] = table.areas
+        components = component_crops(table.crops)
+        matrix[:, [position for position, crop_name in enumerate(table.crops) if crop_name in components]] = 0
+        totals = matrix.sum(axis=1)
+
+        self.producing = totals > 0
+        self.shares = (matrix / np.where(self.producing, totals, 1)[:, None]).astype(np.float32)
+        self.squared_norms = np.einsum('ij,ij->i', self.shares, self.shares)
+        norms = np.sqrt(self.squared_norms)
+        self.unit = self.shares / np.where(norms > 0, norms, 1)[:, None]
+        self.totals = totals
+
+        producing_states = table.states[self.producing]
+        producing_rows = np.flatnonzero(self.producing)
+        self.state_rows = {state: producing_rows[producing_states == state] for state in np.unique(producing_states)}
+        self.all_rows = producing_rows
+
+        logger.info(f"Índice de similaridade {table.version} montado em "
+                    f"{(time.perf_counter() - started) * 1000:.0f} ms ({count} municípios x {crop_count} culturas)")
+
+    def candidates(self, states=None):
+        """Rows of producing municipalities, optionally restricted to the given UFs"""
+        if not states:
+            return self.all_rows
+        return np.concatenate([self.state_rows.get(state, np.empty(0, dtype=np.int64)) for state in states])
+
+    def similar(self, position, k=SIMILAR_DEFAULT_K, metric='cosine', states=None):
+        """[(row, score)] of the k most similar producing municipalities, best first
+
+        cosine: similaridade em [0, 1] (maior é melhor); euclidean: distância entre os
+        vetores de participação, em [0, sqrt(2)] (menor é melhor).
+        """
+        rows = self.candidates(states)
+        rows = rows[rows != position]
+        if not len(rows) or k <= 0:
+            return []
+
+        if metric == 'cosine':
+            order_keys = -(self.unit[rows] @ self.unit[position])
+        else:
+            products = self.shares[rows] @ self.shares[position]
+            order_keys = np.sqrt(np.maximum(self.squared_norms[rows] + self.squared_norms[position] - 2 * products, 0))
+
+        if k < len(rows):
+            top = np.argpartition(order_keys, k - 1)[:k]
+        else:
+            top = np.arange(len(rows))
+        # Empates pela ordem dos códigos, para respostas estáveis
+        top = top[np.lexsort((rows[top], order_keys[top]))]
+        scores = -order_keys[top] if metric == 'cosine' else order_keys[top]
+        return list(zip(rows[top].tolist(), scores.tolist()))
+
+    def top_crops(self, position, count=3):
+        """[(crop, share)] of the largest crops of one municipality"""
+        shares = self.shares[position]
+        order = np.argsort(-shares, kind='stable')[:count]
+        return [(self.table.crops[crop], float(shares[crop])) for crop in order.tolist() if shares[crop] > 0]
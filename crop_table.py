@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class CropTable:
+    """Every valid (crop, municipality, area) record of one data version as flat numpy columns
+
+    Registros em ordem de cultura: os da cultura i ocupam crop_offsets[i]:crop_offsets[i + 1].
+    Municípios ordenados por código; ``rows`` aponta para eles.
+    """
+
+    def __init__(self, version, crops, codes, names, states, crop_ids, rows, areas):
+        self.version = version
+        self.crops = list(crops)
+        self.crop_position = {crop_name: position for position, crop_name in enumerate(self.crops)}
+
+        self.codes = np.array(codes, dtype=str)
+        self.code_numbers = np.array([int(code) for code in codes], dtype=np.int64)
+        self.names = np.array(names, dtype=str)
+        self.states = np.array(states, dtype=str)
+        self.code_position = {code: position for position, code in enumerate(codes)}
+
+        self.crop_ids = np.asarray(crop_ids, dtype=np.int32)
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.areas = np.asarray(areas, dtype=np.float64)
+        self.crop_offsets = np.searchsorted(self.crop_ids, np.arange(len(self.crops) + 1))
+        self.crop_totals = np.bincount(self.crop_ids, weights=self.areas, minlength=len(self.crops))
+
+        # Índice invertido município -> registros (CSR): os do município m estão em
+        # municipality_records[municipality_offsets[m]:municipality_offsets[m + 1]]
+        self.municipality_records = np.argsort(self.rows, kind='stable').astype(np.int32)
+        self.municipality_offsets = np.searchsorted(self.rows[self.municipality_records], np.arange(len(codes) + 1))
+
+        # Posição nacional de cada registro na sua cultura (1 = maior área; empates dividem a posição)
+        self.national_ranks = np.empty(len(self.areas), dtype=np.int32)
+        for position in range(len(self.crops)):
+            start, end = self.crop_offsets[position], self.crop_offsets[position + 1]
+            descending = np.sort(-self.areas[start:end])
+            self.national_ranks[start:end] = np.searchsorted(descending, -self.areas[start:end], side='left') + 1
+
+        self._centroids = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, version, crops, load_layer):
+        """Gather the layers returned by ``load_layer(crop)`` ({code: {...}}) into columns"""
+        started = time.perf_counter()
+        crops = sorted(crops)
+        municipalities = {}
+        records = []
+        for crop_id, crop_name in enumerate(crops):
+            for code, data in (load_layer(crop_name) or {}).items():
+                code = str(code)
+                if code not in municipalities:
+                    municipalities[code] = (data.get('municipality_name') or '', data.get('state_code') or '')
+                records.append((crop_id, code, float(data.get('harvested_area') or 0)))
+
+        codes = sorted(municipalities)
+        position = {code: index for index, code in enumerate(codes)}
+        table = cls(
+            version, crops, codes,
+            [municipalities[code][0] for code in codes],
+            [municipalities[code][1] for code in codes],
+            [record[0] for record in records],
+            [position[record[1]] for record in records],
+            [record[2] for record in records]
+        )
+        logger.info(f"Tabela de culturas {version} montada em {time.perf_counter() - started:.2f}s "
+                    f"({len(records)} registros, {len(codes)} municípios)")
+        return table
+
+    def profile(self, code):
+        """Crop mix of one municipality with shares and national ranks, or None if unknown"""
+        position = self.code_position.get(str(code))
+        if position is None:
+            return None
+
+        records = self.municipality_records[self.municipality_offsets[position]:self.municipality_offsets[position + 1]]
+        areas = self.areas[records]
+        crop_ids = self.crop_ids[records]
+        total_area = float(areas.sum())
+        order = np.argsort(-areas, kind='stable')
+
+        crops = []
+        for record, crop_id, area in zip(records[order].tolist(), crop_ids[order].tolist(), areas[order].tolist()):
+            crop_total = self.crop_totals[crop_id]
+            crops.append({
+                'crop': self.crops[crop_id],
+                'harvested_area': area,
+                'share': area / total_area if total_area else 0,
+                'national_share': float(area / crop_total) if crop_total else 0,
+                'national_rank': int(self.national_ranks[record]),
+                'producers': int(self.crop_offsets[crop_id + 1] - self.crop_offsets[crop_id])
+            })
+
+        return {
+            'municipality_code': str(self.codes[position]),
+            'municipality_name': str(self.names[position]),
+            'state_code': str(self.states[position]),
+            'total_area': total_area,
+            'crop_count': len(crops),
+            'crops': crops
+        }
+
+    def centroids(self, feature_index):
+        """(lon, lat) arrays per municipality from the feature index; NaN when unknown"""
+        with self._lock:
+            cached = self._centroids.get(feature_index.version)
+            if cached is None:
+                lon = np.full(len(self.codes), np.nan)
+                lat = np.full(len(self.codes), np.nan)
+                for position, code in enumerate(self.codes.tolist()):
+                    feature_position = feature_index.by_code.get(code)
+                    centroid = feature_index.entries[feature_position][6] if feature_position is not None else None
+                    if centroid:
+                        lon[position], lat[position] = centroid
+                self._centroids = {feature_index.version: (lon, lat)}
+                cached = (lon, lat)
+            return cached
@@ -1,15 +1,82 @@
-import pandas as pd
 import json
 import os
 import logging
 from app import db
-from models import CropData, ProcessingLog
+from models import Crop, CropData, Municipality, ProcessingLog
+from dataset import is_valid_municipality
+from snapshot_format import BinarySnapshotWriter
 from sqlalchemy.exc import IntegrityError
 
 logger = logging.getLogger(__name__)
 
+FACT_BATCH_SIZE = 5000
+
+def parse_municipality_code(value):
+    """7-digit IBGE code as a string, or None (empty cells, totals, notes)"""
+    # Colunas com células vazias chegam do pandas como float (3550308.0)
+    if isinstance(value, float):
+        if value != value or not value.is_integer():
+            return None
+        value = int(value)
+    code = str(value).strip()
+    return code if len(code) == 7 and code.isdigit() else None
+
+# clear_crop_tables, load_dimensions e insert_crop_facts não fazem commit: quem
+# chama substitui os dados em uma única transação, aplicada inteira ou desfeita
+
+def clear_crop_tables():
+    """Delete fact rows and dimension rows (facts first, for the foreign keys)"""
+    db.session.query(CropData).delete()
+    db.session.query(Municipality).delete()
+    db.session.query(Crop).delete()
+
+def load_dimensions(crop_names, municipalities):
+    """Insert crop and municipality dimension rows and return name/code -> id maps"""
+    crop_names = list(dict.fromkeys(crop_names))
+    if crop_names:
+        db.session.execute(db.insert(Crop), [{"name": crop_name} for crop_name in crop_names])
+    if municipalities:
+        db.session.execute(db.insert(Municipality), [
+            {
+                "code": municipality_code,
+                "name": municipality_data.get("municipality_name") or "Unknown",
+                "state_code": municipality_data.get("state_code") or "XX",
+                "is_valid": is_valid_municipality(municipality_code, municipality_data)
+            }
+            for municipality_code, municipality_data in municipalities.items()
+        ])
+
+    crop_ids = dict(db.session.query(Crop.name, Crop.id).all())
+    municipality_ids = dict(db.session.query(Municipality.code, Municipality.id).all())
+    return crop_ids, municipality_ids
+
+def insert_crop_facts(facts, batch_size=FACT_BATCH_SIZE):
+    """Bulk insert (crop_id, municipality_id, year, harvested_area) tuples"""
+    batch = []
+    inserted = 0
+    for crop_id, municipality_id, year, harvested_area in facts:
+        batch.append({
+            "crop_id": crop_id,
+            "municipality_id": municipality_id,
+            "year": year,
+            "harvested_area": harvested_area
+        })
+        if len(batch) >= batch_size:
+            db.session.execute(db.insert(CropData), batch)
+            inserted += len(batch)
+            batch = []
+            logger.debug(f"Processed {inserted} records")
+
+    if batch:
+        db.session.execute(db.insert(CropData), batch)
+        inserted += len(batch)
+    return inserted
+
 def process_ibge_data(excel_path):
     """Process IBGE Excel data and store in database"""
+    # pandas só é necessário na ingestão; não pesa na inicialização das rotas
+    import pandas as pd
+
     try:
         logger.info(f"Starting to process IBGE data from {excel_path}")
         
@@ -20,20 +87,24 @@ def process_ibge_data(excel_path):
         # Log column names for debugging
         logger.debug(f"Columns in Excel: {list(df.columns)}")
         
-        # Clear existing data
-        db.session.query(CropData).delete()
-        db.session.commit()
-        
         processed_count = 0
         error_count = 0
+        skipped_rows = 0
         
         # Get crop columns (skip CÓDIGO IBGE and MUNICÍPIO - UF)
         crop_columns = df.columns[2:]
         
+        municipalities = {}
+        records = []
+        
         # Process each row and each crop
         for index, row in df.iterrows():
             try:
-                municipality_code = str(row.iloc[0]) if pd.notna(row.iloc[0]) else "0"
+                municipality_code = parse_municipality_code(row.iloc[0])
+                if municipality_code is None:
+                    # Sem código válido a linha viraria uma chave repetida na tabela de fatos
+                    skipped_rows += 1
+                    continue
                 municipality_info = str(row.iloc[1]) if pd.notna(row.iloc[1]) else "Unknown"
                 
                 # Extract municipality name and state from "MUNICÍPIO - UF" format
@@ -44,6 +115,11 @@ def process_ibge_data(excel_path):
                     municipality_name = municipality_info
                     state_code = "XX"
                 
+                municipalities[municipality_code] = {
+                    "municipality_name": municipality_name,
+                    "state_code": state_code
+                }
+                
                 # Process each crop for this municipality
                 for crop_name in crop_columns:
                     try:
@@ -63,21 +139,8 @@ def process_ibge_data(excel_path):
                         if harvested_area <= 0:
                             continue
                             
-                        crop_data = CropData(
-                            municipality_code=municipality_code,
-                            municipality_name=municipality_name,
-                            state_code=state_code,
-                            crop_name=crop_name,
-                            harvested_area=harvested_area,
-                            year=2023
-                        )
-                        
-                        db.session.add(crop_data)
+                        records.append((municipality_code, crop_name, harvested_area))
                         processed_count += 1
-                        
-                        if processed_count % 500 == 0:
-                            db.session.commit()
-                            logger.debug(f"Processed {processed_count} records")
                             
                     except Exception as crop_error:
                         error_count += 1
@@ -88,10 +151,21 @@ def process_ibge_data(excel_path):
                 logger.error(f"Error processing row {index}: {e}")
                 continue
         
-        # Final commit
-        db.session.commit()
+        # Replace existing data: dimensions first, then the fact rows
+        clear_crop_tables()
+        crops_with_data = {crop_name for _, crop_name, _ in records}
+        crop_ids, municipality_ids = load_dimensions(
+            [crop_name for crop_name in crop_columns if crop_name in crops_with_data], municipalities)
+        insert_crop_facts(
+            (crop_ids[crop_name], municipality_ids[municipality_code], 2023, harvested_area)
+            for municipality_code, crop_name, harvested_area in records
+        )
         
-        # Log processing result
+        # Save processed data to JSON for frontend use. A exportação lê a transação
+        # ainda aberta; se falhar, o except desfaz a substituição e registra só o erro
+        save_processed_data_to_json()
+        
+        # Log processing result and commit the replacement together
         log_entry = ProcessingLog(
             filename=os.path.basename(excel_path),
             status="success",
@@ -100,20 +174,22 @@ def process_ibge_data(excel_path):
         db.session.add(log_entry)
         db.session.commit()
         
-        logger.info(f"Data processing completed. Processed: {processed_count}, Errors: {error_count}")
-        
-        # Save processed data to JSON for frontend use
-        save_processed_data_to_json()
+        logger.info(f"Data processing completed. Processed: {processed_count}, Errors: {error_count}, "
+                    f"Skipped rows without a valid code: {skipped_rows}")
         
         return {
             "success": True,
             "processed": processed_count,
             "errors": error_count,
+            "skipped_rows": skipped_rows,
             "message": f"Successfully processed {processed_count} records"
         }
         
     except Exception as e:
         logger.error(f"Error processing IBGE data: {e}")
+        # A sessão pode ter ficado em estado de falha (ex.: IntegrityError); sem o
+        # rollback o registro do erro também falharia
+        db.session.rollback()
         
         # Log processing error
         log_entry = ProcessingLog(
@@ -129,61 +205,114 @@ def process_ibge_data(excel_path):
             "error": str(e)
         }
 
-def save_processed_data_to_json():
-    """Save processed data to JSON file for frontend use"""
+def save_processed_data_to_json(json_path='data/processed_data.json', binary_path=None, batch_size=FACT_BATCH_SIZE):
+    """Stream processed data from the database to a compact JSON (and optional binary) snapshot
+
+    Erros são registrados e repassados ao chamador; o arquivo temporário nunca fica para trás.
+    """
+    tmp_path = f'{json_path}.tmp'
     try:
         # Ensure data directory exists
-        os.makedirs('data', exist_ok=True)
+        os.makedirs(os.path.dirname(json_path) or '.', exist_ok=True)
+        
+        # Cursor no servidor / yield_per: memória limitada, ordenado por cultura
+        rows = db.session.query(
+            Crop.name,
+            Municipality.code,
+            Municipality.name,
+            Municipality.state_code,
+            CropData.harvested_area
+        ).join(Crop, CropData.crop_id == Crop.id).join(
+            Municipality, CropData.municipality_id == Municipality.id
+        ).order_by(Crop.name, Municipality.code).yield_per(batch_size)
         
-        # Get all crop data
-        crop_data = db.session.query(CropData).all()
+        binary_writer = BinarySnapshotWriter() if binary_path else None
+        encode = json.JSONEncoder(ensure_ascii=False).encode
+        records = 0
+        current_crop = None
+        parts = []
         
-        # Group by crop
-        data_by_crop = {}
-        for record in crop_data:
-            crop_name = record.crop_name
-            if crop_name not in data_by_crop:
-                data_by_crop[crop_name] = {}
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            parts.append('{')
+            for crop_name, municipality_code, municipality_name, state_code, harvested_area in rows:
+                if crop_name != current_crop:
+                    # Fechar a cultura anterior e abrir a próxima
+                    if current_crop is not None:
+                        parts.append('},')
+                    parts.append(f'{encode(crop_name)}:{{')
+                    current_crop = crop_name
+                else:
+                    parts.append(',')
+                
+                parts.append(
+                    f'{encode(municipality_code)}:{{"municipality_name":{encode(municipality_name)},'
+                    f'"state_code":{encode(state_code)},"harvested_area":{encode(harvested_area)}}}'
+                )
+                records += 1
+                
+                if binary_writer:
+                    binary_writer.add(crop_name, municipality_code, municipality_name, state_code, harvested_area)
+                
+                # Escrita incremental em blocos
+                if records % batch_size == 0:
+                    f.write(''.join(parts))
+                    parts = []
             
-            data_by_crop[crop_name][record.municipality_code] = {
-                "municipality_name": record.municipality_name,
-                "state_code": record.state_code,
-                "harvested_area": record.harvested_area
-            }
+            parts.append('}}' if current_crop is not None else '}')
+            f.write(''.join(parts))
         
-        # Save to JSON
-        with open('data/processed_data.json', 'w', encoding='utf-8') as f:
-            json.dump(data_by_crop, f, ensure_ascii=False, indent=2)
+        # Publicação atômica
+        os.replace(tmp_path, json_path)
+        if binary_writer:
+            binary_writer.write(binary_path)
         
-        logger.info("Processed data saved to JSON successfully")
+        logger.info(f"Processed data saved to JSON successfully ({records} records)")
+        return records
         
     except Exception as e:
         logger.error(f"Error saving processed data to JSON: {e}")
+        raise
+    finally:
+        # Após o os.replace o temporário já não existe
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 def get_available_crops():
     """Get list of available crops"""
     try:
-        crops = db.session.query(CropData.crop_name).distinct().all()
+        # Tabela de dimensão pequena: sem DISTINCT sobre a tabela fato
+        crops = db.session.query(Crop.name).order_by(Crop.name).all()
         return [crop[0] for crop in crops if crop[0]]
     except Exception as e:
         logger.error(f"Error getting available crops: {e}")
         return []
 
-def get_crop_data_for_map(crop_name):
+def get_crop_data_for_map(crop_name, state_code=None):
     """Get crop data formatted for map visualization"""
     try:
-        # Only get records with valid 7-digit municipality codes
-        crop_data = db.session.query(CropData).filter(
-            CropData.crop_name == crop_name,
-            db.func.length(CropData.municipality_code) == 7
-        ).all()
+        crop_id = db.session.query(Crop.id).filter(Crop.name == crop_name).scalar()
+        if crop_id is None:
+            return {}
+        
+        # Only get valid municipality records (flag stored at load time)
+        query = db.session.query(
+            Municipality.code,
+            Municipality.name,
+            Municipality.state_code,
+            CropData.harvested_area
+        ).join(Municipality, CropData.municipality_id == Municipality.id).filter(
+            CropData.crop_id == crop_id,
+            Municipality.is_valid.is_(True)
+        )
+        if state_code:
+            query = query.filter(Municipality.state_code == state_code)
         
         data = {}
-        for record in crop_data:
-            data[record.municipality_code] = {
-                "municipality_name": record.municipality_name,
-                "state_code": record.state_code,
-                "harvested_area": record.harvested_area
+        for municipality_code, municipality_name, municipality_state, harvested_area in query.all():
+            data[municipality_code] = {
+                "municipality_name": municipality_name,
+                "state_code": municipality_state,
+                "harvested_area": harvested_area
             }
         
         logger.info(f"Returning {len(data)} valid municipality records for {crop_name}")
@@ -191,3 +320,54 @@ def get_crop_data_for_map(crop_name):
     except Exception as e:
         logger.error(f"Error getting crop data for map: {e}")
         return {}
+
+
+def import_crop_data_json(crop_data, year=2023):
+    """Bulk load a {crop: {code: {...}}} snapshot into the database"""
+    try:
+        municipalities = {}
+        for crop_municipalities in crop_data.values():
+            municipalities.update(crop_municipalities)
+
+        clear_crop_tables()
+        crop_ids, municipality_ids = load_dimensions(crop_data.keys(), municipalities)
+        processed_count = insert_crop_facts(
+            (crop_ids[crop_name], municipality_ids[municipality_code], year,
+             municipality_data.get("harvested_area", 0))
+            for crop_name, crop_municipalities in crop_data.items()
+            for municipality_code, municipality_data in crop_municipalities.items()
+        )
+
+        db.session.add(ProcessingLog(filename="crop_data_json", status="success", records_processed=processed_count))
+        db.session.commit()
+
+        logger.info(f"Imported {processed_count} records from JSON snapshot")
+        return {"success": True, "processed": processed_count}
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error importing JSON snapshot: {e}")
+        return {"success": False, "error": str(e)}
+
+def get_data_version():
+    """Version tag of the database contents: changes after every successful import"""
+    last_import = db.session.query(db.func.max(ProcessingLog.id)).filter(ProcessingLog.status == "success").scalar()
+    return f"db-{last_import or 0}"
+
+def get_municipality_count():
+    """Distinct municipality codes loaded (regional aggregates included, as in the JSON snapshot)"""
+    try:
+        return db.session.query(db.func.count(Municipality.id)).scalar() or 0
+    except Exception as e:
+        logger.error(f"Error counting municipalities: {e}")
+        return 0
+
+def get_municipality_metadata():
+    """Get {code: (name, state_code)} for every valid municipality"""
+    try:
+        municipalities = db.session.query(
+            Municipality.code, Municipality.name, Municipality.state_code
+        ).filter(Municipality.is_valid.is_(True)).all()
+        return {code: (name, state_code) for code, name, state_code in municipalities}
+    except Exception as e:
+        logger.error(f"Error getting municipality metadata: {e}")
+        return {}
@@ -0,0 +1,396 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from memory_budget import budget, deep_sizeof
+from metrics import metrics, record_cache_access
+from single_flight import SingleFlight
+from snapshot_format import MAGIC, binary_snapshot_to_crop_data, layer_to_columns, pack_layer_columns
+
+logger = logging.getLogger(__name__)
+
+CROP_DATA_PATH = os.environ.get('CROP_DATA_PATH', 'data/crop_data_static.json')
+RELOAD_INTERVAL = float(os.environ.get('DATASET_RELOAD_INTERVAL', '30'))
+# "dict": estruturas Python (padrão); "shared": arrays numpy compartilhados entre workers (gunicorn.conf.py)
+DATASET_STORAGE = os.environ.get('DATASET_STORAGE', 'dict')
+
+# Nomes que indicam regiões/agregações do IBGE em vez de municípios
+REGION_KEYWORDS = [
+    'região', 'mesorregião', 'microrregião', 'nordeste', 'norte', 'sul',
+    'centro', 'oeste', 'leste', 'sudeste', 'noroeste', 'sudoeste',
+    'alto ', 'baixo ', 'médio ', '-grossense', 'parecis', 'araguaia',
+    'pantanal', 'cerrado', 'amazônia', 'caatinga', 'mata atlântica'
+]
+
+# Nomes muito genéricos ou que são claramente regiões
+REGION_NAMES = [
+    'alto teles pires', 'sudeste mato-grossense', 'parecis', 'barreiras',
+    'dourados', 'norte mato-grossense', 'portal da amazônia'
+]
+
+
+# Unidades da federação (sigla: nome), na ordem alfabética dos nomes
+STATE_NAMES = {
+    'AC': 'Acre',
+    'AL': 'Alagoas',
+    'AP': 'Amapá',
+    'AM': 'Amazonas',
+    'BA': 'Bahia',
+    'CE': 'Ceará',
+    'DF': 'Distrito Federal',
+    'ES': 'Espírito Santo',
+    'GO': 'Goiás',
+    'MA': 'Maranhão',
+    'MT': 'Mato Grosso',
+    'MS': 'Mato Grosso do Sul',
+    'MG': 'Minas Gerais',
+    'PA': 'Pará',
+    'PB': 'Paraíba',
+    'PR': 'Paraná',
+    'PE': 'Pernambuco',
+    'PI': 'Piauí',
+    'RJ': 'Rio de Janeiro',
+    'RN': 'Rio Grande do Norte',
+    'RS': 'Rio Grande do Sul',
+    'RO': 'Rondônia',
+    'RR': 'Roraima',
+    'SC': 'Santa Catarina',
+    'SP': 'São Paulo',
+    'SE': 'Sergipe',
+    'TO': 'Tocantins'
+}
+
+# Prefixo IBGE (dois primeiros dígitos do código do município) de cada UF
+STATE_IBGE_CODES = {
+    'RO': 11, 'AC': 12, 'AM': 13, 'RR': 14, 'PA': 15, 'AP': 16, 'TO': 17,
+    'MA': 21, 'PI': 22, 'CE': 23, 'RN': 24, 'PB': 25, 'PE': 26, 'AL': 27, 'SE': 28, 'BA': 29,
+    'MG': 31, 'ES': 32, 'RJ': 33, 'SP': 35,
+    'PR': 41, 'SC': 42, 'RS': 43,
+    'MS': 50, 'MT': 51, 'GO': 52, 'DF': 53
+}
+
+# Grandes regiões do IBGE: o primeiro dígito do prefixo identifica a região
+REGION_STATES = {
+    'norte': ['AC', 'AM', 'AP', 'PA', 'RO', 'RR', 'TO'],
+    'nordeste': ['AL', 'BA', 'CE', 'MA', 'PB', 'PE', 'PI', 'RN', 'SE'],
+    'sudeste': ['ES', 'MG', 'RJ', 'SP'],
+    'sul': ['PR', 'RS', 'SC'],
+    'centro-oeste': ['DF', 'GO', 'MS', 'MT']
+}
+
+
+def is_valid_municipality(municipality_code, municipality_data):
+    """Check if a record is a real IBGE municipality (not a regional aggregate)"""
+    municipality_code_str = str(municipality_code)
+    municipality_name = municipality_data.get('municipality_name', '').lower()
+
+    # Códigos de município IBGE começam com 1-5 e têm 7 dígitos
+    # Códigos que começam com 0 são agregações regionais
+    return bool(
+        len(municipality_code_str) == 7 and
+        municipality_code_str.isdigit() and
+        municipality_code_str[0] in '12345' and
+        municipality_data.get('municipality_name') and
+        not any(keyword in municipality_name for keyword in REGION_KEYWORDS) and
+        municipality_name not in REGION_NAMES
+    )
+
+
+def match_crop_name(crop_name, available_crops):
+    """Exact crop match first, then the first crop with a similar name"""
+    if crop_name in available_crops:
+        return crop_name
+
+    crop_name_lower = crop_name.lower()
+    for available_crop in available_crops:
+        if crop_name_lower in available_crop.lower() or available_crop.lower() in crop_name_lower:
+            return available_crop
+    return None
+
+
+class Snapshot:
+    """Immutable, fully built view of one version of the crop dataset"""
+
+    def __init__(self, crop_data, version, source=None):
+        self.crop_data = crop_data
+        self.version = version
+        self.source = source
+        self.loaded_at = time.time()
+        self.crops = sorted(crop_data.keys())
+
+        # Camadas já filtradas (apenas municípios válidos) por cultura
+        self.layers = {
+            crop_name: {
+                code: data for code, data in municipalities.items()
+                if is_valid_municipality(code, data)
+            }
+            for crop_name, municipalities in crop_data.items()
+        }
+
+        # Metadados dos municípios, servidos uma única vez por versão
+        self.municipalities = {}
+        for layer in self.layers.values():
+            for code, data in layer.items():
+                if code not in self.municipalities:
+                    self.municipalities[code] = (data.get('municipality_name'), data.get('state_code'))
+
+        # Códigos distintos em todas as culturas (inclui agregações), servido por /api/statistics
+        self.municipality_count = len({code for municipalities in crop_data.values() for code in municipalities})
+
+        self._columnar = {}
+
+    def has_crop(self, crop_name):
+        return crop_name in self.crop_data
+
+    def layer(self, crop_name):
+        """Valid municipalities for a crop, or None if the crop does not exist"""
+        return self.layers.get(crop_name)
+
+    def columnar(self, crop_name):
+        """Parallel (codes, areas, packed binary) columns for a crop layer, built once"""
+        columns = self._columnar.get(crop_name)
+        record_cache_access('columnar_layer', columns is not None)
+        if columns is None:
+            codes, areas = layer_to_columns(self.layers[crop_name])
+            columns = (codes, areas, pack_layer_columns(codes, areas))
+            self._columnar[crop_name] = columns
+        return columns
+
+    def find_crop(self, crop_name):
+        """Exact crop match first, then the first crop with a similar name"""
+        return match_crop_name(crop_name, self.crop_data.keys())
+
+
+_MISSING = object()
+
+
+class VersionedCache:
+    """Dict cache that empties itself when the dataset version changes
+
+    Misses concorrentes da mesma (versão, chave) são calculados uma única vez:
+    as demais threads esperam o resultado do primeiro (single_flight).
+    """
+
+    def __init__(self, name, max_entries=None):
+        self.name = name
+        # Limite opcional de entradas; as menos usadas recentemente saem primeiro
+        self.max_entries = max_entries
+        self._version = None
+        self._data = OrderedDict()
+        # chave -> [bytes, segundos de cálculo, prioridade] para o orçamento de memória
+        self._meta = {}
+        self.nbytes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._flight = SingleFlight(name)
+        budget.register_cache(self)
+
+    def get(self, version, key, default=None):
+        with self._lock:
+            if version != self._version or key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            meta = self._meta[key]
+            meta[2] = budget.priority(meta[0], meta[1])
+            return self._data[key]
+
+    def set(self, version, key, value, cost=0.0):
+        size = deep_sizeof(value, budget.root_ids())
+        with self._lock:
+            if version != self._version:
+                # Nova versão do dataset: descartar entradas antigas
+                self._version = version
+                self._data = OrderedDict()
+                self._meta = {}
+                self.nbytes = 0
+            if key in self._data:
+                self.nbytes -= self._meta[key][0]
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._meta[key] = [size, cost, budget.priority(size, cost)]
+            self.nbytes += size
+            if self.max_entries is not None:
+                while len(self._data) > self.max_entries:
+                    oldest, _ = self._data.popitem(last=False)
+                    self.nbytes -= self._meta.pop(oldest)[0]
+        budget.enforce()
+
+    def get_or_compute(self, version, key, compute, timeout=None):
+        # None é um resultado válido (ex.: hotspots sem vizinhos) e também fica em cache
+        value = self.get(version, key, _MISSING)
+        record_cache_access(self.name, value is not _MISSING)
+        if value is _MISSING:
+            value = self._flight.do((version, key), lambda: self._compute(version, key, compute), timeout)
+        return value
+
+    def _compute(self, version, key, compute):
+        # Outro líder pode ter terminado entre o get() e a entrada no single-flight
+        value = self.get(version, key, _MISSING)
+        if value is _MISSING:
+            started = time.perf_counter()
+            value = compute()
+            self.set(version, key, value, cost=time.perf_counter() - started)
+        return value
+
+    def value_ids(self):
+        with self._lock:
+            return [id(value) for value in self._data.values()]
+
+    def lowest_priority(self):
+        """(priority, key, bytes) of the entry the memory budget should evict first, or None"""
+        with self._lock:
+            if not self._meta:
+                return None
+            key, meta = min(self._meta.items(), key=lambda item: item[1][2])
+            return meta[2], key, meta[0]
+
+    def evict(self, key):
+        with self._lock:
+            if key not in self._data:
+                return False
+            del self._data[key]
+            self.nbytes -= self._meta.pop(key)[0]
+            self.evictions += 1
+            return True
+
+    def memory_stats(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'bytes': self.nbytes,
+                'compute_seconds': round(sum(meta[1] for meta in self._meta.values()), 4),
+                'evictions': self.evictions
+            }
+
+
+class DatasetHolder:
+    """Holds the current Snapshot and swaps in new versions without downtime"""
+
+    def __init__(self, path=CROP_DATA_PATH, reload_interval=RELOAD_INTERVAL, storage=DATASET_STORAGE):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.storage = storage
+        # Chamado com o novo snapshot após cada troca de versão feita pelo watcher
+        self.on_swap = None
+        self._snapshot = None
+        self._fingerprint = None
+        self._load_lock = threading.Lock()
+        self._watcher = None
+        self._watcher_pid = None
+
+    def _file_fingerprint(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _build_snapshot(self):
+        try:
+            with open(self.path, 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            # Arquivo ausente ou no meio de uma troca: manter a última versão boa
+            if self._snapshot is not None:
+                logger.warning(f"Arquivo {self.path} não encontrado; mantendo a versão {self._snapshot.version}")
+                return self._snapshot
+            logger.warning(f"Arquivo {self.path} não encontrado")
+            return Snapshot({}, 'empty', self.path)
+
+        version = hashlib.sha256(raw).hexdigest()[:16]
+        if self._snapshot is not None and self._snapshot.version == version:
+            return self._snapshot
+
+        started = time.perf_counter()
+        if self.storage == 'shared':
+            from shared_snapshot import ArraySnapshot
+            if raw.startswith(MAGIC):
+                snapshot = ArraySnapshot.from_binary(raw, version, self.path)
+            else:
+                snapshot = ArraySnapshot.from_crop_data(json.loads(raw), version, self.path)
+        else:
+            # Snapshot binário (snapshot_format) carrega ~2x mais rápido que o JSON
+            if raw.startswith(MAGIC):
+                crop_data = binary_snapshot_to_crop_data(raw)
+            else:
+                crop_data = json.loads(raw)
+            snapshot = Snapshot(crop_data, version, self.path)
+        elapsed = time.perf_counter() - started
+        logger.info(f"Dataset {version} carregado em {elapsed:.2f}s ({len(snapshot.crops)} culturas, {self.storage})")
+
+        metrics.observe('dataset_load_seconds', elapsed, help_text='Time to parse and index a dataset snapshot')
+        metrics.set_gauge('dataset_loaded_timestamp_seconds', snapshot.loaded_at)
+        metrics.set_gauge('dataset_crops', len(snapshot.crops))
+        return snapshot
+
+    def current(self):
+        """Return the snapshot to use for the whole request"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.reload()
+            snapshot = self._snapshot
+        self._ensure_watcher()
+        return snapshot
+
+    def preload(self, mode='background'):
+        """Load the first snapshot now ('sync'), in a thread ('background') or on first use ('lazy')"""
+        if mode == 'sync':
+            self.current()
+        elif mode == 'background':
+            threading.Thread(target=self.current, name='dataset-preload', daemon=True).start()
+
+    def reload(self, force=False):
+        """Rebuild the snapshot if the source file changed; return True when swapped"""
+        with self._load_lock:
+            fingerprint = self._file_fingerprint()
+            if not force and self._snapshot is not None and fingerprint == self._fingerprint:
+                return False
+
+            try:
+                snapshot = self._build_snapshot()
+            except Exception as e:
+                # Manter a versão anterior em caso de arquivo corrompido/parcial
+                logger.error(f"Erro ao carregar dados: {e}")
+                if self._snapshot is None:
+                    self._snapshot = Snapshot({}, 'empty', self.path)
+                return False
+
+            self._fingerprint = fingerprint
+            swapped = snapshot is not self._snapshot
+            # Atribuição atômica: requisições em andamento mantêm a referência antiga
+            self._snapshot = snapshot
+            return swapped
+
+    def _ensure_watcher(self):
+        if self.reload_interval <= 0:
+            return
+        # Threads não sobrevivem ao fork dos workers do gunicorn
+        if self._watcher is not None and self._watcher_pid == os.getpid() and self._watcher.is_alive():
+            return
+        with self._load_lock:
+            if self._watcher is not None and self._watcher_pid == os.getpid() and self._watcher.is_alive():
+                return
+            self._watcher_pid = os.getpid()
+            self._watcher = threading.Thread(target=self._watch, name='dataset-watcher', daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.reload_interval)
+            try:
+                if self.reload():
+                    logger.info(f"Dataset atualizado para a versão {self._snapshot.version}")
+                    if self.on_swap is not None:
+                        self.on_swap(self._snapshot)
+            except Exception as e:
+                logger.error(f"Erro ao verificar atualização do dataset: {e}")
+
+
+dataset = DatasetHolder()
+budget.register('dataset', lambda: dataset._snapshot)
@@ -1,5 +1,7 @@
 
+import argparse
 import json
+import os
 
 # Expanded crop data based on IBGE 2023 data
 EXPANDED_CROP_DATA = {
@@ -205,11 +207,23 @@ EXPANDED_CROP_DATA = {
     }
 }
 
-def update_crop_data():
-    """Update the static crop data file with expanded data"""
+# A amostra vai para um arquivo próprio: data/crop_data_static.json é a base nacional gerada por build_data.py
+SAMPLE_PATH = 'data/crop_data_sample.json'
+
+def update_crop_data(output_path=SAMPLE_PATH, force=False):
+    """Write the hard-coded sample crop data (never over a larger dataset unless forced)"""
     try:
+        if os.path.exists(output_path) and not force:
+            with open(output_path, 'r', encoding='utf-8') as f:
+                existing_records = sum(len(crop_data) for crop_data in json.load(f).values())
+            sample_records = sum(len(crop_data) for crop_data in EXPANDED_CROP_DATA.values())
+            if existing_records > sample_records:
+                print(f"{output_path} já tem {existing_records} registros (amostra: {sample_records}); "
+                      f"use --force para sobrescrever")
+                return False
+
         # Save the expanded data
-        with open('data/crop_data_static.json', 'w', encoding='utf-8') as f:
+        with open(output_path, 'w', encoding='utf-8') as f:
             json.dump(EXPANDED_CROP_DATA, f, ensure_ascii=False, indent=2)
         
         print(f"Successfully updated crop data with {len(EXPANDED_CROP_DATA)} crops")
@@ -225,9 +239,15 @@ def update_crop_data():
         print(f"Total records: {total_records}")
         print(f"Total municipalities: {total_municipalities}")
         print(f"Available crops: {list(EXPANDED_CROP_DATA.keys())}")
+        return True
         
     except Exception as e:
         print(f"Error updating crop data: {e}")
+        return False
 
 if __name__ == "__main__":
-    update_crop_data()
+    parser = argparse.ArgumentParser(description="Gravar a amostra de dados de culturas")
+    parser.add_argument('--output', default=SAMPLE_PATH)
+    parser.add_argument('--force', action='store_true', help="Sobrescrever mesmo uma base maior que a amostra")
+    args = parser.parse_args()
+    update_crop_data(args.output, args.force)
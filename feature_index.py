@@ -0,0 +1,338 @@
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import threading
+import time
+
+from dataset import RELOAD_INTERVAL, STATE_IBGE_CODES
+from memory_budget import budget
+
+logger = logging.getLogger(__name__)
+
+GEOJSON_PATH = os.environ.get('GEOJSON_PATH', 'static/data/brazil_municipalities_all.geojson')
+FEATURE_INDEX_PATH = os.environ.get('FEATURE_INDEX_PATH', 'data/municipality_features.idx.json')
+
+# Mesmas chaves de propriedades aceitas pelo mapa no navegador
+CODE_KEYS = ('GEOCODIGO', 'CD_MUN', 'cd_geocmu', 'geocodigo', 'CD_GEOCMU')
+NAME_KEYS = ('NOME', 'NM_MUN', 'nm_mun', 'nome')
+STATE_KEYS = ('UF', 'SIGLA_UF', 'uf')
+
+# Classes da escala logarítmica usada no mapa (value_class 0..CLASS_COUNT-1)
+CLASS_COUNT = int(os.environ.get('FEATURE_CLASS_COUNT', '7'))
+
+# Formato das entradas persistidas; índices de outro formato são reconstruídos
+INDEX_FORMAT = 2
+
+STATE_BY_PREFIX = {str(prefix): state for state, prefix in STATE_IBGE_CODES.items()}
+
+# Apenas chaves e aspas interessam para delimitar as features; coordenadas são ignoradas
+_STRUCTURE = re.compile(rb'[{}"]')
+_STRING = re.compile(rb'"(?:[^"\\]|\\.)*"')
+_FEATURES_KEY = re.compile(rb'"features"\s*:\s*\[')
+_SEPARATOR = re.compile(rb'\s*([,\]])')
+_PROPERTIES_OPEN = re.compile(rb'\s*:\s*\{')
+
+
+def feature_ranges(buffer):
+    """Yield (start, end) byte offsets of each object in the top-level "features" array"""
+    match = _FEATURES_KEY.search(buffer)
+    if match is None:
+        return
+    position = match.end()
+    depth = 0
+    start = None
+    while True:
+        token = _STRUCTURE.search(buffer, position)
+        if token is None:
+            return
+        char = buffer[token.start():token.start() + 1]
+        if char == b'"':
+            position = _STRING.match(buffer, token.start()).end()
+            continue
+        position = token.end()
+        if char == b'{':
+            if depth == 0:
+                start = token.start()
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                yield start, position
+                separator = _SEPARATOR.match(buffer, position)
+                if separator is None or separator.group(1) == b']':
+                    return
+
+
+def properties_end(raw):
+    """Offset of the brace closing the feature's "properties" object, or None when it is not an object"""
+    depth = 0
+    position = 0
+    properties_depth = None
+    while True:
+        token = _STRUCTURE.search(raw, position)
+        if token is None:
+            return None
+        char = raw[token.start():token.start() + 1]
+        if char == b'"':
+            position = _STRING.match(raw, token.start()).end()
+            if depth == 1 and raw[token.start():position] == b'"properties"':
+                opening = _PROPERTIES_OPEN.match(raw, position)
+                if opening is not None:
+                    properties_depth = depth + 1
+                    position = opening.end()
+                    depth += 1
+            continue
+        position = token.end()
+        if char == b'{':
+            depth += 1
+        else:
+            if depth == properties_depth:
+                return token.start()
+            depth -= 1
+
+
+def first_property(properties, keys):
+    for key in keys:
+        value = properties.get(key)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def _outer_rings(geometry):
+    if not geometry:
+        return []
+    if geometry.get('type') == 'Polygon':
+        return geometry['coordinates'][:1]
+    if geometry.get('type') == 'MultiPolygon':
+        return [polygon[0] for polygon in geometry['coordinates'] if polygon]
+    return []
+
+
+def geometry_bounds(geometry):
+    """(bbox, centroid) of a Polygon/MultiPolygon from its outer rings (area-weighted)"""
+    min_x = min_y = float('inf')
+    max_x = max_y = float('-inf')
+    area_sum = cx_sum = cy_sum = 0.0
+    for ring in _outer_rings(geometry):
+        ring_area = 0.0
+        ring_cx = ring_cy = 0.0
+        for (x0, y0, *_), (x1, y1, *_) in zip(ring, ring[1:]):
+            cross = x0 * y1 - x1 * y0
+            ring_area += cross
+            ring_cx += (x0 + x1) * cross
+            ring_cy += (y0 + y1) * cross
+        for x, y, *_ in ring:
+            min_x, max_x = min(min_x, x), max(max_x, x)
+            min_y, max_y = min(min_y, y), max(max_y, y)
+        if ring_area:
+            area_sum += ring_area / 2
+            cx_sum += ring_cx / 6
+            cy_sum += ring_cy / 6
+
+    if min_x == float('inf'):
+        return None, None
+    bbox = [round(v, 6) for v in (min_x, min_y, max_x, max_y)]
+    if area_sum:
+        centroid = [cx_sum / area_sum, cy_sum / area_sum]
+    else:
+        centroid = [(min_x + max_x) / 2, (min_y + max_y) / 2]
+    return bbox, [round(v, 6) for v in centroid]
+
+
+class FeatureIndex:
+    """Byte-offset index of the combined municipality GeoJSON: code, state, bbox and centroid"""
+
+    def __init__(self, path, version, entries, buffer=None):
+        self.path = path
+        self.version = version
+        # Entradas: [código, nome, UF, início, tamanho, bbox, centróide, fim das propriedades],
+        # na ordem do arquivo; o fim das propriedades é relativo ao início da feature
+        self.entries = entries
+        # Mapeamento do arquivo que gerou o índice: uma troca do GeoJSON no disco
+        # (os.replace) não muda os bytes lidos por este índice
+        self._buffer = buffer
+        self._buffer_lock = threading.Lock()
+        self.by_code = {}
+        self.by_state = {}
+        for position, entry in enumerate(entries):
+            self.by_code[entry[0]] = position
+            self.by_state.setdefault(entry[2], []).append(position)
+
+    @staticmethod
+    def fingerprint(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return _stat_fingerprint(stat)
+
+    @staticmethod
+    def open_mapping(path):
+        """(version, read-only mmap) of the file as opened now; (None, None) if missing, (version, None) if empty"""
+        try:
+            with open(path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_size == 0:
+                    return _stat_fingerprint(stat), None
+                return _stat_fingerprint(stat), mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None, None
+
+    @classmethod
+    def build(cls, path, mapping=None):
+        """Scan the GeoJSON once, parsing one feature at a time"""
+        version, buffer = mapping or cls.open_mapping(path)
+        entries = []
+        if buffer is None:
+            return cls(path, version, entries)
+
+        for start, end in feature_ranges(buffer):
+            raw = buffer[start:end]
+            feature = json.loads(raw)
+            properties = feature.get('properties') or {}
+            code = first_property(properties, CODE_KEYS)
+            if code is None:
+                continue
+            code = str(code)
+            state = first_property(properties, STATE_KEYS) or STATE_BY_PREFIX.get(code[:2])
+            bbox, centroid = geometry_bounds(feature.get('geometry'))
+            entries.append([code, first_property(properties, NAME_KEYS), state, start, end - start,
+                            bbox, centroid, properties_end(raw)])
+        return cls(path, version, entries, buffer)
+
+    @classmethod
+    def load_or_build(cls, path=GEOJSON_PATH, index_path=FEATURE_INDEX_PATH):
+        """Reuse the persisted index while the GeoJSON is unchanged, otherwise rebuild it"""
+        version, buffer = cls.open_mapping(path)
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            if (stored.get('format') == INDEX_FORMAT and stored.get('path') == path
+                    and stored.get('version') == version):
+                return cls(path, version, stored['entries'], buffer)
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+        started = time.perf_counter()
+        index = cls.build(path, (version, buffer))
+        logger.info(f"Índice de geometrias construído em {time.perf_counter() - started:.2f}s "
+                    f"({len(index.entries)} municípios)")
+        if index.entries:
+            index.save(index_path)
+        return index
+
+    def save(self, index_path=FEATURE_INDEX_PATH):
+        os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+        tmp_path = f'{index_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'format': INDEX_FORMAT, 'path': self.path, 'version': self.version, 'entries': self.entries},
+                      f, separators=(',', ':'))
+        os.replace(tmp_path, index_path)
+
+    def positions_for_states(self, states):
+        positions = []
+        for state in states:
+            positions.extend(self.by_state.get(state, ()))
+        return sorted(positions)
+
+    def mapping(self):
+        """The mmap the entries point into; indexes built elsewhere (build_data) map the file on first use"""
+        if self._buffer is None and self.entries:
+            with self._buffer_lock:
+                if self._buffer is None:
+                    version, self._buffer = self.open_mapping(self.path)
+                    if version != self.version:
+                        logger.warning(f"GeoJSON {self.path} mudou desde o índice {self.version}; "
+                                       f"lendo a versão {version}")
+        return self._buffer
+
+    def read_features(self, positions):
+        """Yield (entry, raw feature bytes) slicing only the requested byte ranges of the mapped file"""
+        buffer = self.mapping()
+        for position in positions:
+            entry = self.entries[position]
+            yield entry, buffer[entry[3]:entry[3] + entry[4]]
+
+
+def _stat_fingerprint(stat):
+    return f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+
+def log_scale(value, minimum, maximum):
+    """Position of a value in [0, 1] on the map's log scale (getColorForValueWithColor)"""
+    adjusted_min = max(minimum, 1)
+    adjusted_max = max(maximum, adjusted_min * 10)
+    log_min = math.log(adjusted_min)
+    return (math.log(max(value, adjusted_min)) - log_min) / (math.log(adjusted_max) - log_min)
+
+
+def _with_properties(entry, raw, extra):
+    """Raw feature bytes with the extra properties spliced in before the closing brace of "properties"
+
+    As chaves entram no fim do objeto, então prevalecem sobre chaves homônimas do
+    arquivo, como no dict.update de antes. Features sem objeto de propriedades
+    (raras) passam pelo json.
+    """
+    end = entry[7]
+    if end is None:
+        feature = json.loads(raw)
+        feature['properties'] = {**(feature.get('properties') or {}), **extra}
+        return json.dumps(feature, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    fields = json.dumps(extra, ensure_ascii=False, separators=(',', ':')).encode('utf-8')[1:-1]
+    empty = raw[:end].rstrip().endswith(b'{')
+    return b''.join((raw[:end], fields if empty else b',' + fields, raw[end:]))
+
+
+def build_feature_collection(index, positions, crop_municipalities, **metadata):
+    """GeoJSON bytes for the given features with the crop value and class in their properties
+
+    As features saem do arquivo como bytes, sem json.loads/dumps: os valores da
+    cultura são inseridos direto no objeto "properties" de cada uma.
+    """
+    areas = {}
+    for position in positions:
+        code = index.entries[position][0]
+        data = crop_municipalities.get(code)
+        if data and data.get('harvested_area'):
+            areas[code] = data['harvested_area']
+    minimum = min(areas.values()) if areas else 0
+    maximum = max(areas.values()) if areas else 0
+
+    header = {'type': 'FeatureCollection', **metadata, 'min': minimum, 'max': maximum, 'classes': CLASS_COUNT}
+    parts = []
+    for entry, raw in index.read_features(positions):
+        area = areas.get(entry[0])
+        if area is None:
+            extra = {'harvested_area': None, 'normalized': None, 'value_class': None}
+        else:
+            normalized = log_scale(area, minimum, maximum)
+            extra = {'harvested_area': area, 'normalized': round(normalized, 4),
+                     'value_class': min(CLASS_COUNT - 1, int(normalized * CLASS_COUNT))}
+        parts.append(_with_properties(entry, raw, extra))
+
+    opening = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')[:-1]
+    return b''.join((opening, b',"features":[', b','.join(parts), b']}'))
+
+
+_index = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+budget.register('feature_index', lambda: _index)
+
+
+def get_feature_index():
+    """Current FeatureIndex; the GeoJSON is re-checked on the dataset reload interval, not per request"""
+    global _index, _index_checked_at
+    index = _index
+    if index is not None and (RELOAD_INTERVAL <= 0 or time.monotonic() - _index_checked_at < RELOAD_INTERVAL):
+        return index
+    with _index_lock:
+        if _index is None or (RELOAD_INTERVAL > 0 and time.monotonic() - _index_checked_at >= RELOAD_INTERVAL):
+            if _index is None or _index.version != FeatureIndex.fingerprint(_index.path):
+                _index = FeatureIndex.load_or_build()
+            _index_checked_at = time.monotonic()
+        return _index
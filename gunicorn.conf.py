@@ -0,0 +1,83 @@
+"""Gunicorn configuration: load the dataset once in the master and share it with the workers.
+
+Uso:
+    gunicorn -c gunicorn.conf.py main:app
+
+Com preload_app o master importa a aplicação e carrega o dataset (síncrono) em
+arrays numpy (DATASET_STORAGE=shared) antes do fork. Os workers herdam essas
+páginas por copy-on-write; como os buffers dos arrays não têm contadores de
+referência, a leitura não as copia e cada worker adicional custa pouca RSS.
+Prefira apontar CROP_DATA_PATH para o snapshot binário (crop_data.snapshot):
+os arrays são lidos direto do arquivo, sem os dicts temporários do JSON.
+Medição: python -m benchmarks.workers
+
+Atualização do dataset: apenas o master observa o arquivo. Quando uma nova
+versão é carregada, o master envia SIGHUP a si mesmo e o gunicorn substitui os
+workers gradualmente por novos forks que já enxergam a nova versão.
+
+Variáveis de ambiente:
+    BIND                      endereço (padrão 0.0.0.0:5000)
+    WEB_CONCURRENCY           número de workers (padrão 2 * CPUs + 1)
+    GUNICORN_THREADS          threads por worker (padrão 4)
+    DATASET_RELOAD_INTERVAL   intervalo de verificação do arquivo no master (padrão 30s)
+    CACHE_WARMUP              aquecimento de cache no master antes do fork (padrão sync; off desliga)
+"""
+import ctypes
+import gc
+import multiprocessing
+import os
+import signal
+
+os.environ.setdefault('DATASET_STORAGE', 'shared')
+os.environ.setdefault('DATASET_PRELOAD', 'sync')
+# Caches aquecidos no master são herdados pelos workers
+os.environ.setdefault('CACHE_WARMUP', 'sync')
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+
+
+def _release_free_memory():
+    # Devolver ao SO o heap liberado pelo parse do JSON antes do fork (glibc)
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def _recycle_workers(snapshot):
+    # Executado no master: aquecer os caches da nova versão, congelar e trocar os workers
+    if os.environ['CACHE_WARMUP'] != 'off':
+        from app import app
+        from warmup import warm_caches
+        warm_caches(app)
+    gc.collect()
+    gc.freeze()
+    _release_free_memory()
+    os.kill(os.getpid(), signal.SIGHUP)
+
+
+def when_ready(server):
+    from dataset import dataset
+
+    snapshot = dataset.current()
+    dataset.on_swap = _recycle_workers
+    # Objetos existentes vão para a geração permanente: o GC dos workers não
+    # escreve nos cabeçalhos deles e as páginas continuam compartilhadas
+    gc.collect()
+    gc.freeze()
+    _release_free_memory()
+    size = f", {snapshot.nbytes / 1024 / 1024:.1f} MB em arrays" if hasattr(snapshot, 'nbytes') else ''
+    server.log.info(f"Dataset {snapshot.version} carregado no master ({len(snapshot.crops)} culturas{size})")
+
+
+def post_fork(server, worker):
+    from dataset import dataset
+
+    # O master observa o arquivo; os workers apenas leem o snapshot herdado
+    dataset.reload_interval = 0
+    dataset.on_swap = None
@@ -0,0 +1,86 @@
+import functools
+import hashlib
+import logging
+import os
+
+from flask import current_app, request
+
+from dataset import dataset
+from metrics import record_cache_access
+
+logger = logging.getLogger(__name__)
+
+# Tempo que navegadores/proxies podem reutilizar uma resposta sem revalidar
+API_CACHE_MAX_AGE = int(os.environ.get('API_CACHE_MAX_AGE', '60'))
+
+# Respostas de erro ({'success': False}) são pequenas; só essas são inspecionadas
+ERROR_PROBE_BYTES = 4096
+
+
+def data_version():
+    """Version of the data behind the API: snapshot hash, or the last import for the db backend"""
+    if current_app.config.get('DATA_BACKEND') == 'db':
+        from data_processor import get_data_version
+        return get_data_version()
+    return dataset.current().version
+
+
+def request_etag(version, vary_accept=False):
+    """Strong ETag for the current URL (path and query) under a data version"""
+    parts = [version, request.path]
+    parts.extend(f'{key}={value}' for key, value in sorted(request.args.items(multi=True)))
+    if vary_accept:
+        parts.append(request.headers.get('Accept', ''))
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()[:32]
+
+
+def _is_error_payload(response):
+    if not response.is_json or (response.content_length or 0) > ERROR_PROBE_BYTES:
+        return False
+    payload = response.get_json(silent=True)
+    return isinstance(payload, dict) and payload.get('success') is False
+
+
+def _set_cache_headers(response, etag, max_age, vary_accept):
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    if vary_accept:
+        response.vary.add('Accept')
+
+
+def dataset_cached(max_age=None, vary_accept=False, extra_version=None):
+    """Cache-Control and a versioned strong ETag; answers 304 before the view runs
+
+    ``extra_version`` returns the version of any other input of the view (e.g. geometry files).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # Respostas de POST dependem do corpo, que não entra no ETag
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+            try:
+                version = data_version()
+                if extra_version is not None:
+                    version = f'{version}:{extra_version()}'
+            except Exception as e:
+                logger.warning(f"Versão dos dados indisponível, resposta sem cache: {e}")
+                return view(*args, **kwargs)
+
+            etag = request_etag(version, vary_accept)
+            age = API_CACHE_MAX_AGE if max_age is None else max_age
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+                record_cache_access('http_conditional', not_modified)
+                if not_modified:
+                    response = current_app.response_class(status=304)
+                    _set_cache_headers(response, etag, age, vary_accept)
+                    return response
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not _is_error_payload(response):
+                _set_cache_headers(response, etag, age, vary_accept)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,114 @@
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Indicadores por município; os dois quocientes locacionais dependem de uma cultura
+MUNICIPALITY_INDICATORS = ('shannon', 'hhi', 'dominant_share', 'crop_count')
+CROP_INDICATORS = ('location_quotient', 'state_location_quotient')
+INDICATORS = MUNICIPALITY_INDICATORS + CROP_INDICATORS
+
+TOTAL_SUFFIX = ' Total'
+
+
+def component_crops(crops):
+    """Crops already counted in an IBGE subtotal ('Café (em grão) Arábica' in '... Total')"""
+    prefixes = [crop_name[:-len(TOTAL_SUFFIX)] for crop_name in crops if crop_name.endswith(TOTAL_SUFFIX)]
+    return {
+        crop_name for crop_name in crops
+        if not crop_name.endswith(TOTAL_SUFFIX) and any(crop_name.startswith(prefix) for prefix in prefixes)
+    }
+
+
+class CropIndicators:
+    """Diversity and specialization indices from the municipality x crop area matrix
+
+    shannon          -sum(p ln p) sobre as participações das culturas na área do município
+    hhi              Herfindahl-Hirschman, sum(p^2): 1 = monocultura
+    dominant_*       cultura de maior área e sua participação
+    location_quotient        (a_mc / A_m) / (A_c / A), versus o Brasil
+    state_location_quotient  o mesmo, versus a UF do município
+
+    Componentes de subtotais do IBGE (Café Arábica/Canephora) ficam fora das
+    áreas totais e da diversidade para não contar a mesma área duas vezes.
+    """
+
+    def __init__(self, table):
+        started = time.perf_counter()
+        self.table = table
+        count, crop_count = len(table.codes), len(table.crops)
+
+        matrix = np.zeros((count, crop_count))
+        matrix[table.rows, table.crop_ids] = table.areas
+        components = component_crops(table.crops)
+        counted = np.array([crop_name not in components for crop_name in table.crops], dtype=bool)
+        totals = matrix[:, counted].sum(axis=1)
+        producing = totals > 0
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shares = np.where(producing[:, None], matrix / totals[:, None], 0)
+            counted_shares = np.where(counted, shares, 0)
+            self.shannon = np.abs(np.where(counted_shares > 0, counted_shares * np.log(counted_shares), 0).sum(axis=1))
+            self.hhi = (counted_shares ** 2).sum(axis=1)
+            self.crop_count = (matrix[:, counted] > 0).sum(axis=1)
+            self.dominant = np.where(producing, counted_shares.argmax(axis=1), -1)
+            self.dominant_share = counted_shares.max(axis=1) if crop_count else np.zeros(count)
+
+            national_shares = matrix.sum(axis=0) / totals.sum()
+            self.location_quotient = np.where(national_shares > 0, shares / national_shares, np.nan).astype(np.float32)
+
+            states, state_index = np.unique(table.states, return_inverse=True)
+            state_matrix = np.zeros((len(states), crop_count))
+            np.add.at(state_matrix, state_index, matrix)
+            state_totals = np.bincount(state_index, weights=totals, minlength=len(states))
+            state_shares = state_matrix / state_totals[:, None]
+            self.state_location_quotient = np.where(
+                state_shares[state_index] > 0, shares / state_shares[state_index], np.nan
+            ).astype(np.float32)
+
+        self.producing = producing
+        logger.info(f"Indicadores de diversidade {table.version} calculados em "
+                    f"{time.perf_counter() - started:.2f}s ({count} municípios x {crop_count} culturas)")
+
+    def values(self, indicator, crop_name=None):
+        """Indicator value per municipality (table order); NaN where undefined"""
+        if indicator in CROP_INDICATORS:
+            values = getattr(self, indicator)[:, self.table.crop_position[crop_name]].astype(np.float64)
+        else:
+            values = getattr(self, indicator).astype(np.float64)
+        return np.where(self.producing, values, np.nan)
+
+    def municipality(self, position):
+        """All municipality-level indicators of one table position"""
+        dominant = int(self.dominant[position])
+        return {
+            'shannon': float(self.shannon[position]),
+            'hhi': float(self.hhi[position]),
+            'crop_count': int(self.crop_count[position]),
+            'dominant_crop': self.table.crops[dominant] if dominant >= 0 else None,
+            'dominant_share': float(self.dominant_share[position])
+        }
+
+    def layer(self, indicator, crop_name=None, states=None):
+        """{code: {municipality_name, state_code, value, dominant_crop}} for the map"""
+        table = self.table
+        values = self.values(indicator, crop_name)
+        mask = ~np.isnan(values)
+        if states:
+            mask &= np.isin(table.states, states)
+        positions = np.nonzero(mask)[0]
+        dominant = self.dominant[positions]
+        return {
+            code: {
+                'municipality_name': name,
+                'state_code': state,
+                'value': round(value, 6),
+                'dominant_crop': table.crops[crop_id] if crop_id >= 0 else None
+            }
+            for code, name, state, value, crop_id in zip(
+                table.codes[positions].tolist(), table.names[positions].tolist(),
+                table.states[positions].tolist(), values[positions].tolist(), dominant.tolist()
+            )
+        }
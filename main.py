@@ -1,4 +1,12 @@
-from app import app
+def __getattr__(name):
+    # Importação sob demanda (gunicorn main:app): processos spawn reimportam este
+    # módulo e não devem subir a aplicação (ver spatial_stats)
+    if name == 'app':
+        from app import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
+    from app import app
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,247 @@
+"""Per-process memory accounting and a shared budget for the in-memory caches.
+
+Estruturas registradas (dataset, índice de geometrias, grafo, geometria dos
+tiles) são medidas com deep_sizeof uma vez por objeto. Cada VersionedCache
+registra o tamanho e o custo de cálculo de suas entradas; quando o total passa
+de MEMORY_BUDGET_MB, saem primeiro as entradas de menor prioridade
+GreedyDual-Size (relógio + segundos de cálculo / MB): baratas de refazer, grandes
+e pouco usadas. Buffers temporários (planilhas exportadas) entram no total
+enquanto a resposta está sendo enviada.
+
+Para investigar vazamentos em workers de longa duração, start_tracing() guarda
+um snapshot do tracemalloc e leak_report() mostra o que cresceu desde então.
+
+Variáveis de ambiente:
+    MEMORY_BUDGET_MB            orçamento por processo (padrão 1024; 0 só contabiliza)
+    MEMORY_TRACEMALLOC_FRAMES   quadros guardados por alocação no tracemalloc (padrão 10)
+"""
+import io
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+import types
+
+import numpy as np
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 0 desliga a remoção por orçamento (a contabilidade continua)
+MEMORY_BUDGET_BYTES = int(float(os.environ.get('MEMORY_BUDGET_MB', '1024')) * 1024 * 1024)
+TRACEMALLOC_FRAMES = int(os.environ.get('MEMORY_TRACEMALLOC_FRAMES', '10'))
+
+# Tipos que não pertencem à estrutura medida (código, módulos, sincronização)
+_OPAQUE_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+                 types.CodeType, type(threading.Lock()), threading.Thread, threading.Event)
+
+
+def deep_sizeof(obj, exclude=()):
+    """Bytes reachable from obj (containers, object attributes, numpy buffers), each object counted once"""
+    seen = set(exclude)
+    total = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        if isinstance(current, _OPAQUE_TYPES):
+            continue
+        total += sys.getsizeof(current)
+
+        if isinstance(current, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        if isinstance(current, np.ndarray):
+            # getsizeof já inclui o buffer próprio; visões apontam para a base
+            if current.base is not None:
+                stack.append(current.base)
+            if current.dtype == object:
+                stack.extend(current.ravel().tolist())
+            continue
+        if isinstance(current, io.BytesIO):
+            with current.getbuffer() as view:
+                total += view.nbytes
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+            continue
+        if isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+            continue
+        attributes = getattr(current, '__dict__', None)
+        if attributes is not None:
+            stack.append(attributes)
+        for slot in getattr(type(current), '__slots__', ()):
+            if hasattr(current, slot):
+                stack.append(getattr(current, slot))
+    return total
+
+
+class MemoryBudget:
+    """Registry of measured structures and caches, with cost-aware eviction across caches"""
+
+    def __init__(self, limit=MEMORY_BUDGET_BYTES):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._structures = {}
+        self._measured = {}
+        self._caches = []
+        self._transient = {}
+        # Relógio do GreedyDual-Size: prioridade da última entrada removida
+        self.clock = 0.0
+        self._tracemalloc_baseline = None
+
+    def register(self, name, getter):
+        """Long-lived structure returned by getter() (None while not loaded)"""
+        self._structures[name] = getter
+
+    def register_cache(self, cache):
+        with self._lock:
+            self._caches.append(cache)
+
+    def priority(self, size, cost):
+        return self.clock + cost / max(size / (1024 * 1024), 0.001)
+
+    def structure_sizes(self, refresh=False):
+        """{name: bytes} of the registered structures; re-measured only when the object changes"""
+        sizes = {}
+        for name, getter in list(self._structures.items()):
+            obj = getter()
+            if obj is None:
+                continue
+            measured = self._measured.get(name)
+            if refresh or measured is None or measured[0] is not obj:
+                measured = self._measured[name] = (obj, deep_sizeof(obj))
+            sizes[name] = measured[1]
+        return sizes
+
+    def root_ids(self):
+        """ids of the registered structures and cached values, excluded when sizing a new entry"""
+        ids = {id(measured[0]) for measured in self._measured.values()}
+        for cache in list(self._caches):
+            ids.update(cache.value_ids())
+        return ids
+
+    def reserve(self, name, size):
+        """Account a temporary buffer; returns the function that releases it"""
+        with self._lock:
+            self._transient[name] = self._transient.get(name, 0) + size
+        self.enforce()
+        released = []
+
+        def release():
+            if not released:
+                released.append(True)
+                with self._lock:
+                    self._transient[name] -= size
+
+        return release
+
+    def buffer(self, name, data):
+        """BytesIO over data, accounted under name until it is closed (e.g. by send_file after sending)"""
+        return _AccountedBuffer(data, self.reserve(name, len(data)))
+
+    def enforce(self):
+        """Evict the lowest-priority cache entries until the process fits in the budget"""
+        if self.limit <= 0:
+            return
+        # Medir estruturas novas fora do lock (o dataset leva centenas de ms)
+        structures = sum(self.structure_sizes().values())
+        with self._lock:
+            excess = (structures + sum(cache.nbytes for cache in self._caches)
+                      + sum(self._transient.values()) - self.limit)
+            while excess > 0:
+                candidates = [(entry, cache) for cache in self._caches for entry in [cache.lowest_priority()] if entry]
+                if not candidates:
+                    logger.warning(f"Orçamento de memória excedido em {excess / 1024 / 1024:.1f} MB "
+                                   f"sem entradas de cache para remover")
+                    break
+                (priority, key, size), cache = min(candidates, key=lambda candidate: candidate[0][0])
+                if cache.evict(key):
+                    self.clock = max(self.clock, priority)
+                    excess -= size
+                    metrics.inc('memory_evictions_total', {'cache': cache.name},
+                                help_text='Cache entries evicted to stay within the memory budget')
+                    metrics.inc('memory_evicted_bytes_total', {'cache': cache.name}, value=size,
+                                help_text='Bytes evicted to stay within the memory budget')
+
+    def report(self, refresh=False):
+        """Breakdown for the admin endpoint; also refreshes the memory gauges"""
+        structures = self.structure_sizes(refresh)
+        caches = [cache.memory_stats() for cache in list(self._caches)]
+        with self._lock:
+            transient = dict(self._transient)
+        total = sum(structures.values()) + sum(cache['bytes'] for cache in caches) + sum(transient.values())
+
+        for name, size in structures.items():
+            metrics.set_gauge('memory_structure_bytes', size, {'structure': name},
+                              help_text='Measured size of registered in-memory structures')
+        for cache in caches:
+            metrics.set_gauge('memory_cache_bytes', cache['bytes'], {'cache': cache['name']},
+                              help_text='Measured size of the entries of each cache')
+        metrics.set_gauge('memory_accounted_bytes', total, help_text='Total accounted memory of the process')
+
+        return {
+            'budget_bytes': self.limit,
+            'accounted_bytes': total,
+            'rss_bytes': resident_set_size(),
+            'structures': [{'name': name, 'bytes': size} for name, size in sorted(structures.items())],
+            'caches': sorted(caches, key=lambda cache: cache['bytes'], reverse=True),
+            'transient': [{'name': name, 'bytes': size} for name, size in sorted(transient.items())]
+        }
+
+    def start_tracing(self, frames=TRACEMALLOC_FRAMES):
+        """Start tracemalloc (if needed) and keep the baseline snapshot for leak_report()"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._tracemalloc_baseline = tracemalloc.take_snapshot()
+
+    def stop_tracing(self):
+        self._tracemalloc_baseline = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def leak_report(self, limit=25):
+        """Allocation sites that grew the most since start_tracing(), or None when not tracing"""
+        if self._tracemalloc_baseline is None or not tracemalloc.is_tracing():
+            return None
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        differences = snapshot.compare_to(self._tracemalloc_baseline, 'lineno')
+        return [
+            {
+                'location': str(difference.traceback[0]),
+                'size_diff': difference.size_diff,
+                'size': difference.size,
+                'count_diff': difference.count_diff
+            }
+            for difference in differences[:limit]
+        ]
+
+
+class _AccountedBuffer(io.BytesIO):
+    def __init__(self, data, release):
+        super().__init__(data)
+        self._release = release
+
+    def close(self):
+        self._release()
+        super().close()
+
+
+def resident_set_size():
+    """Current RSS in bytes (Linux /proc), or None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+budget = MemoryBudget()
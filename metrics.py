@@ -0,0 +1,216 @@
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0.01'))
+MAX_STORED_PROFILES = 20
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# Chave do environ WSGI das requisições internas do aquecimento de cache; não vem de
+# cabeçalhos HTTP, então clientes externos não conseguem marcá-la
+WARMUP_ENVIRON_KEY = 'geografico.warmup'
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and histograms exported as Prometheus text"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+
+    def _key(self, name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def inc(self, name, labels=None, value=1, help_text=None):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            if help_text:
+                self._help[name] = help_text
+
+    def set_gauge(self, name, value, labels=None, help_text=None):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+            if help_text:
+                self._help[name] = help_text
+
+    def observe(self, name, value, labels=None, buckets=LATENCY_BUCKETS, help_text=None):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+            if help_text:
+                self._help[name] = help_text
+
+    def counter_value(self, name, labels=None):
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    @staticmethod
+    def _format_labels(labels, extra=None):
+        pairs = list(labels) + list(extra or [])
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{label}="{_escape_label_value(value)}"' for label, value in pairs) + '}'
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted(
+                (key, (h.buckets, list(h.counts), h.sum, h.count)) for key, h in self._histograms.items()
+            )
+            help_texts = dict(self._help)
+
+        lines = []
+        declared = set()
+
+        def declare(name, metric_type):
+            if name in declared:
+                return
+            declared.add(name)
+            if name in help_texts:
+                lines.append(f'# HELP {name} {help_texts[name]}')
+            lines.append(f'# TYPE {name} {metric_type}')
+
+        for (name, labels), value in counters:
+            declare(name, 'counter')
+            lines.append(f'{name}{self._format_labels(labels)} {value}')
+
+        for (name, labels), value in gauges:
+            declare(name, 'gauge')
+            lines.append(f'{name}{self._format_labels(labels)} {value}')
+
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            declare(name, 'histogram')
+            for bound, bucket_count in zip(buckets, counts):
+                lines.append(f'{name}_bucket{self._format_labels(labels, [("le", bound)])} {bucket_count}')
+            lines.append(f'{name}_bucket{self._format_labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{self._format_labels(labels)} {total}')
+            lines.append(f'{name}_count{self._format_labels(labels)} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+# Perfis cProfile recentes, por id (apenas administradores)
+PROFILES = OrderedDict()
+PROFILES_LOCK = threading.Lock()
+
+
+def is_admin_request():
+    """True when the request carries the configured ADMIN_TOKEN"""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def should_log(log, level=logging.DEBUG, sample_rate=None):
+    """Level-gated, sampled logging for hot paths"""
+    if not log.isEnabledFor(level):
+        return False
+    rate = LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+    return rate >= 1 or random.random() < rate
+
+
+def is_warmup_request():
+    """True inside the internal requests made by the cache warm-up"""
+    return has_request_context() and bool(request.environ.get(WARMUP_ENVIRON_KEY))
+
+
+def record_cache_access(cache_name, hit):
+    if is_warmup_request():
+        return  # as falhas do aquecimento distorceriam a taxa de acerto herdada pelos workers
+    metrics.inc('cache_requests_total', {'cache': cache_name, 'result': 'hit' if hit else 'miss'},
+                help_text='Cache lookups by cache and result')
+
+
+def get_profile(profile_id):
+    with PROFILES_LOCK:
+        return PROFILES.get(profile_id)
+
+
+def _before_request():
+    if is_warmup_request():
+        return  # sem metrics_started, _after_request não registra a requisição
+    g.metrics_started = time.perf_counter()
+    if request.headers.get('X-Profile') and is_admin_request():
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def _after_request(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(40)
+        profile_id = uuid.uuid4().hex[:12]
+        with PROFILES_LOCK:
+            PROFILES[profile_id] = output.getvalue()
+            while len(PROFILES) > MAX_STORED_PROFILES:
+                PROFILES.popitem(last=False)
+        response.headers['X-Profile-Id'] = profile_id
+
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    labels = {'endpoint': endpoint, 'method': request.method, 'status': str(response.status_code)}
+    metrics.observe('http_request_duration_seconds', time.perf_counter() - started, labels,
+                    help_text='Request latency by endpoint')
+    metrics.inc('http_requests_total', labels, help_text='Requests by endpoint and status')
+
+    size = response.calculate_content_length()
+    if size is not None:
+        metrics.observe('http_response_size_bytes', size, {'endpoint': endpoint}, buckets=SIZE_BUCKETS,
+                        help_text='Response body size by endpoint')
+    return response
+
+
+def init_app(app):
+    """Register the request instrumentation hooks"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
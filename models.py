@@ -1,18 +1,40 @@
 from app import db
 from datetime import datetime
 
-class CropData(db.Model):
+class Municipality(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(10), nullable=False, unique=True)
+    name = db.Column(db.String(100), nullable=False)
+    state_code = db.Column(db.String(2), nullable=False, index=True)
+    # Calculado na carga (dataset.is_valid_municipality) para evitar length() nas consultas
+    is_valid = db.Column(db.Boolean, nullable=False, default=False)
+
+    def __repr__(self):
+        return f'<Municipality {self.code} - {self.name} ({self.state_code})>'
+
+class Crop(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    municipality_code = db.Column(db.String(10), nullable=False)
-    municipality_name = db.Column(db.String(100), nullable=False)
-    state_code = db.Column(db.String(2), nullable=False)
-    crop_name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f'<Crop {self.name}>'
+
+class CropData(db.Model):
+    # Tabela fato: apenas chaves inteiras e a medida
+    __table_args__ = (
+        db.Index('ix_crop_data_municipality_crop', 'municipality_id', 'crop_id'),
+    )
+
+    crop_id = db.Column(db.Integer, db.ForeignKey('crop.id'), primary_key=True)
+    municipality_id = db.Column(db.Integer, db.ForeignKey('municipality.id'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True, default=2023)
     harvested_area = db.Column(db.Float, nullable=False)
-    year = db.Column(db.Integer, nullable=False, default=2023)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    crop = db.relationship('Crop')
+    municipality = db.relationship('Municipality')
 
     def __repr__(self):
-        return f'<CropData {self.municipality_name} - {self.crop_name}>'
+        return f'<CropData {self.municipality_id} - {self.crop_id} ({self.year})>'
 
 class ProcessingLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
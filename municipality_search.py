@@ -0,0 +1,127 @@
+"""Autocomplete index of municipality names: word prefixes plus trigrams for typos.
+
+Nomes e consultas passam por fold() (minúsculas, sem acentos nem pontuação).
+Ordem do resultado:
+    0  nome idêntico à consulta
+    1  nome começa com a consulta ("sao jo" -> "São José")
+    2  alguma palavra do nome começa com a consulta ("verde" -> "Rio Verde")
+    3  trigramas em comum (similaridade do pg_trgm), tolerando erros de digitação
+Dentro das classes 0-2 vencem os nomes mais curtos; na classe 3, os mais semelhantes.
+"""
+import bisect
+import time
+
+import numpy as np
+
+from chatbot import fold
+
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+# Similaridade mínima de trigramas para consultas que não casam por prefixo
+TRIGRAM_THRESHOLD = 0.3
+TRIGRAM_MIN_QUERY = 3
+
+
+def trigrams(folded):
+    """Trigrams of each word padded like pg_trgm ('  rio ', ...)"""
+    grams = set()
+    for word in folded.split():
+        padded = f'  {word} '
+        grams.update(padded[position:position + 3] for position in range(len(padded) - 2))
+    return grams
+
+
+class MunicipalitySearch:
+    """Prefix and trigram index over (code, name, state, centroid) records"""
+
+    def __init__(self, version, records):
+        started = time.perf_counter()
+        self.version = version
+        records = sorted(records, key=lambda record: (fold(record[1]), record[0]))
+        self.codes = [record[0] for record in records]
+        self.names = [record[1] for record in records]
+        self.states = np.array([record[2] or '' for record in records], dtype=str)
+        self.centroids = [record[3] for record in records]
+        self.folded = [fold(name) for name in self.names]
+        self.lengths = np.array([len(folded) for folded in self.folded])
+
+        # Sufixos do nome a partir de cada início de palavra, ordenados para busca binária
+        keys = []
+        for position, folded in enumerate(self.folded):
+            words = folded.split()
+            for start in range(len(words)):
+                keys.append((' '.join(words[start:]), position, start > 0))
+        keys.sort()
+        self._prefix_keys = [key[0] for key in keys]
+        self._prefix_entries = [(key[1], key[2]) for key in keys]
+
+        postings = {}
+        gram_counts = np.zeros(len(records), dtype=np.int64)
+        for position, folded in enumerate(self.folded):
+            grams = trigrams(folded)
+            gram_counts[position] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+        self._postings = {gram: np.array(positions, dtype=np.int64) for gram, positions in postings.items()}
+        self._gram_counts = gram_counts
+        self.build_seconds = time.perf_counter() - started
+
+    def _prefix_matches(self, folded):
+        """{position: class} for names with a word starting with the query"""
+        matches = {}
+        position = bisect.bisect_left(self._prefix_keys, folded)
+        while position < len(self._prefix_keys) and self._prefix_keys[position].startswith(folded):
+            record, inner = self._prefix_entries[position]
+            if inner:
+                matches.setdefault(record, 2)
+            else:
+                matches[record] = 0 if self._prefix_keys[position] == folded else 1
+            position += 1
+        return matches
+
+    def _trigram_scores(self, folded):
+        """Trigram similarity of every record (shared / union), 0 where nothing is shared"""
+        grams = trigrams(folded)
+        lists = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not lists:
+            return None
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.codes))
+        return shared / (len(grams) + self._gram_counts - shared)
+
+    def search(self, query, states=None, limit=SEARCH_DEFAULT_LIMIT):
+        """Ranked [{municipality_code, municipality_name, state_code, centroid, score}]"""
+        folded = fold(query)
+        if not folded:
+            return []
+        allowed = np.isin(self.states, states) if states else None
+
+        prefix = self._prefix_matches(folded)
+        ranked = sorted(
+            (match_class, self.lengths[position], position) for position, match_class in prefix.items()
+            if allowed is None or allowed[position]
+        )
+        results = [(position, match_class, 1.0) for match_class, _, position in ranked[:limit]]
+
+        if len(results) < limit and len(folded) >= TRIGRAM_MIN_QUERY:
+            scores = self._trigram_scores(folded)
+            if scores is not None:
+                candidates = scores >= TRIGRAM_THRESHOLD
+                if allowed is not None:
+                    candidates &= allowed
+                candidates[list(prefix)] = False
+                positions = np.nonzero(candidates)[0]
+                # Mais semelhantes primeiro; empate pelo nome mais curto
+                order = np.lexsort((self.lengths[positions], -scores[positions]))[:limit - len(results)]
+                results.extend((int(position), 3, float(scores[position])) for position in positions[order])
+
+        return [
+            {
+                'municipality_code': self.codes[position],
+                'municipality_name': self.names[position],
+                'state_code': str(self.states[position]) or None,
+                'centroid': self.centroids[position],
+                'match': match_class,
+                'score': round(score, 4)
+            }
+            for position, match_class, score in results
+        ]
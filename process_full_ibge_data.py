@@ -1,12 +1,41 @@
 
 import pandas as pd
+import argparse
 import json
 import os
+import re
+import time
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from snapshot_format import write_binary_snapshot
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Variáveis da PAM/IBGE reconhecidas pelo nome do arquivo ou da planilha; a primeira
+# que casar vale, então 'valor da produção' precisa vir antes de 'produção'
+VARIABLE_PATTERNS = [
+    ('harvested_area', ('HECTARES COLHIDOS', 'AREA COLHIDA', 'ÁREA COLHIDA')),
+    ('planted_area', ('AREA PLANTADA', 'ÁREA PLANTADA', 'HECTARES PLANTADOS')),
+    ('value', ('VALOR DA PRODUCAO', 'VALOR DA PRODUÇÃO', 'VALOR')),
+    ('production', ('QUANTIDADE PRODUZIDA', 'PRODUCAO', 'PRODUÇÃO')),
+]
+
+DEFAULT_VARIABLE = 'harvested_area'
+
+def write_json_atomic(data, path, **dump_options):
+    """Dump JSON to a temporary file in the same directory and os.replace it over path"""
+    # Mesmo diretório: o os.replace é atômico e o servidor nunca lê um arquivo pela metade
+    tmp_path = f'{path}.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, **dump_options)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
 def process_complete_ibge_data():
     """Process the complete IBGE Excel file with all municipalities and crops"""
     
@@ -121,8 +150,7 @@ def process_complete_ibge_data():
         
         # Save to JSON file
         os.makedirs('data', exist_ok=True)
-        with open('data/crop_data_static.json', 'w', encoding='utf-8') as f:
-            json.dump(complete_crop_data, f, ensure_ascii=False, indent=2)
+        write_json_atomic(complete_crop_data, 'data/crop_data_static.json', indent=2)
         
         logger.info("=" * 60)
         logger.info("PROCESSAMENTO COMPLETO!")
@@ -161,13 +189,233 @@ def process_complete_ibge_data():
         logger.error(f"Erro no processamento: {e}")
         return {"success": False, "error": str(e)}
 
+def detect_year_and_variable(*labels):
+    """Detect reference year and IBGE variable from file/sheet names"""
+    year = None
+    variable = None
+    for label in labels:
+        if not label:
+            continue
+        upper_label = label.upper()
+        if year is None:
+            # Ano isolado: ids numéricos longos ('..._1752980032040') não contam
+            match = re.search(r'(?<!\d)(?:19|20)\d{2}(?!\d)', upper_label)
+            if match:
+                year = int(match.group(0))
+        if variable is None:
+            for variable_name, patterns in VARIABLE_PATTERNS:
+                if any(pattern in upper_label for pattern in patterns):
+                    variable = variable_name
+                    break
+    return year, variable or DEFAULT_VARIABLE
+
+
+def parse_ibge_sheet(excel_path, sheet_name):
+    """Parse a single IBGE sheet into {crop: {code: value}} (runs in a worker process)"""
+    started = time.perf_counter()
+    year, variable = detect_year_and_variable(os.path.basename(excel_path), sheet_name)
+
+    df = pd.read_excel(excel_path, sheet_name=sheet_name)
+    result = {
+        "path": excel_path,
+        "sheet": sheet_name,
+        "year": year,
+        "variable": variable,
+        "municipalities": {},
+        "crops": {},
+        "records": 0,
+    }
+
+    # Planilhas de notas/metadados não têm o cabeçalho CÓDIGO IBGE / MUNICÍPIO - UF
+    if len(df.columns) < 3 or 'CÓDIGO' not in str(df.columns[0]).upper():
+        result["skipped"] = True
+        result["elapsed"] = time.perf_counter() - started
+        return result
+
+    codes = pd.to_numeric(df.iloc[:, 0], errors='coerce')
+    info = df.iloc[:, 1].astype(str).str.strip()
+    valid_rows = codes.notna() & df.iloc[:, 1].notna()
+    codes = codes[valid_rows].astype('int64').astype(str).str.zfill(7)
+    info = info[valid_rows]
+
+    # Extrair nome do município e UF do formato "MUNICÍPIO (UF)"
+    parts = info.str.extract(r'^(.*) \((\w{2})\)$')
+    names = parts[0].fillna(info).str.strip()
+    states = parts[1].fillna('XX')
+
+    for code, name, state in zip(codes, names, states):
+        result["municipalities"][code] = {"municipality_name": name, "state_code": state}
+
+    for crop_name in df.columns[2:]:
+        column = df.loc[valid_rows, crop_name]
+        if not pd.api.types.is_numeric_dtype(column):
+            column = column.astype(str).str.replace(',', '.').str.replace(' ', '')
+        values = pd.to_numeric(column, errors='coerce')
+        mask = values > 0
+        if not mask.any():
+            continue
+        result["crops"][crop_name] = dict(zip(codes[mask], values[mask].astype(float)))
+        result["records"] += int(mask.sum())
+
+    result["elapsed"] = time.perf_counter() - started
+    return result
+
+
+def ibge_workbooks(input_dir):
+    """Excel workbooks of a directory, in name order (lock files excluded)"""
+    return [
+        os.path.join(input_dir, file_name) for file_name in sorted(os.listdir(input_dir))
+        if file_name.lower().endswith(('.xlsx', '.xlsm')) and not file_name.startswith('~$')
+    ]
+
+
+def list_ibge_sheets(input_dir):
+    """List (workbook, sheet) pairs for every Excel file in a directory"""
+    from openpyxl import load_workbook
+
+    tasks = []
+    for excel_path in ibge_workbooks(input_dir):
+        workbook = load_workbook(excel_path, read_only=True)
+        try:
+            for sheet_name in workbook.sheetnames:
+                tasks.append((excel_path, sheet_name))
+        finally:
+            workbook.close()
+    return tasks
+
+
+def merge_sheet_results(results):
+    """Merge parsed sheets into one consolidated snapshot"""
+    municipalities = {}
+    series = {}
+
+    # Ordem determinística: arquivos mais recentes sobrescrevem duplicatas
+    for result in sorted(results, key=lambda r: (r["path"], r["sheet"])):
+        if result.get("skipped"):
+            continue
+        municipalities.update(result["municipalities"])
+        year_key = str(result["year"] or 'desconhecido')
+        year_series = series.setdefault(result["variable"], {}).setdefault(year_key, {})
+        duplicated = [crop_name for crop_name in result["crops"] if crop_name in year_series]
+        if duplicated:
+            logger.warning(f"{len(duplicated)} culturas de {result['variable']}/{year_key} sobrescritas por {result['path']}")
+        for crop_name, values in result["crops"].items():
+            year_series.setdefault(crop_name, {}).update(values)
+
+    return {"municipalities": municipalities, "series": series}
+
+
+def build_static_crop_data(consolidated, variable=DEFAULT_VARIABLE, year=None):
+    """Build the {crop: {code: {...}}} structure served by routes.py"""
+    years = consolidated["series"].get(variable, {})
+    if not years:
+        return {}
+    if year is None:
+        year = max(years, key=lambda y: int(y) if y.isdigit() else -1)
+
+    municipalities = consolidated["municipalities"]
+    static_data = {}
+    for crop_name, values in years[str(year)].items():
+        static_data[crop_name] = {
+            code: {
+                "municipality_name": municipalities.get(code, {}).get("municipality_name", "Unknown"),
+                "state_code": municipalities.get(code, {}).get("state_code", "XX"),
+                "harvested_area": area
+            }
+            for code, area in values.items()
+        }
+    return static_data
+
+
+def process_ibge_directory(input_dir, output_dir='data', workers=None, write_snapshot=True):
+    """Parse every IBGE workbook/sheet in a directory using a process pool"""
+    started = time.perf_counter()
+    tasks = list_ibge_sheets(input_dir)
+    if not tasks:
+        logger.error(f"Nenhuma planilha do IBGE encontrada em {input_dir}")
+        return {"success": False, "error": f"Nenhuma planilha encontrada em {input_dir}"}
+
+    workers = workers or os.cpu_count() or 1
+    logger.info(f"Processando {len(tasks)} planilhas com {workers} processos")
+
+    results = []
+    errors = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(parse_ibge_sheet, path, sheet): (path, sheet) for path, sheet in tasks}
+        for future in as_completed(futures):
+            path, sheet = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Erro em {path} [{sheet}]: {e}")
+                errors.append({"path": path, "sheet": sheet, "error": str(e)})
+                continue
+
+            results.append(result)
+            if result.get("skipped"):
+                logger.info(f"{os.path.basename(path)} [{sheet}]: ignorada ({result['elapsed']:.2f}s)")
+            else:
+                logger.info(
+                    f"{os.path.basename(path)} [{sheet}]: {result['variable']}/{result['year']} - "
+                    f"{result['records']} registros, {len(result['crops'])} culturas em {result['elapsed']:.2f}s"
+                )
+
+    consolidated = merge_sheet_results(results)
+    static_data = build_static_crop_data(consolidated)
+
+    os.makedirs(output_dir, exist_ok=True)
+    write_json_atomic(consolidated, os.path.join(output_dir, 'ibge_consolidated.json'), separators=(',', ':'))
+    error = None
+    if static_data:
+        write_json_atomic(static_data, os.path.join(output_dir, 'crop_data_static.json'), separators=(',', ':'))
+        if write_snapshot:
+            write_binary_snapshot(static_data, os.path.join(output_dir, 'crop_data.snapshot'))
+    else:
+        # O servidor só lê a área colhida: sem ela os arquivos atuais ficam como estão
+        error = f"Nenhuma série de {DEFAULT_VARIABLE} com dados; crop_data_static.json não foi gerado"
+        logger.error(error)
+
+    elapsed = time.perf_counter() - started
+    parsed = [r for r in results if not r.get("skipped")]
+    logger.info(f"Tempo total: {elapsed:.2f}s (soma dos workers: {sum(r['elapsed'] for r in results):.2f}s)")
+
+    return {
+        "success": not errors and error is None,
+        "error": error,
+        "sheets": len(parsed),
+        "errors": errors,
+        "records": sum(r["records"] for r in parsed),
+        "crops": len(static_data),
+        "unique_municipalities": len(consolidated["municipalities"]),
+        "timings": {f"{os.path.basename(r['path'])}[{r['sheet']}]": round(r["elapsed"], 3) for r in results},
+        "elapsed": elapsed
+    }
+
+
 if __name__ == "__main__":
-    result = process_complete_ibge_data()
-    if result["success"]:
-        print("\n✅ Processamento concluído com sucesso!")
-        print(f"📊 {result['municipalities']} municípios processados")
-        print(f"📈 {result['records']} registros válidos")
-        print(f"🌾 {result['crops']} culturas diferentes")
-        print(f"🏘️ {result['unique_municipalities']} municípios únicos")
+    parser = argparse.ArgumentParser(description="Processa planilhas do IBGE (PAM) em um snapshot consolidado")
+    parser.add_argument('--input-dir', help="Diretório com planilhas do IBGE (vários anos/variáveis)")
+    parser.add_argument('--output-dir', default='data', help="Diretório de saída dos snapshots")
+    parser.add_argument('--workers', type=int, default=None, help="Número de processos (padrão: todos os núcleos)")
+    args = parser.parse_args()
+
+    if args.input_dir:
+        result = process_ibge_directory(args.input_dir, args.output_dir, args.workers)
+        if result["success"]:
+            print("\n✅ Processamento concluído com sucesso!")
+            print(f"📄 {result['sheets']} planilhas em {result['elapsed']:.2f}s")
+            print(f"📈 {result['records']} registros válidos")
+            print(f"🌾 {result['crops']} culturas diferentes")
+            print(f"🏘️ {result['unique_municipalities']} municípios únicos")
+        else:
+            print(f"\n❌ Erro: {result.get('error') or result['errors']}")
     else:
-        print(f"\n❌ Erro: {result['error']}")
+        result = process_complete_ibge_data()
+        if result["success"]:
+            print("\n✅ Processamento concluído com sucesso!")
+            print(f"📊 {result['municipalities']} municípios processados")
+            print(f"📈 {result['records']} registros válidos")
+            print(f"🌾 {result['crops']} culturas diferentes")
+            print(f"🏘️ {result['unique_municipalities']} municípios únicos")
+        else:
+            print(f"\n❌ Erro: {result['error']}")
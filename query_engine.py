@@ -0,0 +1,197 @@
+"""Declarative filters over the CropTable, compiled to numpy masks.
+
+Filtro (JSON no POST ou parâmetros no GET de /api/query):
+    crops          nomes de culturas (aceita nomes semelhantes); padrão: todas
+    states/region  UFs ("MT,GO") ou uma grande região ("sul")
+    min_area       área colhida mínima (ha), inclusive
+    max_area       área colhida máxima (ha), inclusive
+    code_prefixes  prefixos do código IBGE ("51", "5201")
+    bbox           [lon_min, lat_min, lon_max, lat_max] sobre o centróide do município
+    sort           harvested_area, municipality_name, municipality_code, state_code ou crop;
+                   "-" no início para ordem decrescente (padrão "-harvested_area")
+    limit, offset  paginação (limit padrão 100)
+"""
+import json
+import os
+
+import numpy as np
+
+from dataset import REGION_STATES, STATE_NAMES, match_crop_name
+
+QUERY_DEFAULT_LIMIT = 100
+QUERY_MAX_LIMIT = int(os.environ.get('QUERY_MAX_LIMIT', '5000'))
+SORT_FIELDS = ('harvested_area', 'municipality_name', 'municipality_code', 'state_code', 'crop')
+
+
+class QueryError(ValueError):
+    """Invalid filter; the message is shown to the client"""
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(',') if item.strip()]
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def _as_number(params, key):
+    value = params.get(key)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise QueryError(f"'{key}' deve ser numérico")
+
+
+def _as_int(params, key, default, maximum=None):
+    value = params.get(key)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise QueryError(f"'{key}' deve ser inteiro")
+    if value < 0:
+        raise QueryError(f"'{key}' não pode ser negativo")
+    return min(value, maximum) if maximum is not None else value
+
+
+def normalize_query(params, crops):
+    """(filter, page) from raw parameters; the filter is canonical so equal queries share a plan"""
+    matched_crops = []
+    crop_values = params.get('crops')
+    for crop_name in (crop_values if isinstance(crop_values, list) else _as_list(crop_values)):
+        matched_crop = match_crop_name(crop_name, crops)
+        if matched_crop is None:
+            raise QueryError(f"Cultura não encontrada: {crop_name}")
+        matched_crops.append(matched_crop)
+
+    states = [state.upper() for state in _as_list(params.get('states'))]
+    region = params.get('region')
+    if region:
+        region_states = REGION_STATES.get(str(region).strip().lower().replace(' ', '-'))
+        if region_states is None:
+            raise QueryError(f"Região desconhecida: {region}")
+        states.extend(region_states)
+    unknown_states = [state for state in states if state not in STATE_NAMES]
+    if unknown_states:
+        raise QueryError(f"UF desconhecida: {', '.join(unknown_states)}")
+
+    prefixes = _as_list(params.get('code_prefixes'))
+    if any(not prefix.isdigit() or len(prefix) > 7 for prefix in prefixes):
+        raise QueryError("'code_prefixes' deve conter de 1 a 7 dígitos")
+
+    bbox = params.get('bbox')
+    if bbox not in (None, '', []):
+        try:
+            bbox = [float(value) for value in _as_list(bbox)]
+        except ValueError:
+            bbox = None
+        if not bbox or len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            raise QueryError("'bbox' deve ser [lon_min, lat_min, lon_max, lat_max]")
+    else:
+        bbox = None
+
+    sort = str(params.get('sort') or '-harvested_area').strip()
+    if sort.lstrip('-') not in SORT_FIELDS:
+        raise QueryError(f"'sort' deve ser um de: {', '.join(SORT_FIELDS)}")
+
+    query_filter = {
+        'crops': sorted(set(matched_crops)),
+        'states': sorted(set(states)),
+        'min_area': _as_number(params, 'min_area'),
+        'max_area': _as_number(params, 'max_area'),
+        'code_prefixes': sorted(set(prefixes)),
+        'bbox': bbox,
+        'sort': sort
+    }
+    page = {
+        'limit': _as_int(params, 'limit', QUERY_DEFAULT_LIMIT, QUERY_MAX_LIMIT),
+        'offset': _as_int(params, 'offset', 0)
+    }
+    return query_filter, page
+
+
+def query_key(query_filter):
+    return json.dumps(query_filter, sort_keys=True, ensure_ascii=False)
+
+
+class QueryPlan:
+    """Matching record indexes of a CropTable, already sorted, plus totals"""
+
+    def __init__(self, indices, total_area, municipality_count):
+        self.indices = indices
+        self.total_area = total_area
+        self.municipality_count = municipality_count
+
+
+def compile_query(table, query_filter, centroids=None):
+    """Evaluate a normalized filter with boolean masks over the table's record columns"""
+    if query_filter['crops']:
+        # Registros em ordem de cultura: cada cultura é uma fatia contígua
+        positions = [table.crop_position[crop_name] for crop_name in query_filter['crops']]
+        candidates = np.concatenate([
+            np.arange(table.crop_offsets[position], table.crop_offsets[position + 1]) for position in positions
+        ])
+    else:
+        candidates = np.arange(len(table.areas))
+
+    # Máscaras por município (poucos milhares) aplicadas aos registros via rows
+    municipality_mask = np.ones(len(table.codes), dtype=bool)
+    if query_filter['states']:
+        municipality_mask &= np.isin(table.states, query_filter['states'])
+    if query_filter['code_prefixes']:
+        prefix_mask = np.zeros(len(table.codes), dtype=bool)
+        for prefix in query_filter['code_prefixes']:
+            prefix_mask |= table.code_numbers // 10 ** (7 - len(prefix)) == int(prefix)
+        municipality_mask &= prefix_mask
+    if query_filter['bbox']:
+        lon, lat = centroids
+        min_lon, min_lat, max_lon, max_lat = query_filter['bbox']
+        with np.errstate(invalid='ignore'):
+            municipality_mask &= (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+
+    rows = table.rows[candidates]
+    areas = table.areas[candidates]
+    mask = municipality_mask[rows]
+    if query_filter['min_area'] is not None:
+        mask &= areas >= query_filter['min_area']
+    if query_filter['max_area'] is not None:
+        mask &= areas <= query_filter['max_area']
+    indices = candidates[mask]
+
+    field = query_filter['sort'].lstrip('-')
+    sort_values = {
+        'harvested_area': lambda: table.areas[indices],
+        'municipality_name': lambda: table.names[table.rows[indices]],
+        'municipality_code': lambda: table.code_numbers[table.rows[indices]],
+        'state_code': lambda: table.states[table.rows[indices]],
+        'crop': lambda: table.crop_ids[indices],
+    }[field]()
+    order = np.argsort(sort_values, kind='stable')
+    if query_filter['sort'].startswith('-'):
+        order = order[::-1]
+    indices = indices[order]
+
+    return QueryPlan(indices, float(table.areas[indices].sum()), int(len(np.unique(table.rows[indices]))))
+
+
+def query_rows(table, plan, offset, limit):
+    """One page of a plan as records"""
+    page = plan.indices[offset:offset + limit]
+    rows = table.rows[page]
+    return [
+        {
+            'crop': table.crops[crop_id],
+            'municipality_code': code,
+            'municipality_name': name,
+            'state_code': state,
+            'harvested_area': area
+        }
+        for crop_id, code, name, state, area in zip(
+            table.crop_ids[page].tolist(), table.codes[rows].tolist(), table.names[rows].tolist(),
+            table.states[rows].tolist(), table.areas[page].tolist()
+        )
+    ]
@@ -1,23 +1,198 @@
 import os
-from flask import Flask, render_template, jsonify, request, send_file
+from flask import Flask, render_template, jsonify, request, send_file, send_from_directory
+from werkzeug.security import safe_join
 import json
-import pandas as pd
+import heapq
+import mimetypes
+import logging
+import statistics
+import numpy as np
 from app import app
+from dataset import dataset, match_crop_name, VersionedCache, STATE_NAMES, REGION_STATES
+from data_processor import get_available_crops, get_crop_data_for_map, get_municipality_metadata, get_municipality_count
+from snapshot_format import layer_to_columns, pack_layer_columns
+from metrics import metrics, get_profile, is_admin_request, should_log
+from http_cache import dataset_cached, data_version
+from chatbot import QueryIndex, parse_query, fold
+from feature_index import build_feature_collection, get_feature_index
+from tile_renderer import renderer as tile_renderer, MAX_ZOOM
+from crop_table import CropTable
+from adjacency import get_adjacency, MAX_HOPS
+from spatial_stats import subgraph, spatial_autocorrelation, hotspot_class, hotspot_label, HOTSPOT_CLASSES
+from indicators import CropIndicators, INDICATORS, CROP_INDICATORS
+from crop_similarity import CropMixIndex, SIMILARITY_METRICS, SIMILAR_DEFAULT_K, SIMILAR_MAX_K
+from municipality_search import MunicipalitySearch, SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT
+from query_engine import QueryError, normalize_query, query_key, compile_query, query_rows
+from single_flight import SingleFlight, SingleFlightTimeout
+from memory_budget import budget
+from urllib.parse import quote
 import io
 
-# Load crop data
-def load_crop_data():
-    try:
-        with open('data/crop_data_static.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print("Arquivo crop_data_static.json não encontrado")
-        return {}
-    except Exception as e:
-        print(f"Erro ao carregar dados: {e}")
-        return {}
-
-CROP_DATA = load_crop_data()
+logger = logging.getLogger(__name__)
+
+# "json": snapshot em memória (padrão); "db": consultas indexadas no banco
+DATA_BACKEND = app.config.get('DATA_BACKEND', 'json')
+
+# Formatos compactos das camadas de cultura (negociados por ?format= ou Accept)
+COLUMNAR_MIMETYPE = 'application/vnd.geografico.columnar+json'
+BINARY_MIMETYPE = 'application/vnd.geografico.columnar'
+
+# Carregar o dataset na inicialização (sync/background/lazy); novas versões são trocadas em segundo plano
+if DATA_BACKEND != 'db':
+    dataset.preload(os.environ.get('DATASET_PRELOAD', 'background'))
+
+# Resultados derivados do dataset, invalidados automaticamente a cada nova versão
+DERIVED_CACHE = VersionedCache('derived')
+
+# Índices e respostas do chatbot, por versão dos dados (snapshot ou banco)
+CHATBOT_CACHE = VersionedCache('chatbot')
+CHATBOT_TOP_PRODUCERS = 10
+
+# Geometrias com valores da cultura, por (cultura, UFs) e versão dos dados + geometrias
+FEATURE_CACHE = VersionedCache('features', max_entries=int(os.environ.get('FEATURE_CACHE_SIZE', '64')))
+
+# Tabela colunar de todas as culturas e planos de consulta compilados (/api/query), por versão dos dados
+CROP_TABLE_CACHE = VersionedCache('crop_table', max_entries=1)
+# Área da cultura alinhada aos municípios do grafo de vizinhança, por versão dos dados + geometrias
+ADJACENCY_AREA_CACHE = VersionedCache('adjacency_areas', max_entries=32)
+
+# Índice de busca de municípios por nome, por versão dos dados + geometrias
+SEARCH_CACHE = VersionedCache('municipality_search', max_entries=1)
+
+# Moran's I e Gi* por (cultura, UFs), por versão dos dados + geometrias
+HOTSPOT_CACHE = VersionedCache('hotspots', max_entries=int(os.environ.get('HOTSPOT_CACHE_SIZE', '32')))
+
+# Índices de diversidade/especialização, calculados uma vez por versão da tabela
+INDICATOR_CACHE = VersionedCache('indicators', max_entries=1)
+# Índice kNN por composição de culturas, reconstruído a partir da tabela de cada versão
+SIMILARITY_CACHE = VersionedCache('crop_similarity', max_entries=1)
+QUERY_PLAN_CACHE = VersionedCache('query_plans', max_entries=int(os.environ.get('QUERY_PLAN_CACHE_SIZE', '256')))
+
+# Planilhas de /api/export/crop-analysis em geração, por (cultura, UF, versão)
+EXPORT_FLIGHT = SingleFlight('export_crop_analysis', timeout=float(os.environ.get('EXPORT_TIMEOUT', '120')))
+
+# Parâmetros do GET de /api/query -> chaves do filtro (ver query_engine)
+QUERY_ARGS = {
+    'state': 'states', 'region': 'region', 'min_area': 'min_area', 'max_area': 'max_area',
+    'prefix': 'code_prefixes', 'bbox': 'bbox', 'sort': 'sort', 'limit': 'limit', 'offset': 'offset'
+}
+
+def requested_layer_format():
+    """Layer payload format from ?format= or the Accept header: json, columnar or binary"""
+    requested = request.args.get('format')
+    if requested in ('json', 'columnar', 'binary'):
+        return requested
+
+    best = request.accept_mimetypes.best_match(['application/json', COLUMNAR_MIMETYPE, BINARY_MIMETYPE])
+    return {COLUMNAR_MIMETYPE: 'columnar', BINARY_MIMETYPE: 'binary'}.get(best, 'json')
+
+def columnar_layer_response(matched_crop, crop_municipalities, layer_format):
+    """Parallel code/area arrays; names and states come from /api/municipalities/metadata"""
+    version = data_version()
+    snapshot = dataset.current() if DATA_BACKEND != 'db' else None
+    # Comparar versões, não identidade: o snapshot compartilhado recria as camadas que saem do LRU
+    if snapshot is not None and snapshot.version == version and snapshot.has_crop(matched_crop):
+        codes, areas, packed = snapshot.columnar(matched_crop)
+    else:
+        codes, areas = layer_to_columns(crop_municipalities)
+        packed = pack_layer_columns(codes, areas) if layer_format == 'binary' else None
+
+    if layer_format == 'binary':
+        response = app.response_class(packed, mimetype=BINARY_MIMETYPE)
+        response.headers['X-Dataset-Version'] = version
+        response.headers['X-Matched-Crop'] = quote(matched_crop)
+    else:
+        response = jsonify({
+            'success': True,
+            'crop': matched_crop,
+            'version': version,
+            'codes': codes,
+            'areas': areas
+        })
+        response.mimetype = COLUMNAR_MIMETYPE
+    response.vary.add('Accept')
+    return response
+
+def available_crops():
+    """Sorted crop names from the configured backend"""
+    if DATA_BACKEND == 'db':
+        return sorted(get_available_crops())
+    return dataset.current().crops
+
+def load_crop_layer(crop_name):
+    """Resolve a crop name and return (matched_crop, valid municipalities) from the configured backend"""
+    if DATA_BACKEND == 'db':
+        matched_crop = match_crop_name(crop_name, get_available_crops())
+        return matched_crop, get_crop_data_for_map(matched_crop) if matched_crop else None
+
+    snapshot = dataset.current()
+    matched_crop = snapshot.find_crop(crop_name)
+    return matched_crop, snapshot.layer(matched_crop) if matched_crop else None
+
+def crop_table():
+    """CropTable of the current data version (snapshot or database)"""
+    if DATA_BACKEND == 'db':
+        version = data_version()
+        return CROP_TABLE_CACHE.get_or_compute(version, 'table', lambda: CropTable.build(
+            version, get_available_crops(), get_crop_data_for_map))
+
+    snapshot = dataset.current()
+    return CROP_TABLE_CACHE.get_or_compute(snapshot.version, 'table', lambda: CropTable.build(
+        snapshot.version, snapshot.crops, snapshot.layer))
+
+def crop_indicators():
+    """CropIndicators of the current CropTable"""
+    table = crop_table()
+    return INDICATOR_CACHE.get_or_compute(table.version, 'indicators', lambda: CropIndicators(table))
+
+def crop_similarity():
+    """CropMixIndex of the current CropTable"""
+    table = crop_table()
+    return SIMILARITY_CACHE.get_or_compute(table.version, 'crop_mix', lambda: CropMixIndex(table))
+
+def adjacency_areas(adjacency, matched_crop, crop_municipalities):
+    """Crop area aligned with the municipalities of the adjacency graph (0 where absent)"""
+    return ADJACENCY_AREA_CACHE.get_or_compute(
+        f'{data_version()}:{adjacency.version}', matched_crop,
+        lambda: np.array([float((crop_municipalities.get(member) or {}).get('harvested_area') or 0)
+                          for member in adjacency.codes])
+    )
+
+def municipality_search():
+    """MunicipalitySearch over the dataset municipalities plus any extra ones in the GeoJSON"""
+    index = get_feature_index()
+    version = f'{data_version()}:{index.version}'
+
+    def build():
+        municipalities = dataset.current().municipalities if DATA_BACKEND != 'db' else get_municipality_metadata()
+        records = {code: (code, name, state, None) for code, (name, state) in municipalities.items() if name}
+        for code, name, state, _, _, _, centroid, _ in index.entries:
+            known = records.get(code)
+            if known:
+                records[code] = known[:3] + (centroid,)
+            elif name:
+                records[code] = (code, name, state, centroid)
+        search = MunicipalitySearch(version, list(records.values()))
+        logger.info(f"Índice de busca de municípios construído em {search.build_seconds * 1000:.0f} ms "
+                    f"({len(search.codes)} nomes)")
+        return search
+
+    return SEARCH_CACHE.get_or_compute(version, 'search', build)
+
+def summarize_areas(values):
+    """Descriptive statistics for a list of harvested areas"""
+    return {
+        'mean': statistics.mean(values),
+        'median': statistics.median(values),
+        'mode': statistics.mode(values) if len(set(values)) < len(values) else None,
+        'std_dev': statistics.stdev(values) if len(values) > 1 else 0,
+        'min': min(values),
+        'max': max(values),
+        'q1': statistics.quantiles(values, n=4)[0] if len(values) >= 4 else None,
+        'q3': statistics.quantiles(values, n=4)[2] if len(values) >= 4 else None,
+        'total': sum(values),
+        'count': len(values)
+    }
 
 @app.route('/')
 def index():
@@ -27,39 +202,81 @@ def index():
 def analysis():
     return render_template('analysis.html')
 
+@app.route('/static/data/<path:filename>')
+def static_map_data(filename):
+    """Map data files, served from the .gz written by build_data.py when the client accepts gzip"""
+    directory = os.path.join(app.static_folder, 'data')
+    path = safe_join(directory, filename)
+    compressed = f'{path}.gz' if path else None
+    if compressed and 'gzip' in request.accept_encodings and os.path.exists(compressed) and os.path.exists(path) \
+            and os.path.getmtime(compressed) >= os.path.getmtime(path):
+        # Mesmo Content-Type que o arquivo original receberia
+        response = send_file(compressed, mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                             conditional=True)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
+    return send_from_directory(directory, filename)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request, cache and dataset metrics in Prometheus text format"""
+    metrics.set_gauge('dataset_info', 1, {'version': data_version()})
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/profiles/<profile_id>')
+def get_request_profile(profile_id):
+    """cProfile output captured for a request sent with X-Profile (admin only)"""
+    if not is_admin_request():
+        return jsonify({'success': False, 'error': 'Não autorizado'}), 403
+
+    profile = get_profile(profile_id)
+    if profile is None:
+        return jsonify({'success': False, 'error': 'Perfil não encontrado'}), 404
+    return app.response_class(profile, mimetype='text/plain')
+
+@app.route('/api/admin/memory')
+def get_memory_report():
+    """Measured size of datasets, indexes and caches against the memory budget (admin only)"""
+    if not is_admin_request():
+        return jsonify({'success': False, 'error': 'Não autorizado'}), 403
+
+    try:
+        # refresh=1 mede de novo as estruturas (ex.: camadas carregadas no LRU do snapshot compartilhado)
+        report = budget.report(refresh=request.args.get('refresh') == '1')
+        return jsonify({'success': True, **report})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/admin/memory/leaks', methods=['GET', 'POST'])
+def get_memory_leaks():
+    """tracemalloc diff against a baseline: action=start|diff|stop (admin only)"""
+    if not is_admin_request():
+        return jsonify({'success': False, 'error': 'Não autorizado'}), 403
+
+    try:
+        action = request.args.get('action', 'diff')
+        if action == 'start':
+            budget.start_tracing()
+            return jsonify({'success': True, 'tracing': True})
+        if action == 'stop':
+            budget.stop_tracing()
+            return jsonify({'success': True, 'tracing': False})
+        if action != 'diff':
+            return jsonify({'success': False, 'error': 'Ação inválida (start, diff ou stop)'}), 400
+
+        top = budget.leak_report(limit=request.args.get('limit', 25, type=int))
+        if top is None:
+            return jsonify({'success': False, 'error': 'tracemalloc não iniciado (use action=start)'}), 409
+        return jsonify({'success': True, 'tracing': True, 'top': top})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/api/brazilian-states')
+@dataset_cached(max_age=86400)
 def get_states():
     try:
-        # Brazilian states
-        states = [
-            {'code': 'AC', 'name': 'Acre'},
-            {'code': 'AL', 'name': 'Alagoas'},
-            {'code': 'AP', 'name': 'Amapá'},
-            {'code': 'AM', 'name': 'Amazonas'},
-            {'code': 'BA', 'name': 'Bahia'},
-            {'code': 'CE', 'name': 'Ceará'},
-            {'code': 'DF', 'name': 'Distrito Federal'},
-            {'code': 'ES', 'name': 'Espírito Santo'},
-            {'code': 'GO', 'name': 'Goiás'},
-            {'code': 'MA', 'name': 'Maranhão'},
-            {'code': 'MT', 'name': 'Mato Grosso'},
-            {'code': 'MS', 'name': 'Mato Grosso do Sul'},
-            {'code': 'MG', 'name': 'Minas Gerais'},
-            {'code': 'PA', 'name': 'Pará'},
-            {'code': 'PB', 'name': 'Paraíba'},
-            {'code': 'PR', 'name': 'Paraná'},
-            {'code': 'PE', 'name': 'Pernambuco'},
-            {'code': 'PI', 'name': 'Piauí'},
-            {'code': 'RJ', 'name': 'Rio de Janeiro'},
-            {'code': 'RN', 'name': 'Rio Grande do Norte'},
-            {'code': 'RS', 'name': 'Rio Grande do Sul'},
-            {'code': 'RO', 'name': 'Rondônia'},
-            {'code': 'RR', 'name': 'Roraima'},
-            {'code': 'SC', 'name': 'Santa Catarina'},
-            {'code': 'SP', 'name': 'São Paulo'},
-            {'code': 'SE', 'name': 'Sergipe'},
-            {'code': 'TO', 'name': 'Tocantins'}
-        ]
+        states = [{'code': code, 'name': name} for code, name in STATE_NAMES.items()]
 
         return jsonify({
             'success': True,
@@ -69,17 +286,16 @@ def get_states():
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/statistics')
+@dataset_cached()
 def get_statistics():
     try:
-        # CROP_DATA structure: {crop_name: {municipality_code: {data}}}
-        total_crops = len(CROP_DATA)
-
-        # Count unique municipalities across all crops
-        all_municipalities = set()
-        for crop_data in CROP_DATA.values():
-            all_municipalities.update(crop_data.keys())
-
-        total_municipalities = len(all_municipalities)
+        if DATA_BACKEND == 'db':
+            total_crops = len(get_available_crops())
+            total_municipalities = get_municipality_count()
+        else:
+            snapshot = dataset.current()
+            total_crops = len(snapshot.crops)
+            total_municipalities = snapshot.municipality_count
 
         return jsonify({
             'success': True,
@@ -90,175 +306,122 @@ def get_statistics():
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/crops')
+@dataset_cached()
 def get_crops():
     try:
-        # CROP_DATA structure: {crop_name: {municipality_code: {data}}}
-        sorted_crops = sorted(list(CROP_DATA.keys()))
         return jsonify({
             'success': True,
-            'crops': sorted_crops
+            'crops': available_crops()
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/crop-data/<crop_name>')
+@dataset_cached(vary_accept=True)
 def get_crop_data(crop_name):
     try:
-        # Busca exata primeiro
-        if crop_name in CROP_DATA:
-            all_crop_data = CROP_DATA[crop_name]
-
-            # Filtrar apenas municípios válidos (códigos IBGE reais de municípios)
-            crop_municipalities = {}
-            for municipality_code, municipality_data in all_crop_data.items():
-                municipality_code_str = str(municipality_code)
-                municipality_name = municipality_data.get('municipality_name', '').lower()
-
-                # Verificar se é um código de município válido
-                # Códigos de município IBGE começam com 1-5 e têm 7 dígitos
-                # Excluir códigos que começam com 0 (são agregações regionais)
-                if (len(municipality_code_str) == 7 and 
-                    municipality_code_str.isdigit() and
-                    municipality_code_str[0] in '12345' and  # Códigos reais começam com 1-5
-                    municipality_data.get('municipality_name') and
-                    # Excluir nomes que indicam regiões/agregações
-                    not any(keyword in municipality_name for keyword in [
-                        'região', 'mesorregião', 'microrregião', 'nordeste', 'norte', 'sul', 
-                        'centro', 'oeste', 'leste', 'sudeste', 'noroeste', 'sudoeste',
-                        'alto ', 'baixo ', 'médio ', '-grossense', 'parecis', 'araguaia',
-                        'pantanal', 'cerrado', 'amazônia', 'caatinga', 'mata atlântica'
-                    ]) and
-                    # Excluir nomes muito genéricos ou que são claramente regiões
-                    municipality_name not in [
-                        'alto teles pires', 'sudeste mato-grossense', 'parecis', 'barreiras',
-                        'dourados', 'norte mato-grossense', 'portal da amazônia'
-                    ]):
-                    crop_municipalities[municipality_code] = municipality_data
-
-            # Debug: Encontrar o maior produtor para verificação
-            if crop_municipalities:
-                # Ordenar por área colhida para debug
-                sorted_municipalities = sorted(crop_municipalities.items(), 
-                                             key=lambda x: float(x[1].get('harvested_area', 0)), 
-                                             reverse=True)
-                max_municipality = sorted_municipalities[0]
-                print(f"Debug - Maior produtor de {crop_name} (apenas municípios): {max_municipality[1].get('municipality_name')} ({max_municipality[1].get('state_code')}) - {max_municipality[1].get('harvested_area')} hectares")
-
-                # Mostrar top 5 municípios para verificação
-                print(f"Debug - Top 5 municípios produtores de {crop_name}:")
-                for i, (code, data) in enumerate(sorted_municipalities[:5]):
-                    print(f"  {i+1}. {data.get('municipality_name')} ({data.get('state_code')}): {data.get('harvested_area')} ha - Código: {code}")
-            else:
-                print(f"Debug - Nenhum município válido encontrado para {crop_name}")
+        # Busca exata primeiro, depois cultura similar
+        # Apenas municípios válidos (códigos IBGE reais de municípios)
+        matched_crop, crop_municipalities = load_crop_layer(crop_name)
+        if matched_crop is None:
+            return jsonify({'success': False, 'error': 'Cultura não encontrada'})
 
-            return jsonify({
-                'success': True,
-                'data': crop_municipalities
-            })
+        layer_format = requested_layer_format()
+        if layer_format != 'json':
+            return columnar_layer_response(matched_crop, crop_municipalities, layer_format)
 
-        # Busca similar se não encontrar exata
-        crop_name_lower = crop_name.lower()
-        similar_crops = []
-
-        for available_crop in CROP_DATA.keys():
-            if crop_name_lower in available_crop.lower() or available_crop.lower() in crop_name_lower:
-                similar_crops.append(available_crop)
-
-        if similar_crops:
-            # Usar a primeira cultura similar encontrada
-            best_match = similar_crops[0]
-            all_crop_data = CROP_DATA[best_match]
-
-            # Filtrar apenas municípios válidos (códigos IBGE reais de municípios)
-            crop_municipalities = {}
-            for municipality_code, municipality_data in all_crop_data.items():
-                municipality_code_str = str(municipality_code)
-                municipality_name = municipality_data.get('municipality_name', '').lower()
-
-                # Verificar se é um código de município válido
-                # Códigos de município IBGE começam com 1-5 e têm 7 dígitos
-                # Excluir códigos que começam com 0 (são agregações regionais)
-                if (len(municipality_code_str) == 7 and 
-                    municipality_code_str.isdigit() and
-                    municipality_code_str[0] in '12345' and  # Códigos reais começam com 1-5
-                    municipality_data.get('municipality_name') and
-                    # Excluir nomes que indicam regiões/agregações
-                    not any(keyword in municipality_name for keyword in [
-                        'região', 'mesorregião', 'microrregião', 'nordeste', 'norte', 'sul', 
-                        'centro', 'oeste', 'leste', 'sudeste', 'noroeste', 'sudoeste',
-                        'alto ', 'baixo ', 'médio ', '-grossense', 'parecis', 'araguaia',
-                        'pantanal', 'cerrado', 'amazônia', 'caatinga', 'mata atlântica'
-                    ]) and
-                    # Excluir nomes muito genéricos ou que são claramente regiões
-                    municipality_name not in [
-                        'alto teles pires', 'sudeste mato-grossense', 'parecis', 'barreiras',
-                        'dourados', 'norte mato-grossense', 'portal da amazônia'
-                    ]):
-                    crop_municipalities[municipality_code] = municipality_data
-
-            # Debug: Encontrar o maior produtor para verificação
-            if crop_municipalities:
-                # Ordenar por área colhida para debug
-                sorted_municipalities = sorted(crop_municipalities.items(), 
-                                             key=lambda x: float(x[1].get('harvested_area', 0)), 
-                                             reverse=True)
-                max_municipality = sorted_municipalities[0]
-                print(f"Debug - Maior produtor de {best_match} (apenas municípios): {max_municipality[1].get('municipality_name')} ({max_municipality[1].get('state_code')}) - {max_municipality[1].get('harvested_area')} hectares")
-
-                # Mostrar top 5 municípios para verificação
-                print(f"Debug - Top 5 municípios produtores de {best_match}:")
-                for i, (code, data) in enumerate(sorted_municipalities[:5]):
-                    print(f"  {i+1}. {data.get('municipality_name')} ({data.get('state_code')}): {data.get('harvested_area')} ha - Código: {code}")
-            else:
-                print(f"Debug - Nenhum município válido encontrado para {best_match}")
+        # Log de depuração amostrado: os maiores produtores, apenas com DEBUG ativo
+        if should_log(logger):
+            top_municipalities = heapq.nlargest(
+                5, crop_municipalities.items(), key=lambda x: float(x[1].get('harvested_area', 0)))
+            logger.debug("crop_layer crop=%r municipalities=%d top=%s", matched_crop, len(crop_municipalities), [
+                (code, data.get('municipality_name'), data.get('state_code'), data.get('harvested_area'))
+                for code, data in top_municipalities
+            ])
 
-            return jsonify({
-                'success': True,
-                'data': crop_municipalities,
-                'matched_crop': best_match
-            })
+        response = {
+            'success': True,
+            'data': crop_municipalities
+        }
+        if matched_crop != crop_name:
+            response['matched_crop'] = matched_crop
+        return jsonify(response)
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
 
-        return jsonify({'success': False, 'error': 'Cultura não encontrada'})
+@app.route('/api/municipalities/metadata')
+def get_municipalities_metadata():
+    """Municipality names and states, served once per dataset version"""
+    try:
+        # Hash do snapshot ou última importação do banco: muda a cada recarga/importação
+        version = data_version()
+
+        def build_metadata():
+            municipalities = dataset.current().municipalities if DATA_BACKEND != 'db' else get_municipality_metadata()
+            codes = sorted(municipalities)
+            return {
+                'success': True,
+                'version': version,
+                'codes': [int(code) for code in codes],
+                'names': [municipalities[code][0] for code in codes],
+                'states': [municipalities[code][1] for code in codes]
+            }
+
+        response = jsonify(DERIVED_CACHE.get_or_compute(version, 'municipality_metadata', build_metadata))
+        response.set_etag(version)
+        # URLs versionadas (?v=<versão>) nunca mudam de conteúdo
+        if request.args.get('v') == version:
+            response.cache_control.public = True
+            response.cache_control.max_age = 31536000
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.public = True
+            response.cache_control.max_age = 300
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/municipalities/search')
+@dataset_cached(extra_version=lambda: get_feature_index().version)
+def search_municipalities():
+    """Autocomplete of municipality names (?q=, optional ?state= / ?region= and ?limit=)"""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'success': False, 'error': 'Informe ?q=<nome do município>'}), 400
+        try:
+            limit = min(max(int(request.args.get('limit', SEARCH_DEFAULT_LIMIT)), 1), SEARCH_MAX_LIMIT)
+        except ValueError:
+            limit = SEARCH_DEFAULT_LIMIT
+
+        results = municipality_search().search(query, requested_states(), limit)
+        return jsonify({
+            'success': True,
+            'query': query,
+            'results': results
+        })
+    except QueryError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/crop-chart-data/<crop_name>')
+@dataset_cached()
 def get_crop_chart_data(crop_name):
     try:
-        if crop_name not in CROP_DATA:
+        matched_crop, layer = load_crop_layer(crop_name)
+        if matched_crop is None:
             return jsonify({'success': False, 'error': 'Cultura não encontrada'})
 
         crop_municipalities = []
-        for municipality_code, municipality_data in CROP_DATA[crop_name].items():
-            # Filtrar apenas municípios válidos (códigos IBGE reais de municípios)
-            municipality_code_str = str(municipality_code)
-            municipality_name = municipality_data.get('municipality_name', '').lower()
-
-            # Verificar se é um código de município válido
-            # Códigos de município IBGE começam com 1-5 e têm 7 dígitos
-            # Excluir códigos que começam com 0 (são agregações regionais)
-            if (len(municipality_code_str) == 7 and 
-                municipality_code_str.isdigit() and
-                municipality_code_str[0] in '12345' and  # Códigos reais começam com 1-5
-                municipality_data.get('municipality_name') and
-                # Excluir nomes que indicam regiões/agregações
-                not any(keyword in municipality_name for keyword in [
-                    'região', 'mesorregião', 'microrregião', 'nordeste', 'norte', 'sul', 
-                    'centro', 'oeste', 'leste', 'sudeste', 'noroeste', 'sudoeste',
-                    'alto ', 'baixo ', 'médio ', '-grossense', 'parecis', 'araguaia',
-                    'pantanal', 'cerrado', 'amazônia', 'caatinga', 'mata atlântica'
-                ]) and
-                # Excluir nomes muito genéricos ou que são claramente regiões
-                municipality_name not in [
-                    'alto teles pires', 'sudeste mato-grossense', 'parecis', 'barreiras',
-                    'dourados', 'norte mato-grossense', 'portal da amazônia'
-                ]):
-                crop_municipalities.append({
-                    'municipality_name': municipality_data.get('municipality_name', 'Desconhecido'),
-                    'state_code': municipality_data.get('state_code', 'XX'),
-                    'harvested_area': municipality_data.get('harvested_area', 0)
-                })
+        # Apenas municípios válidos (códigos IBGE reais de municípios)
+        for municipality_code, municipality_data in layer.items():
+            crop_municipalities.append({
+                'municipality_name': municipality_data.get('municipality_name', 'Desconhecido'),
+                'state_code': municipality_data.get('state_code', 'XX'),
+                'harvested_area': municipality_data.get('harvested_area', 0)
+            })
 
         # Sort by harvested area and take top 20
         crop_municipalities.sort(key=lambda x: x['harvested_area'], reverse=True)
@@ -277,112 +440,55 @@ def get_crop_chart_data(crop_name):
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/analysis/statistical-summary/<crop_name>')
+@dataset_cached()
 def get_statistical_summary(crop_name):
     try:
-        if crop_name not in CROP_DATA:
+        matched_crop, crop_municipalities = load_crop_layer(crop_name)
+        if matched_crop is None:
             return jsonify({'success': False, 'error': 'Cultura não encontrada'})
 
-        # Filtrar apenas municípios válidos (códigos IBGE reais de municípios)
-        values = []
-        for municipality_code, data in CROP_DATA[crop_name].items():
-            municipality_code_str = str(municipality_code)
-            municipality_name = data.get('municipality_name', '').lower()
-
-            # Verificar se é um código de município válido
-            # Códigos de município IBGE começam com 1-5 e têm 7 dígitos
-            # Excluir códigos que começam com 0 (são agregações regionais)
-            if (len(municipality_code_str) == 7 and 
-                municipality_code_str.isdigit() and
-                municipality_code_str[0] in '12345' and  # Códigos reais começam com 1-5
-                data.get('municipality_name') and
-                # Excluir nomes que indicam regiões/agregações
-                not any(keyword in municipality_name for keyword in [
-                    'região', 'mesorregião', 'microrregião', 'nordeste', 'norte', 'sul', 
-                    'centro', 'oeste', 'leste', 'sudeste', 'noroeste', 'sudoeste',
-                    'alto ', 'baixo ', 'médio ', '-grossense', 'parecis', 'araguaia',
-                    'pantanal', 'cerrado', 'amazônia', 'caatinga', 'mata atlântica'
-                ]) and
-                # Excluir nomes muito genéricos ou que são claramente regiões
-                municipality_name not in [
-                    'alto teles pires', 'sudeste mato-grossense', 'parecis', 'barreiras',
-                    'dourados', 'norte mato-grossense', 'portal da amazônia'
-                ]):
-                values.append(data['harvested_area'])
+        # Apenas municípios válidos (códigos IBGE reais de municípios)
+        values = [data['harvested_area'] for data in crop_municipalities.values()]
 
         if not values:
             return jsonify({'success': False, 'error': 'Nenhum município válido encontrado para esta cultura'})
 
-        import statistics
-        summary = {
-            'mean': statistics.mean(values),
-            'median': statistics.median(values),
-            'mode': statistics.mode(values) if len(set(values)) < len(values) else None,
-            'std_dev': statistics.stdev(values) if len(values) > 1 else 0,
-            'min': min(values),
-            'max': max(values),
-            'q1': statistics.quantiles(values, n=4)[0] if len(values) >= 4 else None,
-            'q3': statistics.quantiles(values, n=4)[2] if len(values) >= 4 else None,
-            'total': sum(values),
-            'count': len(values)
-        }
-
         return jsonify({
             'success': True,
-            'summary': summary
+            'summary': summarize_areas(values)
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/analysis/by-state/<crop_name>')
+@dataset_cached()
 def get_analysis_by_state(crop_name):
     try:
-        if crop_name not in CROP_DATA:
+        matched_crop, crop_municipalities = load_crop_layer(crop_name)
+        if matched_crop is None:
             return jsonify({'success': False, 'error': 'Cultura não encontrada'})
 
         states_data = {}
-        for municipality_code, municipality_data in CROP_DATA[crop_name].items():
-            # Filtrar apenas municípios válidos (códigos IBGE reais de municípios)
-            municipality_code_str = str(municipality_code)
-            municipality_name = municipality_data.get('municipality_name', '').lower()
-
-            # Verificar se é um código de município válido
-            # Códigos de município IBGE começam com 1-5 e têm 7 dígitos
-            # Excluir códigos que começam com 0 (são agregações regionais)
-            if (len(municipality_code_str) == 7 and 
-                municipality_code_str.isdigit() and
-                municipality_code_str[0] in '12345' and  # Códigos reais começam com 1-5
-                municipality_data.get('municipality_name') and
-                # Excluir nomes que indicam regiões/agregações
-                not any(keyword in municipality_name for keyword in [
-                    'região', 'mesorregião', 'microrregião', 'nordeste', 'norte', 'sul', 
-                    'centro', 'oeste', 'leste', 'sudeste', 'noroeste', 'sudoeste',
-                    'alto ', 'baixo ', 'médio ', '-grossense', 'parecis', 'araguaia',
-                    'pantanal', 'cerrado', 'amazônia', 'caatinga', 'mata atlântica'
-                ]) and
-                # Excluir nomes muito genéricos ou que são claramente regiões
-                municipality_name not in [
-                    'alto teles pires', 'sudeste mato-grossense', 'parecis', 'barreiras',
-                    'dourados', 'norte mato-grossense', 'portal da amazônia'
-                ]):
-
-                state = municipality_data.get('state_code', 'XX')
-                area = municipality_data.get('harvested_area', 0)
-
-                if state not in states_data:
-                    states_data[state] = {
-                        'total_area': 0,
-                        'municipalities_count': 0,
-                        'max_area': 0,
-                        'municipalities': []
-                    }
-
-                states_data[state]['total_area'] += area
-                states_data[state]['municipalities_count'] += 1
-                states_data[state]['max_area'] = max(states_data[state]['max_area'], area)
-                states_data[state]['municipalities'].append({
-                    'name': municipality_data.get('municipality_name'),
-                    'area': area
-                })
+        # Apenas municípios válidos (códigos IBGE reais de municípios)
+        for municipality_code, municipality_data in crop_municipalities.items():
+            state = municipality_data.get('state_code', 'XX')
+            area = municipality_data.get('harvested_area', 0)
+
+            if state not in states_data:
+                states_data[state] = {
+                    'total_area': 0,
+                    'municipalities_count': 0,
+                    'max_area': 0,
+                    'municipalities': []
+                }
+
+            states_data[state]['total_area'] += area
+            states_data[state]['municipalities_count'] += 1
+            states_data[state]['max_area'] = max(states_data[state]['max_area'], area)
+            states_data[state]['municipalities'].append({
+                'name': municipality_data.get('municipality_name'),
+                'area': area
+            })
 
         # Calculate averages
         for state_data in states_data.values():
@@ -396,18 +502,21 @@ def get_analysis_by_state(crop_name):
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/analysis/comparison/<crop1>/<crop2>')
+@dataset_cached()
 def get_crop_comparison(crop1, crop2):
     try:
-        if crop1 not in CROP_DATA or crop2 not in CROP_DATA:
+        crop1, crop1_data = load_crop_layer(crop1)
+        crop2, crop2_data = load_crop_layer(crop2)
+        if crop1 is None or crop2 is None:
             return jsonify({'success': False, 'error': 'Uma ou ambas culturas não encontradas'})
 
         # Get common municipalities
-        common_municipalities = set(CROP_DATA[crop1].keys()) & set(CROP_DATA[crop2].keys())
+        common_municipalities = set(crop1_data.keys()) & set(crop2_data.keys())
 
         comparison_data = []
         for muni_code in common_municipalities:
-            data1 = CROP_DATA[crop1][muni_code]
-            data2 = CROP_DATA[crop2][muni_code]
+            data1 = crop1_data[muni_code]
+            data2 = crop2_data[muni_code]
 
             comparison_data.append({
                 'municipality_code': muni_code,
@@ -428,10 +537,411 @@ def get_crop_comparison(crop1, crop2):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/chatbot/query')
+@dataset_cached()
+def chatbot_query():
+    """Resolve a chatbot question (?q=) and answer with layer, summary and top producers at once"""
+    try:
+        message = request.args.get('q', '').strip()
+        if not message:
+            return jsonify({'success': False, 'error': 'Pergunta vazia'})
+
+        version = data_version()
+        index = CHATBOT_CACHE.get_or_compute(version, 'index', lambda: QueryIndex(available_crops()))
+        query = parse_query(message, index)
+        crop_name, state_code, states = query['crop'], query['state'], set(query['states'])
+        if crop_name is None:
+            return jsonify({'success': False, 'error': 'Cultura não identificada na pergunta', 'query': query})
+
+        def build_answer():
+            # Uma UF (ou nenhuma) o banco filtra direto; várias, filtra-se a camada inteira
+            if DATA_BACKEND == 'db' and len(states) <= 1:
+                crop_municipalities = get_crop_data_for_map(crop_name, state_code)
+            else:
+                crop_municipalities = load_crop_layer(crop_name)[1] or {}
+                if states:
+                    crop_municipalities = {
+                        code: data for code, data in crop_municipalities.items()
+                        if data.get('state_code') in states
+                    }
+
+            values = [data['harvested_area'] for data in crop_municipalities.values() if data.get('harvested_area')]
+            top_producers = heapq.nlargest(CHATBOT_TOP_PRODUCERS, crop_municipalities.items(),
+                                           key=lambda x: float(x[1].get('harvested_area', 0)))
+            return {
+                'data': crop_municipalities,
+                'summary': summarize_areas(values) if values else None,
+                'top_producers': [
+                    {'municipality_code': code, **data} for code, data in top_producers
+                ]
+            }
+
+        answer = CHATBOT_CACHE.get_or_compute(version, (crop_name, state_code), build_answer)
+        return jsonify({
+            'success': True,
+            'version': version,
+            'query': query,
+            'crop': crop_name,
+            'state': state_code,
+            **answer
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def requested_states():
+    """UF codes from ?state=MT[,GO] or ?region=sul; None when neither is given
+
+    Uma UF ou região desconhecida gera QueryError (400) em vez de ampliar a
+    consulta para o país inteiro.
+    """
+    region = request.args.get('region', '').strip()
+    if region:
+        states = REGION_STATES.get(fold(region).replace(' ', '-'))
+        if states is None:
+            raise QueryError(f"Região desconhecida: {region}; use uma de: {', '.join(REGION_STATES)}")
+        return states
+    states = [state.strip().upper() for state in request.args.get('state', '').split(',') if state.strip()]
+    if not states:
+        return None
+    unknown = sorted(set(states) - set(STATE_NAMES))
+    if unknown:
+        raise QueryError(f"UF desconhecida: {', '.join(unknown)}")
+    return sorted(set(states))
+
+@app.route('/api/query', methods=['GET', 'POST'])
+@dataset_cached(extra_version=lambda: get_feature_index().version)
+def query_crop_records():
+    """Declarative filter over every crop layer: JSON body (POST) or query string (GET)"""
+    try:
+        if request.method == 'POST':
+            params = request.get_json(silent=True) or {}
+        else:
+            params = {key: request.args.get(arg) for arg, key in QUERY_ARGS.items()}
+            params['crops'] = request.args.getlist('crop')
+
+        table = crop_table()
+        query_filter, page = normalize_query(params, table.crops)
+        key = query_key(query_filter)
+        centroids = None
+        if query_filter['bbox']:
+            index = get_feature_index()
+            if not index.entries:
+                return jsonify({'success': False, 'error': 'Geometrias dos municípios indisponíveis'})
+            centroids = table.centroids(index)
+            key = f'{key}:{index.version}'
+
+        plan = QUERY_PLAN_CACHE.get_or_compute(table.version, key, lambda: compile_query(
+            table, query_filter, centroids))
+        return jsonify({
+            'success': True,
+            'version': table.version,
+            'filter': query_filter,
+            'total': len(plan.indices),
+            'municipalities': plan.municipality_count,
+            'total_area': plan.total_area,
+            **page,
+            'results': query_rows(table, plan, page['offset'], page['limit'])
+        })
+    except QueryError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/municipality/<code>')
+@dataset_cached()
+def get_municipality_profile(code):
+    """Crop mix of a municipality: areas, shares and national rank in each crop"""
+    try:
+        table = crop_table()
+        profile = table.profile(code)
+        if profile is None:
+            return jsonify({'success': False, 'error': 'Município não encontrado'}), 404
+
+        indicators = crop_indicators()
+        position = table.code_position[profile['municipality_code']]
+        for entry in profile['crops']:
+            crop_position = table.crop_position[entry['crop']]
+            entry['location_quotient'] = float(indicators.location_quotient[position, crop_position])
+            entry['state_location_quotient'] = float(indicators.state_location_quotient[position, crop_position])
+        return jsonify({'success': True, 'version': table.version, **profile,
+                        'indicators': indicators.municipality(position)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/municipality/<code>/similar')
+@dataset_cached()
+def get_similar_municipalities(code):
+    """Municipalities with the closest crop mix (?k=, ?metric=cosine|euclidean, ?state= / ?region=)"""
+    try:
+        index = crop_similarity()
+        table = index.table
+        position = table.code_position.get(code)
+        if position is None:
+            return jsonify({'success': False, 'error': 'Município não encontrado'}), 404
+        if not index.producing[position]:
+            return jsonify({'success': False, 'error': 'Município sem área colhida para comparar'}), 400
+
+        try:
+            k = int(request.args.get('k', SIMILAR_DEFAULT_K))
+        except ValueError:
+            k = 0
+        if not 1 <= k <= SIMILAR_MAX_K:
+            return jsonify({'success': False, 'error': f'k deve ser um inteiro entre 1 e {SIMILAR_MAX_K}'}), 400
+        metric = request.args.get('metric', 'cosine')
+        if metric not in SIMILARITY_METRICS:
+            return jsonify({'success': False, 'error': f'Métrica inválida (use {", ".join(SIMILARITY_METRICS)})'}), 400
+
+        score_key = 'similarity' if metric == 'cosine' else 'distance'
+        similar = []
+        for member, score in index.similar(position, k, metric, requested_states()):
+            similar.append({
+                'municipality_code': str(table.codes[member]),
+                'municipality_name': str(table.names[member]),
+                'state_code': str(table.states[member]),
+                score_key: round(score, 6),
+                'total_area': float(index.totals[member]),
+                'top_crops': [{'crop': crop_name, 'share': round(share, 4)}
+                              for crop_name, share in index.top_crops(member)]
+            })
+
+        return jsonify({
+            'success': True,
+            'version': table.version,
+            'municipality_code': code,
+            'municipality_name': str(table.names[position]),
+            'state_code': str(table.states[position]),
+            'top_crops': [{'crop': crop_name, 'share': round(share, 4)} for crop_name, share in index.top_crops(position)],
+            'metric': metric,
+            'k': k,
+            'similar': similar
+        })
+    except QueryError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/municipality/<code>/neighbours')
+@dataset_cached(extra_version=lambda: get_feature_index().version)
+def get_municipality_neighbours(code):
+    """Municipalities within ?k= hops (default 1) and, with ?crop=, the crop area of that neighbourhood"""
+    try:
+        adjacency = get_adjacency()
+        position = adjacency.position.get(code)
+        if position is None:
+            return jsonify({'success': False, 'error': 'Município não encontrado na malha municipal'}), 404
+
+        try:
+            k = int(request.args.get('k', 1))
+        except ValueError:
+            k = 0
+        if not 1 <= k <= MAX_HOPS:
+            return jsonify({'success': False, 'error': f'k deve ser um inteiro entre 1 e {MAX_HOPS}'}), 400
+
+        distance = adjacency.hops(position, k)
+        index = get_feature_index()
+        neighbours = []
+        for member in sorted(np.nonzero(distance > 0)[0].tolist(), key=lambda m: (distance[m], adjacency.codes[m])):
+            entry = index.entries[index.by_code[adjacency.codes[member]]]
+            neighbours.append({
+                'municipality_code': entry[0],
+                'municipality_name': entry[1],
+                'state_code': entry[2],
+                'hops': int(distance[member])
+            })
+
+        result = {
+            'success': True,
+            'municipality_code': code,
+            'k': k,
+            'neighbours': neighbours
+        }
+
+        crop_name = request.args.get('crop')
+        if crop_name:
+            matched_crop, crop_municipalities = load_crop_layer(crop_name)
+            if matched_crop is None:
+                return jsonify({'success': False, 'error': 'Cultura não encontrada'})
+
+            areas = adjacency_areas(adjacency, matched_crop, crop_municipalities)
+            within = distance >= 0
+            total_area = float(areas[within].sum())
+            result['aggregate'] = {
+                'crop': matched_crop,
+                'municipalities': int(within.sum()),
+                'producing': int((areas[within] > 0).sum()),
+                'total_area': total_area,
+                'own_area': float(areas[position]),
+                'neighbours_area': total_area - float(areas[position]),
+                'mean_area': total_area / int(within.sum())
+            }
+
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def compute_hotspots(adjacency, areas, states):
+    """Moran's I and Gi* of the areas over the adjacency graph, restricted to the given states"""
+    index = get_feature_index()
+    keep = np.ones(len(adjacency.codes), dtype=bool)
+    if states:
+        keep = np.isin([index.entries[index.by_code[code]][2] for code in adjacency.codes], states)
+    indptr, indices, nodes = subgraph(adjacency.indptr, adjacency.indices, keep)
+    # Municípios isolados (ilhas, ou sem vizinhos dentro do filtro) não têm defasagem espacial
+    connected = np.zeros(len(keep), dtype=bool)
+    connected[nodes[np.diff(indptr) > 0]] = True
+    indptr, indices, nodes = subgraph(adjacency.indptr, adjacency.indices, connected)
+
+    statistics_result = spatial_autocorrelation(indptr, indices, areas[nodes])
+    if statistics_result is None:
+        return None
+
+    data = {}
+    for node, z_score, p_value in zip(nodes.tolist(), statistics_result['gi_z'].tolist(),
+                                       statistics_result['p_values'].tolist()):
+        code = adjacency.codes[node]
+        entry = index.entries[index.by_code[code]]
+        value_class = hotspot_class(z_score, p_value)
+        data[code] = {
+            'municipality_name': entry[1],
+            'state_code': entry[2],
+            'harvested_area': float(areas[node]),
+            'gi_z': round(z_score, 4),
+            'p_value': round(p_value, 4),
+            'value_class': value_class,
+            'label': hotspot_label(value_class)
+        }
+    return {
+        'moran': statistics_result['moran'],
+        'excluded': int(keep.sum() - len(nodes)),
+        'data': data
+    }
+
+@app.route('/api/hotspots/<crop_name>')
+@dataset_cached(extra_version=lambda: get_feature_index().version)
+def get_crop_hotspots(crop_name):
+    """Global Moran's I and Gi* hotspot classes of a crop's harvested area (?state= / ?region= optional)"""
+    try:
+        matched_crop, crop_municipalities = load_crop_layer(crop_name)
+        if matched_crop is None:
+            return jsonify({'success': False, 'error': 'Cultura não encontrada'})
+
+        adjacency = get_adjacency()
+        if not adjacency.codes:
+            return jsonify({'success': False, 'error': 'Geometrias dos municípios indisponíveis'})
+
+        states = requested_states()
+        areas = adjacency_areas(adjacency, matched_crop, crop_municipalities)
+        result = HOTSPOT_CACHE.get_or_compute(
+            f'{data_version()}:{adjacency.version}', (matched_crop, tuple(states or ())),
+            lambda: compute_hotspots(adjacency, areas, states)
+        )
+        if result is None:
+            return jsonify({'success': False, 'error': 'Área constante ou municípios insuficientes no filtro'})
+
+        return jsonify({
+            'success': True,
+            'crop': matched_crop,
+            'states': states,
+            'classes': [{'value_class': value_class, 'label': hotspot_label(value_class)}
+                        for value_class in HOTSPOT_CLASSES],
+            **result
+        })
+    except QueryError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/indicators/<indicator>')
+@dataset_cached()
+def get_indicator_layer(indicator):
+    """Diversity/specialization indicator per municipality, as a map layer (?crop= for quotients)"""
+    try:
+        if indicator not in INDICATORS:
+            return jsonify({'success': False, 'error': f"Indicador desconhecido; use um de: {', '.join(INDICATORS)}"}), 404
+
+        indicators = crop_indicators()
+        crop_name = None
+        if indicator in CROP_INDICATORS:
+            requested_crop = request.args.get('crop', '').strip()
+            crop_name = match_crop_name(requested_crop, indicators.table.crops) if requested_crop else None
+            if crop_name is None:
+                return jsonify({'success': False, 'error': 'Informe ?crop=<cultura> válida'})
+
+        states = requested_states()
+        data = indicators.layer(indicator, crop_name, states)
+        values = [entry['value'] for entry in data.values()]
+        return jsonify({
+            'success': True,
+            'version': indicators.table.version,
+            'indicator': indicator,
+            'crop': crop_name,
+            'states': states,
+            'min': min(values) if values else None,
+            'max': max(values) if values else None,
+            'data': data
+        })
+    except QueryError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/features/<crop_name>')
+@dataset_cached(extra_version=lambda: get_feature_index().version)
+def get_crop_features(crop_name):
+    """Municipality polygons of a state/region with the crop value and class already joined"""
+    try:
+        states = requested_states()
+        if not states:
+            return jsonify({'success': False, 'error': 'Informe ?state=<UF> ou ?region=<região>'})
+
+        matched_crop, crop_municipalities = load_crop_layer(crop_name)
+        if matched_crop is None:
+            return jsonify({'success': False, 'error': 'Cultura não encontrada'})
+
+        index = get_feature_index()
+        if not index.entries:
+            return jsonify({'success': False, 'error': 'Geometrias dos municípios indisponíveis'})
+
+        version = f'{data_version()}:{index.version}'
+        payload = FEATURE_CACHE.get_or_compute(version, (matched_crop, tuple(states)), lambda: build_feature_collection(
+            index, index.positions_for_states(states), crop_municipalities,
+            crop=matched_crop, states=states, version=version
+        ))
+        return app.response_class(payload, mimetype='application/geo+json')
+    except QueryError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/tiles/<crop_name>/<int:z>/<int:x>/<int:y>.png')
+@dataset_cached(extra_version=lambda: get_feature_index().version)
+def get_crop_tile(crop_name, z, x, y):
+    """Raster choropleth tile (256 px, Web Mercator) of a crop's harvested area"""
+    try:
+        if z > MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            return jsonify({'success': False, 'error': 'Tile inválido'}), 404
+
+        matched_crop, crop_municipalities = load_crop_layer(crop_name)
+        if matched_crop is None:
+            return jsonify({'success': False, 'error': 'Cultura não encontrada'}), 404
+
+        index = get_feature_index()
+        if not index.entries:
+            return jsonify({'success': False, 'error': 'Geometrias dos municípios indisponíveis'}), 404
+
+        version = f'{data_version()}:{index.version}'
+        payload = tile_renderer.render(version, index, matched_crop, crop_municipalities, z, x, y)
+        return app.response_class(payload, mimetype='image/png')
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/api/export/complete-data')
 def export_complete_data():
     """Export complete crop data as Excel file"""
     try:
+        # pandas/openpyxl são carregados apenas nas rotas de exportação
+        import pandas as pd
+
         # Load the original Excel file
         excel_path = os.path.join('data', 'ibge_2023_hectares_colhidos.xlsx')
 
@@ -462,114 +972,138 @@ def export_complete_data():
         )
 
     except Exception as e:
-        print(f"Erro ao exportar dados: {e}")
+        logger.error(f"Erro ao exportar dados: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def crop_analysis_workbook(crop_name, crop_municipalities, state_filter):
+    """Excel workbook (bytes) with the detailed, summary, per-state, top 20 and diversity sheets"""
+    import pandas as pd
+
+    indicators = crop_indicators()
+    table = indicators.table
+    crop_position = table.crop_position.get(crop_name)
+    # ?state= aceita uma ou mais UFs separadas por vírgula, como na resposta do chatbot
+    states = {state.strip().upper() for state in state_filter.split(',') if state.strip()} if state_filter else None
+
+    # Preparar dados para exportação (apenas municípios válidos)
+    analysis_data = []
+    diversity_data = []
+    for municipality_code, municipality_data in crop_municipalities.items():
+        # Aplicar filtro de estado se especificado
+        if states and municipality_data.get('state_code') not in states:
+            continue
+
+        position = table.code_position.get(municipality_code)
+        lq = indicators.location_quotient[position, crop_position] if position is not None else None
+        state_lq = indicators.state_location_quotient[position, crop_position] if position is not None else None
+        analysis_data.append({
+            'Código IBGE': municipality_code,
+            'Município': municipality_data.get('municipality_name', 'Desconhecido'),
+            'UF': municipality_data.get('state_code', 'XX'),
+            'Cultura': crop_name,
+            'Área Colhida (hectares)': municipality_data.get('harvested_area', 0),
+            'QL Nacional': round(float(lq), 4) if lq is not None else None,
+            'QL Estadual': round(float(state_lq), 4) if state_lq is not None else None,
+            'Ano': 2023
+        })
+
+        if position is not None:
+            municipality_indicators = indicators.municipality(position)
+            diversity_data.append({
+                'Código IBGE': municipality_code,
+                'Município': municipality_data.get('municipality_name', 'Desconhecido'),
+                'UF': municipality_data.get('state_code', 'XX'),
+                'Nº Culturas': municipality_indicators['crop_count'],
+                'Índice de Shannon': round(municipality_indicators['shannon'], 4),
+                'Índice HHI': round(municipality_indicators['hhi'], 4),
+                'Cultura Dominante': municipality_indicators['dominant_crop'],
+                'Participação da Dominante (%)': round(municipality_indicators['dominant_share'] * 100, 2)
+            })
+
+    # Ordenar por área colhida (maior para menor)
+    analysis_data.sort(key=lambda x: x['Área Colhida (hectares)'], reverse=True)
+
+    # Criar DataFrame
+    df = pd.DataFrame(analysis_data)
+
+    # Calcular estatísticas resumidas
+    total_area = df['Área Colhida (hectares)'].sum()
+    total_municipalities = len(df)
+    average_area = df['Área Colhida (hectares)'].mean()
+    max_area = df['Área Colhida (hectares)'].max()
+    min_area = df['Área Colhida (hectares)'].min()
+
+    # Criar dados de resumo estatístico
+    summary_data = [
+        ['Estatística', 'Valor'],
+        ['Cultura Analisada', crop_name],
+        ['Filtro de Estado', state_filter if state_filter else 'Nacional (Todos os Estados)'],
+        ['Ano de Referência', 2023],
+        ['Total de Municípios', total_municipalities],
+        ['Área Total Colhida (ha)', f'{total_area:,.2f}'],
+        ['Área Média por Município (ha)', f'{average_area:,.2f}'],
+        ['Maior Área Municipal (ha)', f'{max_area:,.2f}'],
+        ['Menor Área Municipal (ha)', f'{min_area:,.2f}'],
+        ['Data da Exportação', pd.Timestamp.now().strftime('%d/%m/%Y %H:%M:%S')]
+    ]
+
+    # Criar resumo por estado
+    state_summary = df.groupby('UF').agg({
+        'Área Colhida (hectares)': ['sum', 'count', 'mean']
+    }).round(2)
+    state_summary.columns = ['Área Total (ha)', 'Nº Municípios', 'Área Média (ha)']
+    state_summary = state_summary.sort_values('Área Total (ha)', ascending=False)
+    state_summary.reset_index(inplace=True)
+
+    # Criar arquivo Excel
+    output = io.BytesIO()
+    
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        # Planilha principal com dados detalhados
+        df.to_excel(writer, sheet_name='Dados Detalhados', index=False)
+        
+        # Planilha de resumo estatístico
+        summary_df = pd.DataFrame(summary_data[1:], columns=summary_data[0])
+        summary_df.to_excel(writer, sheet_name='Resumo Estatístico', index=False)
+        
+        # Planilha de resumo por estado
+        state_summary.to_excel(writer, sheet_name='Resumo por Estado', index=False)
+        
+        # Top 20 maiores produtores
+        top_20 = df.head(20).copy()
+        top_20['Ranking'] = range(1, len(top_20) + 1)
+        top_20 = top_20[['Ranking', 'Município', 'UF', 'Área Colhida (hectares)']]
+        top_20.to_excel(writer, sheet_name='Top 20 Produtores', index=False)
+
+        # Diversidade e especialização agrícola dos municípios exportados
+        diversity_df = pd.DataFrame(diversity_data)
+        if not diversity_df.empty:
+            diversity_df = diversity_df.sort_values('Índice HHI', ascending=False)
+        diversity_df.to_excel(writer, sheet_name='Diversidade', index=False)
+    return output.getvalue()
+
 @app.route('/api/export/crop-analysis/<crop_name>')
 def export_crop_analysis(crop_name):
     """Export crop analysis data as Excel file"""
     try:
+        import pandas as pd
+
         # Obter parâmetro de estado opcional
         state_filter = request.args.get('state')
         
-        if crop_name not in CROP_DATA:
+        matched_crop, crop_municipalities = load_crop_layer(crop_name)
+        if matched_crop is None:
             return jsonify({'success': False, 'error': 'Cultura não encontrada'}), 404
 
-        # Preparar dados para exportação
-        analysis_data = []
-        for municipality_code, municipality_data in CROP_DATA[crop_name].items():
-            # Filtrar apenas municípios válidos
-            municipality_code_str = str(municipality_code)
-            municipality_name = municipality_data.get('municipality_name', '').lower()
-
-            if (len(municipality_code_str) == 7 and 
-                municipality_code_str.isdigit() and
-                municipality_code_str[0] in '12345' and
-                municipality_data.get('municipality_name') and
-                not any(keyword in municipality_name for keyword in [
-                    'região', 'mesorregião', 'microrregião', 'nordeste', 'norte', 'sul', 
-                    'centro', 'oeste', 'leste', 'sudeste', 'noroeste', 'sudoeste',
-                    'alto ', 'baixo ', 'médio ', '-grossense', 'parecis', 'araguaia',
-                    'pantanal', 'cerrado', 'amazônia', 'caatinga', 'mata atlântica'
-                ]) and
-                municipality_name not in [
-                    'alto teles pires', 'sudeste mato-grossense', 'parecis', 'barreiras',
-                    'dourados', 'norte mato-grossense', 'portal da amazônia'
-                ]):
-                
-                # Aplicar filtro de estado se especificado
-                if state_filter and municipality_data.get('state_code') != state_filter:
-                    continue
-                
-                analysis_data.append({
-                    'Código IBGE': municipality_code,
-                    'Município': municipality_data.get('municipality_name', 'Desconhecido'),
-                    'UF': municipality_data.get('state_code', 'XX'),
-                    'Cultura': crop_name,
-                    'Área Colhida (hectares)': municipality_data.get('harvested_area', 0),
-                    'Ano': 2023
-                })
-
-        # Ordenar por área colhida (maior para menor)
-        analysis_data.sort(key=lambda x: x['Área Colhida (hectares)'], reverse=True)
-
-        # Criar DataFrame
-        df = pd.DataFrame(analysis_data)
-
-        # Calcular estatísticas resumidas
-        total_area = df['Área Colhida (hectares)'].sum()
-        total_municipalities = len(df)
-        average_area = df['Área Colhida (hectares)'].mean()
-        max_area = df['Área Colhida (hectares)'].max()
-        min_area = df['Área Colhida (hectares)'].min()
-
-        # Criar dados de resumo estatístico
-        summary_data = [
-            ['Estatística', 'Valor'],
-            ['Cultura Analisada', crop_name],
-            ['Filtro de Estado', state_filter if state_filter else 'Nacional (Todos os Estados)'],
-            ['Ano de Referência', 2023],
-            ['Total de Municípios', total_municipalities],
-            ['Área Total Colhida (ha)', f'{total_area:,.2f}'],
-            ['Área Média por Município (ha)', f'{average_area:,.2f}'],
-            ['Maior Área Municipal (ha)', f'{max_area:,.2f}'],
-            ['Menor Área Municipal (ha)', f'{min_area:,.2f}'],
-            ['Data da Exportação', pd.Timestamp.now().strftime('%d/%m/%Y %H:%M:%S')]
-        ]
-
-        # Criar resumo por estado
-        state_summary = df.groupby('UF').agg({
-            'Área Colhida (hectares)': ['sum', 'count', 'mean']
-        }).round(2)
-        state_summary.columns = ['Área Total (ha)', 'Nº Municípios', 'Área Média (ha)']
-        state_summary = state_summary.sort_values('Área Total (ha)', ascending=False)
-        state_summary.reset_index(inplace=True)
-
-        # Criar arquivo Excel
-        output = io.BytesIO()
-        
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            # Planilha principal com dados detalhados
-            df.to_excel(writer, sheet_name='Dados Detalhados', index=False)
-            
-            # Planilha de resumo estatístico
-            summary_df = pd.DataFrame(summary_data[1:], columns=summary_data[0])
-            summary_df.to_excel(writer, sheet_name='Resumo Estatístico', index=False)
-            
-            # Planilha de resumo por estado
-            state_summary.to_excel(writer, sheet_name='Resumo por Estado', index=False)
-            
-            # Top 20 maiores produtores
-            top_20 = df.head(20).copy()
-            top_20['Ranking'] = range(1, len(top_20) + 1)
-            top_20 = top_20[['Ranking', 'Município', 'UF', 'Área Colhida (hectares)']]
-            top_20.to_excel(writer, sheet_name='Top 20 Produtores', index=False)
-
-        output.seek(0)
+        # Exportações simultâneas da mesma cultura/UF/versão geram a planilha uma única vez
+        workbook = EXPORT_FLIGHT.do((matched_crop, state_filter, data_version()),
+                                    lambda: crop_analysis_workbook(matched_crop, crop_municipalities, state_filter))
+        # A planilha conta no orçamento de memória até o fim do envio (send_file fecha o buffer)
+        output = budget.buffer('export_buffers', workbook)
 
         # Nome do arquivo
-        safe_crop_name = crop_name.replace('/', '_').replace('\\', '_').replace(':', '_')
-        state_suffix = f'_{state_filter}' if state_filter else '_Nacional'
+        safe_crop_name = matched_crop.replace('/', '_').replace('\\', '_').replace(':', '_')
+        state_suffix = f"_{state_filter.replace(',', '-')}" if state_filter else '_Nacional'
         filename = f'analise_{safe_crop_name}{state_suffix}_{pd.Timestamp.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
 
         return send_file(
@@ -579,8 +1113,10 @@ def export_crop_analysis(crop_name):
             download_name=filename
         )
 
+    except SingleFlightTimeout as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
     except Exception as e:
-        print(f"Erro ao exportar análise: {e}")
+        logger.error(f"Erro ao exportar análise: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 if __name__ == '__main__':
@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+
+import numpy as np
+
+from dataset import Snapshot, is_valid_municipality, match_crop_name
+from metrics import record_cache_access
+from snapshot_format import LAYER_COUNT, read_binary_snapshot
+
+# Camadas materializadas (dicts) mantidas por processo
+LAYER_CACHE_SIZE = int(os.environ.get('DATASET_LAYER_CACHE_SIZE', '16'))
+
+
+class _CropView(Mapping):
+    """Read-only {crop: {code: {...}}} view that materializes one crop at a time"""
+
+    def __init__(self, snapshot, valid_only):
+        self._snapshot = snapshot
+        self._valid_only = valid_only
+
+    def __getitem__(self, crop_name):
+        crop_municipalities = self._snapshot._crop_dict(crop_name, self._valid_only)
+        if crop_municipalities is None:
+            raise KeyError(crop_name)
+        return crop_municipalities
+
+    def __iter__(self):
+        return iter(self._snapshot._crop_order)
+
+    def __len__(self):
+        return len(self._snapshot._crop_order)
+
+
+class ArraySnapshot(Snapshot):
+    """Snapshot stored in a handful of flat numpy arrays instead of Python objects
+
+    Built once in the gunicorn master (preload_app) and inherited by the forked
+    workers. Array buffers carry no per-object reference counts, so reading them
+    never dirties the copy-on-write pages shared with the master; per-crop dicts
+    are materialized on demand into a small per-process LRU.
+    """
+
+    def __init__(self, crops, crop_offsets, codes, names, states, municipality_rows, areas,
+                 version, source=None):
+        self.version = version
+        self.source = source
+        self.loaded_at = time.time()
+
+        # Ordem original preservada para match_crop_name (primeiro nome semelhante)
+        self._crop_order = list(crops)
+        self._crop_position = {crop_name: position for position, crop_name in enumerate(crops)}
+        self.crops = sorted(crops)
+
+        names = [name or '' for name in names]
+        states = [state or '' for state in states]
+        self._offsets = np.asarray(crop_offsets, dtype=np.int64)
+        self._rows = np.asarray(municipality_rows, dtype=np.uint32)
+        self._areas = np.asarray(areas, dtype=np.float64)
+        self._codes = np.array(codes, dtype=str)
+        self._names = np.array(names, dtype=str)
+        self._states = np.array(states, dtype=str)
+        self._valid = np.array(
+            [is_valid_municipality(code, {'municipality_name': name}) for code, name in zip(codes, names)],
+            dtype=bool
+        )
+        # Códigos numéricos só existem para municípios válidos (7 dígitos)
+        self._code_numbers = np.array(
+            [int(code) if valid else 0 for code, valid in zip(codes, self._valid)], dtype=np.int32
+        )
+        self.municipality_count = len(self._codes)
+
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._municipalities = None
+
+    @classmethod
+    def from_crop_data(cls, crop_data, version, source=None):
+        crops = list(crop_data.keys())
+        crop_offsets = [0]
+        municipality_index = {}
+        codes, names, states = [], [], []
+        municipality_rows, areas = [], []
+        for crop_name in crops:
+            for code, data in crop_data[crop_name].items():
+                row = municipality_index.get(code)
+                if row is None:
+                    row = municipality_index[code] = len(codes)
+                    codes.append(code)
+                    names.append(data.get('municipality_name'))
+                    states.append(data.get('state_code'))
+                municipality_rows.append(row)
+                areas.append(data.get('harvested_area', 0))
+            crop_offsets.append(len(areas))
+        return cls(crops, crop_offsets, codes, names, states, municipality_rows, areas, version, source)
+
+    @classmethod
+    def from_binary(cls, raw, version, source=None):
+        header, municipality_rows, areas = read_binary_snapshot(raw)
+        municipalities = header['municipalities']
+        return cls(header['crops'], header['crop_offsets'], municipalities['codes'], municipalities['names'],
+                   municipalities['states'], municipality_rows, areas, version, source)
+
+    @property
+    def nbytes(self):
+        arrays = (self._offsets, self._rows, self._areas, self._codes, self._names, self._states,
+                  self._valid, self._code_numbers)
+        return sum(array.nbytes for array in arrays)
+
+    @property
+    def crop_data(self):
+        return _CropView(self, valid_only=False)
+
+    @property
+    def layers(self):
+        return _CropView(self, valid_only=True)
+
+    @property
+    def municipalities(self):
+        if self._municipalities is None:
+            rows = np.unique(self._rows[self._valid[self._rows]])
+            self._municipalities = dict(zip(
+                self._codes[rows].tolist(),
+                zip(self._names[rows].tolist(), self._states[rows].tolist())
+            ))
+        return self._municipalities
+
+    def _cached(self, key, build):
+        with self._cache_lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+        record_cache_access('shared_' + key[0], value is not None)
+        if value is None:
+            value = build()
+            with self._cache_lock:
+                self._cache[key] = value
+                while len(self._cache) > LAYER_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return value
+
+    def _records(self, position, valid_only):
+        start, end = self._offsets[position], self._offsets[position + 1]
+        rows = self._rows[start:end]
+        areas = self._areas[start:end]
+        if valid_only:
+            mask = self._valid[rows]
+            rows, areas = rows[mask], areas[mask]
+        return rows, areas
+
+    def _crop_dict(self, crop_name, valid_only):
+        position = self._crop_position.get(crop_name)
+        if position is None:
+            return None
+
+        def build():
+            rows, areas = self._records(position, valid_only)
+            return {
+                code: {'municipality_name': name, 'state_code': state, 'harvested_area': area}
+                for code, name, state, area in zip(self._codes[rows].tolist(), self._names[rows].tolist(),
+                                                   self._states[rows].tolist(), areas.tolist())
+            }
+
+        if not valid_only:
+            return build()
+        return self._cached(('layer', crop_name), build)
+
+    def has_crop(self, crop_name):
+        return crop_name in self._crop_position
+
+    def layer(self, crop_name):
+        """Valid municipalities for a crop, or None if the crop does not exist"""
+        return self._crop_dict(crop_name, valid_only=True)
+
+    def columnar(self, crop_name):
+        """Parallel (codes, areas, packed binary) columns, sliced straight from the arrays"""
+        position = self._crop_position[crop_name]
+
+        def build():
+            rows, areas = self._records(position, valid_only=True)
+            codes = self._code_numbers[rows]
+            packed = (LAYER_COUNT.pack(len(codes)) + codes.astype('<i4').tobytes() +
+                      areas.astype('<f4').tobytes())
+            return codes.tolist(), areas.tolist(), packed
+
+        return self._cached(('columnar', crop_name), build)
+
+    def find_crop(self, crop_name):
+        """Exact crop match first, then the first crop with a similar name"""
+        return match_crop_name(crop_name, self._crop_order)
@@ -0,0 +1,85 @@
+"""Request coalescing: concurrent callers with the same key share one computation.
+
+O primeiro chamador de uma chave (líder) executa a função; os demais
+(seguidores) esperam pelo mesmo resultado, ou pela mesma exceção, por até
+`timeout` segundos. A chave deve incluir a versão dos dados, para que uma
+troca de versão nunca entregue o resultado antigo.
+"""
+import os
+import threading
+import time
+
+from metrics import metrics
+
+DEFAULT_TIMEOUT = float(os.environ.get('SINGLE_FLIGHT_TIMEOUT', '30'))
+
+
+class SingleFlightTimeout(TimeoutError):
+    """A follower gave up waiting for the leader's result"""
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error', 'followers')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """At most one in-flight computation per key"""
+
+    def __init__(self, name, timeout=DEFAULT_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, compute, timeout=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                in_flight = len(self._calls)
+            else:
+                call.followers += 1
+
+        if leader:
+            metrics.inc('single_flight_calls_total', {'flight': self.name, 'role': 'leader'},
+                        help_text='Coalesced computations by role (leader computes, follower waits)')
+            metrics.set_gauge('single_flight_in_flight', in_flight, {'flight': self.name},
+                              help_text='Keys currently being computed')
+            started = time.perf_counter()
+            try:
+                call.value = compute()
+                return call.value
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                    in_flight = len(self._calls)
+                call.done.set()
+                metrics.observe('single_flight_compute_seconds', time.perf_counter() - started,
+                                {'flight': self.name}, help_text='Time spent by leaders computing a key')
+                metrics.set_gauge('single_flight_in_flight', in_flight, {'flight': self.name})
+                if call.followers:
+                    metrics.inc('single_flight_shared_total', {'flight': self.name}, value=call.followers,
+                                help_text='Results handed to followers instead of being recomputed')
+
+        metrics.inc('single_flight_calls_total', {'flight': self.name, 'role': 'follower'})
+        started = time.perf_counter()
+        finished = call.done.wait(self.timeout if timeout is None else timeout)
+        metrics.observe('single_flight_wait_seconds', time.perf_counter() - started, {'flight': self.name},
+                        help_text='Time followers waited for a leader')
+        if not finished:
+            metrics.inc('single_flight_timeouts_total', {'flight': self.name},
+                        help_text='Followers that gave up waiting for a leader')
+            raise SingleFlightTimeout(f"Tempo esgotado aguardando o cálculo em andamento ({self.name})")
+        if call.error is not None:
+            raise call.error
+        return call.value
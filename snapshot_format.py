@@ -0,0 +1,154 @@
+import json
+import os
+import struct
+import sys
+from array import array
+
+# Snapshot binário colunar (little-endian):
+#   MAGIC | uint32 tamanho do cabeçalho | cabeçalho JSON (UTF-8)
+#   | uint32[records] índice do município | float64[records] área colhida
+# Os registros são ordenados por cultura; crop_offsets delimita cada cultura (CSR).
+MAGIC = b'GEOSNAP1'
+HEADER_LENGTH = struct.Struct('<I')
+
+
+class BinarySnapshotWriter:
+    """Accumulates crop-ordered records and writes the binary snapshot"""
+
+    def __init__(self):
+        self.crops = []
+        self.crop_offsets = [0]
+        self.municipality_index = {}
+        self.codes = []
+        self.names = []
+        self.states = []
+        self.municipality_rows = array('I')
+        self.areas = array('d')
+
+    def add(self, crop_name, municipality_code, municipality_name, state_code, harvested_area):
+        if not self.crops or self.crops[-1] != crop_name:
+            if crop_name in self.crops:
+                raise ValueError(f"Records must be ordered by crop ({crop_name} repeated)")
+            if self.crops:
+                self.crop_offsets.append(len(self.areas))
+            self.crops.append(crop_name)
+
+        row = self.municipality_index.get(municipality_code)
+        if row is None:
+            row = len(self.codes)
+            self.municipality_index[municipality_code] = row
+            self.codes.append(municipality_code)
+            self.names.append(municipality_name)
+            self.states.append(state_code)
+
+        self.municipality_rows.append(row)
+        self.areas.append(harvested_area)
+
+    def write(self, path, version=None):
+        offsets = self.crop_offsets + [len(self.areas)] if self.crops else [0]
+        header = json.dumps({
+            "version": version,
+            "records": len(self.areas),
+            "crops": self.crops,
+            "crop_offsets": offsets,
+            "municipalities": {
+                "codes": self.codes,
+                "names": self.names,
+                "states": self.states
+            }
+        }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+        rows = self.municipality_rows
+        areas = self.areas
+        if sys.byteorder == 'big':
+            rows, areas = array('I', rows), array('d', areas)
+            rows.byteswap()
+            areas.byteswap()
+
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(HEADER_LENGTH.pack(len(header)))
+            f.write(header)
+            rows.tofile(f)
+            areas.tofile(f)
+        os.replace(tmp_path, path)
+
+
+def write_binary_snapshot(crop_data, path, version=None):
+    """Write a {crop: {code: {...}}} structure as a binary snapshot"""
+    writer = BinarySnapshotWriter()
+    for crop_name, municipalities in crop_data.items():
+        for municipality_code, municipality_data in municipalities.items():
+            writer.add(crop_name, municipality_code, municipality_data.get('municipality_name'),
+                       municipality_data.get('state_code'), municipality_data.get('harvested_area', 0))
+    writer.write(path, version)
+
+
+def read_binary_snapshot(raw):
+    """Parse a binary snapshot into (header, municipality_rows, areas)"""
+    if raw[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a binary crop snapshot")
+
+    position = len(MAGIC)
+    (header_length,) = HEADER_LENGTH.unpack_from(raw, position)
+    position += HEADER_LENGTH.size
+    header = json.loads(raw[position:position + header_length].decode('utf-8'))
+    position += header_length
+
+    records = header["records"]
+    municipality_rows = array('I')
+    municipality_rows.frombytes(raw[position:position + records * 4])
+    position += records * 4
+    areas = array('d')
+    areas.frombytes(raw[position:position + records * 8])
+
+    if sys.byteorder == 'big':
+        municipality_rows.byteswap()
+        areas.byteswap()
+    return header, municipality_rows, areas
+
+
+def binary_snapshot_to_crop_data(raw):
+    """Rebuild the {crop: {code: {...}}} structure from a binary snapshot"""
+    header, municipality_rows, areas = read_binary_snapshot(raw)
+    municipalities = header["municipalities"]
+    codes, names, states = municipalities["codes"], municipalities["names"], municipalities["states"]
+    offsets = header["crop_offsets"]
+
+    crop_data = {}
+    for index, crop_name in enumerate(header["crops"]):
+        crop_municipalities = {}
+        for position in range(offsets[index], offsets[index + 1]):
+            row = municipality_rows[position]
+            crop_municipalities[codes[row]] = {
+                "municipality_name": names[row],
+                "state_code": states[row],
+                "harvested_area": areas[position]
+            }
+        crop_data[crop_name] = crop_municipalities
+    return crop_data
+
+
+# Camada de cultura compacta: uint32 contagem | int32[n] códigos | float32[n] áreas
+LAYER_COUNT = struct.Struct('<I')
+
+
+def layer_to_columns(layer):
+    """Split a {code: {...}} crop layer into parallel code/area lists"""
+    codes = []
+    areas = []
+    for municipality_code, municipality_data in layer.items():
+        codes.append(int(municipality_code))
+        areas.append(municipality_data.get('harvested_area', 0))
+    return codes, areas
+
+
+def pack_layer_columns(codes, areas):
+    """Encode parallel code/area lists as little-endian int32/float32 arrays"""
+    packed_codes = array('i', codes)
+    packed_areas = array('f', areas)
+    if sys.byteorder == 'big':
+        packed_codes.byteswap()
+        packed_areas.byteswap()
+    return LAYER_COUNT.pack(len(codes)) + packed_codes.tobytes() + packed_areas.tobytes()
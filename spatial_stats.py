@@ -0,0 +1,192 @@
+"""Spatial autocorrelation of crop areas: global Moran's I and local Getis-Ord Gi*.
+
+Pesos: matriz de vizinhança (adjacency.py) padronizada por linha. Para o Gi*
+cada município entra na própria vizinhança (w_ii > 0). Os p-valores vêm de
+permutações aleatórias executadas em um pool de processos; nas permutações
+locais o valor do próprio município fica fixo e os vizinhos são sorteados entre
+os outros n - 1 municípios (aleatorização condicional).
+
+Processos spawn reimportam o módulo __main__ do processo pai. Por isso main.py
+só importa a aplicação quando `main.app` é pedido (gunicorn main:app) ou sob o
+guarda `if __name__ == '__main__'`, e os workers do pool carregam apenas este
+módulo e o numpy. Um script sem esse guarda derruba o pool na inicialização
+dos workers; nesse caso as permutações são refeitas no próprio processo.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PERMUTATIONS = int(os.environ.get('SPATIAL_PERMUTATIONS', '999'))
+# 0 executa as permutações no próprio processo
+WORKERS = int(os.environ.get('SPATIAL_WORKERS', str(min(4, os.cpu_count() or 1))))
+PERMUTATION_CHUNK = 100
+SEED = 20230101
+
+# (p máximo, confiança) das classes de hotspot/coldspot, da mais forte para a mais fraca
+SIGNIFICANCE_LEVELS = ((0.01, 99), (0.05, 95), (0.10, 90))
+HOTSPOT_CLASSES = (3, 2, 1, 0, -1, -2, -3)
+
+
+def subgraph(indptr, indices, keep):
+    """CSR restricted to the kept nodes; returns (indptr, indices, kept node positions)"""
+    nodes = np.nonzero(keep)[0]
+    new_position = np.full(len(keep), -1, dtype=np.int64)
+    new_position[nodes] = np.arange(len(nodes))
+    rows = np.repeat(np.arange(len(keep)), np.diff(indptr))
+    entries = keep[rows] & keep[indices]
+    counts = np.bincount(new_position[rows[entries]], minlength=len(nodes))
+    return np.concatenate([[0], np.cumsum(counts)]), new_position[indices[entries]], nodes
+
+
+def _row_sums(indptr, contributions):
+    """Sum of the per-edge contributions (E or (E, B)) of each CSR row; rows without edges give 0"""
+    result = np.zeros((len(indptr) - 1,) + contributions.shape[1:])
+    nonempty = np.diff(indptr) > 0
+    if len(contributions):
+        result[nonempty] = np.add.reduceat(contributions, indptr[:-1][nonempty], axis=0)
+    return result
+
+
+def _lag(indptr, indices, weights, values):
+    """Sparse W @ values for a vector or an (n, B) matrix; rows without neighbours give 0"""
+    return _row_sums(indptr, values[indices] * (weights[:, None] if values.ndim == 2 else weights))
+
+
+def _pseudo_p(larger, permutations):
+    """Folded pseudo p-value: extremes counted on the side of the observed statistic"""
+    larger = np.minimum(larger, permutations - larger)
+    return (larger + 1.0) / (permutations + 1.0)
+
+
+def _permutation_chunk(indptr, indices, weights, gi_weights, self_weights, values, observed_local, seed, count):
+    """Moran's I of ``count`` permutations and how often each local Gi* lag reached the observed one"""
+    rng = np.random.default_rng(seed)
+    mean = values.mean()
+    z = values - mean
+    permuted = np.column_stack([rng.permutation(values) for _ in range(count)])
+    permuted_z = permuted - mean
+
+    moran = (permuted_z * _lag(indptr, indices, weights, permuted_z)).sum(axis=0) / (z * z).sum()
+
+    # Gi*: valor do próprio município fixo; os vizinhos de i vêm dos outros n - 1 valores.
+    # Uma sequência sorteada por permutação serve a todos os nós (como no PySAL): o vizinho
+    # na posição s de i é drawn[s], pulando o índice de i
+    degree = np.diff(indptr)
+    edge_node = np.repeat(np.arange(len(values)), degree)
+    edge_slot = np.arange(len(indices)) - indptr[:-1][edge_node]
+    drawn = np.stack([rng.choice(len(values) - 1, size=int(degree.max(initial=0)), replace=False)
+                      for _ in range(count)], axis=1)
+    sampled = drawn[edge_slot]
+    sampled += sampled >= edge_node[:, None]
+    local = (self_weights * values)[:, None] + _row_sums(indptr, values[sampled] * gi_weights[:, None])
+    larger = (local >= observed_local[:, None]).sum(axis=1)
+    return moran, larger
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context('spawn'))
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def _discard_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _run_permutations(indptr, indices, weights, gi_weights, self_weights, values, observed_local, permutations):
+    chunks = [(SEED + number, min(PERMUTATION_CHUNK, permutations - start))
+              for number, start in enumerate(range(0, permutations, PERMUTATION_CHUNK))]
+    arguments = [(indptr, indices, weights, gi_weights, self_weights, values, observed_local, seed, count)
+                 for seed, count in chunks]
+    results = None
+    if WORKERS > 0 and len(chunks) > 1:
+        try:
+            pool = _get_pool()
+            results = [future.result() for future in [pool.submit(_permutation_chunk, *args) for args in arguments]]
+        except BrokenProcessPool as e:
+            # Workers morreram ao iniciar (ex.: script principal sem o guarda __main__)
+            logger.warning(f"Pool de permutações indisponível, calculando no próprio processo: {e}")
+            _discard_pool()
+    if results is None:
+        results = [_permutation_chunk(*args) for args in arguments]
+    moran = np.concatenate([result[0] for result in results])
+    larger = np.sum([result[1] for result in results], axis=0)
+    return moran, larger
+
+
+def hotspot_class(z_score, p_value):
+    """-3..3 like ArcGIS Gi_Bin: sign from the z-score, magnitude from the confidence level"""
+    for level, (threshold, _) in enumerate(SIGNIFICANCE_LEVELS):
+        if p_value <= threshold:
+            return (3 - level) * (1 if z_score > 0 else -1)
+    return 0
+
+
+def hotspot_label(value_class):
+    if value_class == 0:
+        return 'Não significativo'
+    confidence = SIGNIFICANCE_LEVELS[3 - abs(value_class)][1]
+    return f"{'Hotspot' if value_class > 0 else 'Coldspot'} {confidence}%"
+
+
+def spatial_autocorrelation(indptr, indices, values, permutations=PERMUTATIONS):
+    """Global Moran's I and local Gi* (z-scores, pseudo p-values) for values on a CSR graph
+
+    Nós sem vizinhos devem ser removidos antes (subgraph). Retorna None se os valores forem constantes.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    count = len(values)
+    if count < 3:
+        return None
+    degree = np.diff(indptr)
+    z = values - values.mean()
+    variance = (z * z).sum()
+    if variance == 0:
+        return None
+
+    # Moran: W padronizada por linha (S0 = n)
+    weights = np.repeat(1.0 / degree, degree)
+    moran = float((z * _lag(indptr, indices, weights, z)).sum() / variance)
+
+    # Gi*: w_ij = 1 / (grau + 1), incluindo o próprio município
+    self_weights = 1.0 / (degree + 1)
+    gi_weights = np.repeat(self_weights, degree)
+    local = self_weights * values + _lag(indptr, indices, gi_weights, values)
+    std = np.sqrt(variance / count)
+    # Soma dos pesos = 1; soma dos quadrados = (grau + 1) * (1 / (grau + 1))^2 = self_weights
+    gi_z = (local - values.mean()) / (std * np.sqrt((count * self_weights - 1) / (count - 1)))
+
+    moran_permuted, larger = _run_permutations(indptr, indices, weights, gi_weights, self_weights, values, local,
+                                               permutations)
+    moran_larger = int((moran_permuted >= moran).sum())
+    return {
+        'moran': {
+            'I': moran,
+            'expected': -1.0 / (count - 1),
+            'z': float((moran - moran_permuted.mean()) / moran_permuted.std()) if moran_permuted.std() else 0.0,
+            'p_value': float(_pseudo_p(moran_larger, permutations)),
+            'permutations': permutations,
+            'n': count
+        },
+        'gi_z': gi_z,
+        'p_values': _pseudo_p(larger, permutations)
+    }
@@ -172,505 +172,88 @@ function removeTypingIndicator() {
     }
 }
 
-// Processar comando do chatbot
+// Processar comando do chatbot: interpretação e dados resolvidos no servidor em uma única requisição
 async function processChatbotCommand(message) {
-    const command = parseNaturalLanguageCommand(message);
-
-    if (!command.crop && !command.action) {
-        return {
-            text: 'Não consegui entender sua solicitação. Tente perguntar sobre uma cultura específica ou estado. Por exemplo: "Analise a soja em São Paulo" ou "Mostre a produção de milho".'
-        };
-    }
-
-    // Buscar dados da cultura
-    let analysisText = '';
-    let actions = [];
-
-    if (command.crop) {
-        try {
-            const cropData = await fetchCropAnalysis(command.crop, command.state);
-
-            if (cropData.success) {
-                analysisText = generateAnalysisText(command, cropData);
-                actions.push({
-                    type: 'plot_map',
-                    crop: command.crop,
-                    state: command.state,
-                    data: cropData
-                });
-            } else {
-                const errorMsg = cropData.error || 'Dados não encontrados';
-                analysisText = `❌ Não encontrei dados para a cultura "${command.crop}". ${errorMsg}\n\n`;
-                analysisText += `💡 **Sugestões:**\n`;
-                analysisText += `• Verifique se o nome da cultura está correto\n`;
-                analysisText += `• Tente variações como "soja", "milho", "banana", etc.\n`;
-                analysisText += `• Algumas culturas podem ter nomes específicos no IBGE`;
-            }
-        } catch (error) {
-            analysisText = 'Erro ao buscar dados da cultura. Tente novamente.';
-        }
-    }
-
-    return {
-        text: analysisText,
-        actions: actions
-    };
-}
-
-// Parse de linguagem natural aprimorado
-function parseNaturalLanguageCommand(message) {
-    const lowerMessage = message.toLowerCase()
-        .normalize('NFD')
-        .replace(/[\u0300-\u036f]/g, '') // Remove acentos
-        .replace(/[^a-z0-9\s]/g, ' ') // Remove pontuação
-        .replace(/\s+/g, ' ') // Normaliza espaços
-        .trim();
-
-    // Mapeamento inteligente de culturas com variações
-    const cropMappings = {
-        'soja': ['soja', 'soj', 'sojas', 'grão de soja', 'grao de soja'],
-        'milho': ['milho', 'milh', 'milhos', 'milho graos', 'milho grao'],
-        'banana': ['banana', 'banan', 'bananas', 'banana cacho', 'bananeira'],
-        'café': ['cafe', 'caf', 'cafes', 'cafeeiro', 'cafeicultura'],
-        'cana-de-açúcar': ['cana', 'cana de acucar', 'cana acucar', 'canavieiro'],
-        'arroz': ['arroz', 'arro', 'arrozal', 'rizicultura'],
-        'feijão': ['feijao', 'feija', 'feijoes', 'feijao grao'],
-        'algodão': ['algodao', 'algoda', 'algodoeiro', 'cotonicultura'],
-        'laranja': ['laranja', 'laranj', 'citrus', 'laranjeira'],
-        'uva': ['uva', 'uvas', 'viticultura', 'parreira'],
-        'maçã': ['maca', 'mac', 'macas', 'macieira'],
-        'tomate': ['tomate', 'tomat', 'tomateiro', 'tomaticultura'],
-        'batata': ['batata', 'batat', 'batatas', 'bataticultura'],
-        'mandioca': ['mandioca', 'mandio', 'aipim', 'macaxeira', 'mandiocultura']
-    };
-
-    // Mapeamento completo de estados com variações
-    const stateMappings = {
-        'AC': ['acre', 'ac'],
-        'AL': ['alagoas', 'al', 'alagoa'],
-        'AP': ['amapa', 'ap'],
-        'AM': ['amazonas', 'am', 'amazonia'],
-        'BA': ['bahia', 'ba'],
-        'CE': ['ceara', 'ce'],
-        'DF': ['distrito federal', 'df', 'brasilia', 'distritofederal'],
-        'ES': ['espirito santo', 'es', 'espiritosanto'],
-        'GO': ['goias', 'go', 'goiania'],
-        'MA': ['maranhao', 'ma'],
-        'MT': ['mato grosso', 'mt', 'matogrosso'],
-        'MS': ['mato grosso do sul', 'ms', 'matogrossodosul'],
-        'MG': ['minas gerais', 'mg', 'minasgerais', 'minas'],
-        'PA': ['para', 'pa'],
-        'PB': ['paraiba', 'pb'],
-        'PR': ['parana', 'pr', 'paraná', 'p.parana', 'p parana'],
-        'PE': ['pernambuco', 'pe', 'p.pernambuco', 'p pernambuco'],
-        'PI': ['piaui', 'pi', 'piauí', 'p.piaui', 'p piaui'],
-        'RJ': ['rio de janeiro', 'rj', 'riodejaneiro', 'r.janeiro', 'r janeiro'],
-        'RN': ['rio grande do norte', 'rn', 'riograndedonorte', 'r.norte', 'r norte'],
-        'RS': ['rio grande do sul', 'rs', 'riograndedosul', 'r.sul', 'r sul'],
-        'RO': ['rondonia', 'ro'],
-        'RR': ['roraima', 'rr'],
-        'SC': ['santa catarina', 'sc', 'santacatarina'],
-        'SP': ['sao paulo', 'sp', 'saopaulo', 'sampa', 'são paulo', 's.paulo', 's paulo', 'paulista'],
-        'SE': ['sergipe', 'se'],
-        'TO': ['tocantins', 'to']
-    };
-
-    let detectedCrop = null;
-    let detectedState = null;
-    let action = 'analyze';
-
-    // Detectar cultura usando busca inteligente
-    detectedCrop = findBestMatch(lowerMessage, cropMappings);
-
-    // Detectar estado usando busca inteligente
-    detectedState = findBestMatch(lowerMessage, stateMappings, true);
-
-    // Debug para rastreamento detalhado
-    console.log(`=== ANÁLISE DE COMANDO ===`);
-    console.log(`Mensagem original: "${message}"`);
-    console.log(`Mensagem processada: "${lowerMessage}"`);
-    console.log(`Cultura detectada: ${detectedCrop}`);
-    console.log(`Estado detectado: ${detectedState}`);
-
-    // Verificar se o usuário solicitou análise nacional explicitamente
-    const isNationalRequest = lowerMessage.includes('brasil') || 
-                             lowerMessage.includes('nacional') || 
-                             lowerMessage.includes('todo o brasil') ||
-                             lowerMessage.includes('nivel nacional') ||
-                             lowerMessage.includes('nível nacional') ||
-                             (!detectedState && (lowerMessage.includes('analise') || lowerMessage.includes('mostre') || lowerMessage.includes('dados')));
-
-    if (detectedState && !isNationalRequest) {
-        console.log(`✅ Estado detectado: ${detectedState} na mensagem: "${lowerMessage}"`);
-    } else if (isNationalRequest || !detectedState) {
-        console.log(`🇧🇷 Análise nacional solicitada ou nenhum estado específico detectado`);
-        detectedState = null; // Garantir análise nacional
-    } else {
-        console.log(`❌ Nenhum estado detectado na mensagem: "${lowerMessage}"`);
-        // Mostrar palavras da mensagem para debug
-        console.log(`Palavras na mensagem:`, lowerMessage.split(' '));
-    }
-    console.log(`=========================`);
-
-    // Detectar ação com mais variações
-    if (lowerMessage.includes('compare') || lowerMessage.includes('comparar') || 
-        lowerMessage.includes('versus') || lowerMessage.includes('vs')) {
-        action = 'compare';
-    } else if (lowerMessage.includes('analise') || lowerMessage.includes('analisa') || 
-               lowerMessage.includes('analizar') || lowerMessage.includes('estudo')) {
-        action = 'analyze';
-    } else if (lowerMessage.includes('mostre') || lowerMessage.includes('mostra') || 
-               lowerMessage.includes('exibe') || lowerMessage.includes('apresente')) {
-        action = 'show';
-    }
-
-    return {
-        crop: detectedCrop,
-        state: detectedState,
-        action: action,
-        originalMessage: message
-    };
-}
-
-// Função auxiliar para encontrar a melhor correspondência
-function findBestMatch(text, mappings, isStateMapping = false) {
-    let bestMatch = null;
-    let highestScore = 0;
-
-    // Para estados, fazer busca mais específica primeiro
-    if (isStateMapping) {
-        // Busca direta por siglas (2 letras)
-        const words = text.split(' ');
-        for (const word of words) {
-            const cleanWord = word.replace(/[^a-z]/g, ''); // Remove pontuação
-            if (cleanWord.length === 2 && cleanWord.toUpperCase() in mappings) {
-                console.log(`Estado encontrado por sigla: ${cleanWord.toUpperCase()}`);
-                return cleanWord.toUpperCase();
-            }
-        }
-
-        // Busca específica por palavras-chave dos estados
-        const stateKeywords = {
-            'parana': 'PR',
-            'paraná': 'PR',
-            'pernambuco': 'PE',
-            'piaui': 'PI',
-            'piauí': 'PI',
-            'saopaulo': 'SP',
-            'sao paulo': 'SP',
-            'são paulo': 'SP',
-            'riodejaneiro': 'RJ',
-            'rio de janeiro': 'RJ',
-            'minasgerais': 'MG',
-            'minas gerais': 'MG',
-            'riograndedosul': 'RS',
-            'rio grande do sul': 'RS',
-            'santacatarina': 'SC',
-            'santa catarina': 'SC'
-        };
-
-        for (const [keyword, state] of Object.entries(stateKeywords)) {
-            if (text.includes(keyword)) {
-                console.log(`Estado encontrado por palavra-chave: ${keyword} -> ${state}`);
-                return state;
-            }
-        }
-    }
-
-    for (const [key, variations] of Object.entries(mappings)) {
-        for (const variation of variations) {
-            const score = calculateMatchScore(text, variation);
-            if (score > highestScore) {
-                highestScore = score;
-                bestMatch = key;
-            }
-        }
-    }
-
-    // Para estados, usar threshold mais baixo para melhor detecção
-    const threshold = isStateMapping ? 0.4 : 0.5;
-    const result = highestScore > threshold ? bestMatch : null;
-
-    if (isStateMapping) {
-        console.log(`Busca por estado - Melhor match: ${bestMatch}, Score: ${highestScore}, Threshold: ${threshold}, Resultado: ${result}`);
-    }
-
-    return result;
-}
-
-// Função para calcular pontuação de correspondência
-function calculateMatchScore(text, term) {
-    const words = text.split(' ');
-
-    // Busca exata
-    if (text.includes(term)) {
-        return 1.0;
-    }
-
-    // Busca por palavra completa
-    if (words.includes(term)) {
-        return 0.9;
-    }
-
-    // Para siglas de 2 letras, dar prioridade alta
-    if (term.length === 2) {
-        for (const word of words) {
-            if (word === term) {
-                return 1.0;
-            }
-        }
-    }
-
-    // Busca por início de palavra
-    for (const word of words) {
-        if (word.startsWith(term) || term.startsWith(word)) {
-            const similarity = Math.min(word.length, term.length) / Math.max(word.length, term.length);
-            if (similarity > 0.7) {
-                return 0.8 * similarity;
-            }
-        }
-    }
-
-    // Busca por substring com tolerância
-    for (const word of words) {
-        if (word.length >= 3 && term.length >= 3) {
-            const commonLength = getCommonSubstringLength(word, term);
-            const similarity = commonLength / Math.max(word.length, term.length);
-            if (similarity > 0.6) {
-                return 0.7 * similarity;
-            }
-        }
-    }
-
-    return 0;
-}
-
-// Função para calcular comprimento de substring comum
-function getCommonSubstringLength(str1, str2) {
-    let maxLength = 0;
-    for (let i = 0; i < str1.length; i++) {
-        for (let j = 0; j < str2.length; j++) {
-            let length = 0;
-            while (i + length < str1.length && 
-                   j + length < str2.length && 
-                   str1[i + length] === str2[j + length]) {
-                length++;
-            }
-            maxLength = Math.max(maxLength, length);
-        }
-    }
-    return maxLength;
-}
-
-// Buscar análise da cultura com mapeamento inteligente
-async function fetchCropAnalysis(cropName, stateCode) {
+    let answer;
     try {
-        // Mapeamento de nomes de culturas para os nomes reais no sistema
-        const cropNameMapping = {
-            'soja': 'Soja (em grão)',
-            'milho': 'Milho (em grão)',
-            'banana': 'Banana (cacho)',
-            'café': 'Café (em grão) Total',
-            'cana-de-açúcar': 'Cana-de-açúcar',
-            'arroz': 'Arroz (em casca)',
-            'feijão': 'Feijão (em grão)',
-            'algodão': 'Algodão herbáceo (em caroço)',
-            'laranja': 'Laranja',
-            'uva': 'Uva',
-            'maçã': 'Maçã',
-            'tomate': 'Tomate',
-            'batata': 'Batata-inglesa',
-            'mandioca': 'Mandioca'
-        };
-
-        // Tentar encontrar o nome real da cultura
-        const realCropName = cropNameMapping[cropName.toLowerCase()] || cropName;
-
-        // Buscar dados da cultura
-        let response = await fetch(`/api/crop-data/${encodeURIComponent(realCropName)}`);
-        let data = await response.json();
-
-        // Se não encontrou, tentar com o nome original
-        if (!data.success && realCropName !== cropName) {
-            response = await fetch(`/api/crop-data/${encodeURIComponent(cropName)}`);
-            data = await response.json();
-        }
-
-        // Se ainda não encontrou, tentar buscar por similaridade
-        if (!data.success) {
-            // Buscar lista de culturas disponíveis
-            const cropsResponse = await fetch('/api/crops');
-            const cropsData = await cropsResponse.json();
-
-            if (cropsData.success) {
-                const availableCrops = cropsData.crops;
-                const similarCrop = findSimilarCropName(cropName, availableCrops);
-
-                if (similarCrop) {
-                    response = await fetch(`/api/crop-data/${encodeURIComponent(similarCrop)}`);
-                    data = await response.json();
-
-                    if (data.success) {
-                        console.log(`Cultura encontrada por similaridade: ${cropName} -> ${similarCrop}`);
-                    }
-                }
-            }
-        }
-
-        if (!data.success) {
-            return { success: false };
-        }
-
-        let analysisData = data.data;
-
-        // Filtrar por estado se especificado
-        if (stateCode) {
-            analysisData = Object.fromEntries(
-                Object.entries(data.data).filter(([code, info]) => info.state_code === stateCode)
-            );
-        }
-
-        // Buscar estatísticas
-        const finalCropName = data.matched_crop || realCropName;
-        
-        try {
-            const statsResponse = await fetch(`/api/analysis/statistical-summary/${encodeURIComponent(finalCropName)}`);
-            const statsData = await statsResponse.json();
-            
-            return {
-                success: true,
-                cropData: analysisData,
-                statistics: statsData.success ? statsData.summary : null,
-                cropName: finalCropName,
-                stateCode: stateCode
-            };
-        } catch (statsError) {
-            console.warn('Erro ao buscar estatísticas, mas continuando sem elas:', statsError);
-            return {
-                success: true,
-                cropData: analysisData,
-                statistics: null,
-                cropName: finalCropName,
-                stateCode: stateCode
-            };
-        }
-
+        const response = await fetch(`/api/chatbot/query?q=${encodeURIComponent(message)}`);
+        answer = await response.json();
     } catch (error) {
-        console.error('Erro ao buscar análise:', error);
-        return { success: false, error: error.message };
+        console.error('Erro ao consultar o chatbot:', error);
+        return { text: 'Erro ao buscar dados da cultura. Tente novamente.' };
     }
-}
-
-// Função para encontrar cultura similar na lista disponível
-function findSimilarCropName(searchName, availableCrops) {
-    const normalizedSearch = searchName.toLowerCase()
-        .normalize('NFD')
-        .replace(/[\u0300-\u036f]/g, '');
-
-    let bestMatch = null;
-    let highestScore = 0;
-
-    for (const crop of availableCrops) {
-        const normalizedCrop = crop.toLowerCase()
-            .normalize('NFD')
-            .replace(/[\u0300-\u036f]/g, '');
-
-        // Verifica se o termo de busca está contido no nome da cultura
-        if (normalizedCrop.includes(normalizedSearch) || normalizedSearch.includes(normalizedCrop)) {
-            const score = Math.min(normalizedSearch.length, normalizedCrop.length) / 
-                         Math.max(normalizedSearch.length, normalizedCrop.length);
 
-            if (score > highestScore) {
-                highestScore = score;
-                bestMatch = crop;
-            }
+    if (!answer.success) {
+        if (!answer.query || !answer.query.crop) {
+            return {
+                text: 'Não consegui entender sua solicitação. Tente perguntar sobre uma cultura específica ou estado. Por exemplo: "Analise a soja em São Paulo" ou "Mostre a produção de milho".'
+            };
         }
 
-        // Verifica correspondência por palavras
-        const searchWords = normalizedSearch.split(' ');
-        const cropWords = normalizedCrop.split(' ');
-
-        for (const searchWord of searchWords) {
-            for (const cropWord of cropWords) {
-                if (searchWord.length >= 3 && cropWord.length >= 3) {
-                    if (cropWord.includes(searchWord) || searchWord.includes(cropWord)) {
-                        const score = Math.min(searchWord.length, cropWord.length) / 
-                                     Math.max(searchWord.length, cropWord.length);
-
-                        if (score > highestScore && score > 0.7) {
-                            highestScore = score;
-                            bestMatch = crop;
-                        }
-                    }
-                }
-            }
-        }
+        let analysisText = `❌ Não encontrei dados para a cultura "${answer.query.crop}". ${answer.error || 'Dados não encontrados'}\n\n`;
+        analysisText += `💡 **Sugestões:**\n`;
+        analysisText += `• Verifique se o nome da cultura está correto\n`;
+        analysisText += `• Tente variações como "soja", "milho", "banana", etc.\n`;
+        analysisText += `• Algumas culturas podem ter nomes específicos no IBGE`;
+        return { text: analysisText, actions: [] };
     }
 
-    return highestScore > 0.5 ? bestMatch : null;
+    return {
+        text: generateAnalysisText(answer),
+        actions: [{
+            type: 'plot_map',
+            crop: answer.crop,
+            state: answer.state,
+            data: answer
+        }]
+    };
 }
 
-// Gerar texto de análise
-function generateAnalysisText(command, cropData) {
-    const { cropName, stateCode } = cropData;
-    const data = cropData.cropData;
-    const stats = cropData.statistics;
-
-    if (Object.keys(data).length === 0) {
-        return `Não encontrei dados para a cultura "${cropName}"${stateCode ? ` no estado ${stateCode}` : ''}.`;
-    }
-
-    // Calcular estatísticas básicas - apenas municípios válidos
-    const municipalities = Object.values(data);
-    const validMunicipalities = municipalities.filter(m => m.harvested_area && m.harvested_area > 0);
+// Gerar texto de análise a partir da resposta de /api/chatbot/query
+function generateAnalysisText(answer) {
+    const cropName = answer.crop;
+    const stateCode = answer.state;
+    const stats = answer.summary;
+    const topProducers = answer.top_producers || [];
 
-    if (validMunicipalities.length === 0) {
-        return `Não encontrei dados válidos para a cultura "${cropName}"${stateCode ? ` no estado ${stateCode}` : ''}.`;
+    if (!stats || topProducers.length === 0) {
+        return `Não encontrei dados válidos para a cultura "${cropName}"${stateCode ? ` em ${stateCode.replace(/,/g, ', ')}` : ''}.`;
     }
 
-    const totalArea = validMunicipalities.reduce((sum, m) => sum + parseFloat(m.harvested_area), 0);
-    const avgArea = totalArea / validMunicipalities.length;
-
-    // Ordenar todos os municípios por área colhida (maior para menor)
-    const sortedMunicipalities = validMunicipalities.sort((a, b) => 
-        parseFloat(b.harvested_area) - parseFloat(a.harvested_area)
-    );
-
     // Município com maior produção
-    const topMunicipality = sortedMunicipalities[0];
+    const topMunicipality = topProducers[0];
 
     let analysisText = `📊 **Análise da Cultura: ${cropName.charAt(0).toUpperCase() + cropName.slice(1)}**\n\n`;
 
     if (stateCode) {
-        analysisText += `🌍 **Estado:** ${stateCode}\n`;
+        const stateLabel = stateCode.includes(',') ? 'Estados' : 'Estado';
+        analysisText += `🌍 **${stateLabel}:** ${stateCode.replace(/,/g, ', ')}\n`;
     }
 
     analysisText += `📈 **Estatísticas Principais:**\n`;
-    analysisText += `• **Municípios com dados:** ${validMunicipalities.length}\n`;
-    analysisText += `• **Área total colhida:** ${formatNumber(totalArea)} hectares\n`;
-    analysisText += `• **Área média por município:** ${formatNumber(avgArea)} hectares\n\n`;
+    analysisText += `• **Municípios com dados:** ${stats.count}\n`;
+    analysisText += `• **Área total colhida:** ${formatNumber(stats.total)} hectares\n`;
+    analysisText += `• **Área média por município:** ${formatNumber(stats.mean)} hectares\n\n`;
 
     analysisText += `🏆 **Maior Produtor:**\n`;
     analysisText += `• **${topMunicipality.municipality_name}** (${topMunicipality.state_code})\n`;
     analysisText += `• **Área colhida:** ${formatNumber(topMunicipality.harvested_area)} hectares\n\n`;
 
     // Mostrar top 3 maiores produtores para validação
-    if (sortedMunicipalities.length >= 3) {
+    if (topProducers.length >= 3) {
         analysisText += `📋 **Top 3 Maiores Produtores:**\n`;
         for (let i = 0; i < 3; i++) {
-            const municipality = sortedMunicipalities[i];
+            const municipality = topProducers[i];
             analysisText += `${i + 1}. **${municipality.municipality_name}** (${municipality.state_code}): ${formatNumber(municipality.harvested_area)} ha\n`;
         }
         analysisText += `\n`;
     }
 
-    if (stats) {
-        analysisText += `📊 **Estatísticas Detalhadas:**\n`;
-        analysisText += `• **Mediana:** ${formatNumber(stats.median)} hectares\n`;
-        analysisText += `• **Desvio padrão:** ${formatNumber(stats.std_dev)} hectares\n`;
-        analysisText += `• **Valor mínimo:** ${formatNumber(stats.min)} hectares\n`;
-        analysisText += `• **Valor máximo:** ${formatNumber(stats.max)} hectares\n\n`;
-    }
+    analysisText += `📊 **Estatísticas Detalhadas:**\n`;
+    analysisText += `• **Mediana:** ${formatNumber(stats.median)} hectares\n`;
+    analysisText += `• **Desvio padrão:** ${formatNumber(stats.std_dev)} hectares\n`;
+    analysisText += `• **Valor mínimo:** ${formatNumber(stats.min)} hectares\n`;
+    analysisText += `• **Valor máximo:** ${formatNumber(stats.max)} hectares\n\n`;
 
     analysisText += `🗺️ **Visualizando no mapa...** Os dados foram plotados automaticamente para sua análise visual.\n\n`;
     
@@ -716,8 +299,8 @@ async function plotCropOnMap(cropName, stateCode, data) {
 
         activeLayers.push(layer);
 
-        // Aplicar camada no mapa
-        await loadCropLayerForLayer(layer);
+        // Aplicar camada no mapa com os dados já recebidos do chatbot
+        await loadCropLayerForLayer(layer, data ? { success: true, data: data.data } : null);
 
         // Atualizar interface
         updateLayersList();
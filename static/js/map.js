@@ -52,6 +52,109 @@ function initializeMap() {
     console.log('Map initialized successfully with bounds:', brazilBounds);
 }
 
+// Metadados dos municípios (nome/UF), baixados uma vez por versão do dataset
+let municipalityMetadata = null;
+
+async function fetchMunicipalityMetadata(version) {
+    if (municipalityMetadata && municipalityMetadata.version === version) {
+        return municipalityMetadata;
+    }
+
+    const response = await fetch(`/api/municipalities/metadata?v=${encodeURIComponent(version || '')}`);
+    const metadata = await response.json();
+    const index = {};
+    metadata.codes.forEach((code, i) => { index[code] = i; });
+
+    municipalityMetadata = { version: metadata.version, names: metadata.names, states: metadata.states, index };
+    return municipalityMetadata;
+}
+
+// Busca a camada no formato binário (int32 códigos + float32 áreas) e monta
+// o mesmo objeto {código: {municipality_name, state_code, harvested_area}} da API JSON
+async function fetchCropLayer(cropName) {
+    const response = await fetch(`/api/crop-data/${encodeURIComponent(cropName)}?format=binary`);
+    const contentType = response.headers.get('Content-Type') || '';
+    if (!contentType.startsWith('application/vnd.geografico.columnar')) {
+        return response.json();
+    }
+
+    const version = response.headers.get('X-Dataset-Version');
+    const matchedCrop = decodeURIComponent(response.headers.get('X-Matched-Crop') || cropName);
+    const [buffer, metadata] = await Promise.all([response.arrayBuffer(), fetchMunicipalityMetadata(version)]);
+
+    const count = new DataView(buffer).getUint32(0, true);
+    const codes = new Int32Array(buffer, 4, count);
+    const areas = new Float32Array(buffer, 4 + count * 4, count);
+
+    const data = {};
+    for (let i = 0; i < count; i++) {
+        const row = metadata.index[codes[i]];
+        data[codes[i]] = {
+            municipality_name: row !== undefined ? metadata.names[row] : 'Desconhecido',
+            state_code: row !== undefined ? metadata.states[row] : 'XX',
+            harvested_area: areas[i]
+        };
+    }
+
+    const result = { success: true, data };
+    if (matchedCrop !== cropName) {
+        result.matched_crop = matchedCrop;
+    }
+    return result;
+}
+
+// Topologia gerada por topology.py: arcos compartilhados, quantizados e codificados por diferença
+const MUNICIPALITY_TOPOLOGY_FILE = '/static/data/brazil_municipalities_all.topo.json';
+
+function topologyToGeoJSON(topology, objectName = 'municipalities') {
+    const [scaleX, scaleY] = topology.transform.scale;
+    const [translateX, translateY] = topology.transform.translate;
+
+    const arcs = topology.arcs.map(arc => {
+        let x = 0, y = 0;
+        return arc.map(([dx, dy]) => {
+            x += dx;
+            y += dy;
+            return [x * scaleX + translateX, y * scaleY + translateY];
+        });
+    });
+
+    // Índice negativo (~i) = arco i percorrido ao contrário; o primeiro ponto repete o fim do anterior
+    const ring = arcIndexes => {
+        const points = [];
+        arcIndexes.forEach(index => {
+            const arc = index >= 0 ? arcs[index] : arcs[~index].slice().reverse();
+            for (let i = points.length ? 1 : 0; i < arc.length; i++) {
+                points.push(arc[i]);
+            }
+        });
+        return points;
+    };
+    const polygon = rings => rings.map(ring);
+
+    const features = topology.objects[objectName].geometries.map(geometry => {
+        let coordinates = null;
+        if (geometry.type === 'Polygon') {
+            coordinates = polygon(geometry.arcs);
+        } else if (geometry.type === 'MultiPolygon') {
+            coordinates = geometry.arcs.map(polygon);
+        }
+        return {
+            type: 'Feature',
+            properties: geometry.properties || {},
+            geometry: coordinates ? { type: geometry.type, coordinates } : null
+        };
+    });
+
+    return { type: 'FeatureCollection', features };
+}
+
+// Lê a resposta de um arquivo de limites, decodificando a topologia quando for o caso
+async function parseBoundaryResponse(response) {
+    const data = await response.json();
+    return data.type === 'Topology' ? topologyToGeoJSON(data) : data;
+}
+
 function loadCropLayer(cropName) {
     console.log(`Loading crop layer for: ${cropName}`);
 
@@ -65,8 +168,7 @@ function loadCropLayer(cropName) {
     }
 
     // Fetch crop data
-    fetch(`/api/crop-data/${encodeURIComponent(cropName)}`)
-        .then(response => response.json())
+    fetchCropLayer(cropName)
         .then(data => {
             if (data.success) {
                 currentCropData = data.data;
@@ -110,6 +212,7 @@ function loadMunicipalityBoundaries(cropName) {
 
     // Try to load the most complete GeoJSON file available
     const geoJsonFiles = [
+        MUNICIPALITY_TOPOLOGY_FILE,
         '/static/data/brazil_municipalities_all.geojson',
         '/attached_assets/brazil_municipalities_all_1752980285489.geojson',
         '/static/data/brazil_municipalities_combined.geojson',
@@ -124,7 +227,7 @@ function loadMunicipalityBoundaries(cropName) {
                 console.log(`Tentando carregar: ${filePath}`);
                 const response = await fetch(filePath);
                 if (response.ok) {
-                    const geoData = await response.json();
+                    const geoData = await parseBoundaryResponse(response);
                     console.log(`GeoJSON carregado com sucesso: ${filePath}, ${geoData.features.length} municípios`);
 
                     // Store all municipalities data
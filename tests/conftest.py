@@ -0,0 +1,71 @@
+import atexit
+import json
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from crop_table import CropTable
+
+DATA_DIR = tempfile.mkdtemp(prefix='geografico-tests-')
+atexit.register(shutil.rmtree, DATA_DIR, ignore_errors=True)
+
+# dataset, app e tile_renderer leem a configuração ao serem importados: tudo aponta
+# para o diretório temporário antes do primeiro import
+os.environ.update({
+    'CROP_DATA_PATH': os.path.join(DATA_DIR, 'crop_data_static.json'),
+    'DATABASE_URL': f"sqlite:///{os.path.join(DATA_DIR, 'geografico.db')}",
+    'DATA_BACKEND': 'json',
+    'DATASET_STORAGE': 'dict',
+    'DATASET_RELOAD_INTERVAL': '0',
+    'CACHE_WARMUP': 'off',
+    'LOG_LEVEL': 'WARNING',
+    'GEOJSON_PATH': os.path.join(DATA_DIR, 'municipalities.geojson'),
+    'FEATURE_INDEX_PATH': os.path.join(DATA_DIR, 'municipality_features.idx.json'),
+    'ADJACENCY_PATH': os.path.join(DATA_DIR, 'municipality_adjacency.bin'),
+    'TILE_CACHE_DIR': os.path.join(DATA_DIR, 'tiles'),
+})
+
+# Cinco municípios reais, três culturas; áreas escolhidas para ordenações sem empate
+CROP_DATA = {
+    'Soja (em grão)': {
+        '5100102': {'municipality_name': 'Acorizal', 'state_code': 'MT', 'harvested_area': 1000.0},
+        '5103403': {'municipality_name': 'Cuiabá', 'state_code': 'MT', 'harvested_area': 500.0},
+        '5208707': {'municipality_name': 'Goiânia', 'state_code': 'GO', 'harvested_area': 2000.0},
+        '4106902': {'municipality_name': 'Curitiba', 'state_code': 'PR', 'harvested_area': 300.0},
+    },
+    'Milho (em grão)': {
+        '5100102': {'municipality_name': 'Acorizal', 'state_code': 'MT', 'harvested_area': 200.0},
+        '5208707': {'municipality_name': 'Goiânia', 'state_code': 'GO', 'harvested_area': 800.0},
+        '3550308': {'municipality_name': 'São Paulo', 'state_code': 'SP', 'harvested_area': 50.0},
+    },
+    'Arroz (em casca)': {
+        '4106902': {'municipality_name': 'Curitiba', 'state_code': 'PR', 'harvested_area': 100.0},
+        '3550308': {'municipality_name': 'São Paulo', 'state_code': 'SP', 'harvested_area': 10.0},
+    },
+}
+
+with open(os.environ['CROP_DATA_PATH'], 'w', encoding='utf-8') as f:
+    json.dump(CROP_DATA, f, ensure_ascii=False)
+
+
+@pytest.fixture
+def crop_data():
+    return {crop_name: {code: dict(data) for code, data in layer.items()} for crop_name, layer in CROP_DATA.items()}
+
+
+@pytest.fixture
+def crop_table(crop_data):
+    return CropTable.build('v1', crop_data, crop_data.get)
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
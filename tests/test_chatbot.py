@@ -0,0 +1,100 @@
+import io
+
+import pandas as pd
+import pytest
+
+from chatbot import QueryIndex, fold, parse_query
+from conftest import CROP_DATA
+
+SOJA, MILHO, ARROZ = 'Soja (em grão)', 'Milho (em grão)', 'Arroz (em casca)'
+
+
+@pytest.fixture(scope='module')
+def index():
+    return QueryIndex(CROP_DATA)
+
+
+def test_fold():
+    assert fold('  Feijão-de-corda, SÃO Paulo!! ') == 'feijao de corda sao paulo'
+
+
+@pytest.mark.parametrize('message, crop, states', [
+    ('Mostre a soja em Mato Grosso', SOJA, ['MT']),
+    ('milho no mato grosso do sul', MILHO, ['MS']),
+    ('grão de soja em goiás', SOJA, ['GO']),
+    ('GRAO DE SOJA EM GOIAS', SOJA, ['GO']),
+    ('Arroz (em casca) no Paraná', ARROZ, ['PR']),
+    ('rizicultura em sampa', ARROZ, ['SP']),
+    ('milhos em minas', MILHO, ['MG']),
+    ('soj do DF', SOJA, ['DF']),
+])
+def test_crop_and_state_from_names_and_aliases(index, message, crop, states):
+    query = parse_query(message, index)
+    assert (query['crop'], query['states']) == (crop, states)
+    assert query['state'] == states[0] and query['national'] is False
+
+
+@pytest.mark.parametrize('message, states', [
+    ('soja MT', ['MT']),
+    ('soja em mt', ['MT']),
+    ('soja em SE', ['SE']),     # sigla ambígua em maiúsculas
+    ('soja se houver', []),     # ... e em minúsculas é só uma palavra
+    ('milho no Pará', ['PA']),
+    ('dados para o milho', []),
+])
+def test_uf_codes(index, message, states):
+    assert parse_query(message, index)['states'] == states
+
+
+def test_several_states_are_all_kept(index):
+    query = parse_query('soja em são paulo e mt', index)
+    assert query['states'] == ['MT', 'SP'] and query['state'] == 'MT,SP'
+
+    # "mato grosso" dentro de "mato grosso do sul" não conta duas vezes
+    query = parse_query('compare milho em mato grosso do sul, mato grosso e MS', index)
+    assert query['states'] == ['MS', 'MT'] and query['action'] == 'compare'
+
+
+def test_national_and_unknown_crop(index):
+    query = parse_query('analise da soja no Brasil todo (SP e MT)', index)
+    assert query['crop'] == SOJA and query['states'] == [] and query['state'] is None and query['national']
+
+    # Alias conhecido, mas a cultura não está nos dados
+    assert parse_query('feijão em goiás', index)['crop'] is None
+    assert parse_query('', index) == {'crop': None, 'crop_term': None, 'state': None, 'states': [],
+                                      'national': True, 'action': 'analyze'}
+
+
+def test_route_answers_for_several_states(client):
+    body = client.get('/api/chatbot/query', query_string={'q': 'soja em Goiás e MT'}).get_json()
+
+    assert body['success'] and (body['crop'], body['state']) == (SOJA, 'GO,MT')
+    assert set(body['data']) == {'5100102', '5103403', '5208707'}
+    assert [producer['municipality_code'] for producer in body['top_producers']] == ['5208707', '5100102', '5103403']
+    assert body['summary']['count'] == 3
+
+
+def test_route_single_state_and_national(client):
+    body = client.get('/api/chatbot/query', query_string={'q': 'mostre o milho em são paulo'}).get_json()
+    assert body['state'] == 'SP' and list(body['data']) == ['3550308']
+
+    body = client.get('/api/chatbot/query', query_string={'q': 'arroz'}).get_json()
+    assert body['state'] is None and set(body['data']) == set(CROP_DATA[ARROZ])
+
+
+@pytest.mark.parametrize('question, error', [
+    ('', 'Pergunta vazia'),
+    ('   ', 'Pergunta vazia'),
+    ('plantio de feijão em goiás', 'Cultura não identificada na pergunta'),
+])
+def test_route_rejects_empty_questions_and_unknown_crops(client, question, error):
+    body = client.get('/api/chatbot/query', query_string={'q': question}).get_json()
+    assert body['success'] is False and body['error'] == error
+
+
+def test_export_accepts_the_states_of_a_chatbot_answer(client):
+    response = client.get('/api/export/crop-analysis/Soja (em grão)', query_string={'state': 'GO,MT'})
+    assert response.status_code == 200
+    assert '_GO-MT_' in response.headers['Content-Disposition']
+    detailed = pd.read_excel(io.BytesIO(response.data), sheet_name='Dados Detalhados')
+    assert sorted(detailed.iloc[:, 0].astype(str)) == ['5100102', '5103403', '5208707']
@@ -0,0 +1,64 @@
+import math
+
+import pytest
+
+from crop_similarity import CropMixIndex
+from crop_table import CropTable
+
+
+@pytest.fixture
+def index(crop_table):
+    return CropMixIndex(crop_table)
+
+
+def similar(index, code, **kwargs):
+    table = index.table
+    return [(table.codes[row], score) for row, score in index.similar(table.code_position[code], **kwargs)]
+
+
+def test_cosine_neighbours(index):
+    # Cuiabá só planta soja: o mais parecido é quem tem mais soja no mix
+    result = similar(index, '5103403', k=3)
+    assert [code for code, _ in result] == ['5100102', '4106902', '5208707']
+    assert [score for _, score in result] == pytest.approx([5 / math.sqrt(26), 0.75 / math.sqrt(0.625),
+                                                            5 / math.sqrt(29)], rel=1e-6)
+
+
+def test_euclidean_distances(index):
+    result = similar(index, '5103403', k=10, metric='euclidean')
+    assert [code for code, _ in result] == ['5100102', '4106902', '5208707', '3550308']
+    assert result[0][1] == pytest.approx(math.sqrt(2) / 6, rel=1e-6)
+    assert result[-1][1] == pytest.approx(math.sqrt(62 / 36), rel=1e-6)
+
+
+def test_state_filter_and_self_exclusion(index):
+    assert [code for code, _ in similar(index, '5103403', states=['GO', 'SP'])] == ['5208707', '3550308']
+    assert similar(index, '5103403', states=['MT']) == [('5100102', pytest.approx(5 / math.sqrt(26), rel=1e-6))]
+    assert similar(index, '5103403', k=0) == []
+
+
+def test_top_crops(index):
+    position = index.table.code_position['5208707']
+    assert index.top_crops(position) == [('Soja (em grão)', pytest.approx(5 / 7)),
+                                         ('Milho (em grão)', pytest.approx(2 / 7))]
+
+
+def test_subtotal_components_are_left_out():
+    layers = {
+        'Café (em grão) Total': {'3100104': {'harvested_area': 100.0}, '3100203': {'harvested_area': 100.0}},
+        'Café (em grão) Arábica': {'3100104': {'harvested_area': 100.0}},
+        'Milho (em grão)': {'3100104': {'harvested_area': 100.0}, '3100203': {'harvested_area': 100.0}},
+    }
+    index = CropMixIndex(CropTable.build('v1', layers, layers.get))
+    # Sem a Arábica os dois municípios têm o mesmo mix (metade café, metade milho)
+    (row, score), = index.similar(0, k=5)
+    assert index.table.codes[row] == '3100203'
+    assert score == pytest.approx(1.0)
+    assert index.totals.tolist() == [200.0, 200.0]
+
+
+def test_ties_are_ordered_by_code():
+    layers = {'Soja': {code: {'harvested_area': 10.0} for code in ('5200050', '5200100', '5200001', '5200209')}}
+    index = CropMixIndex(CropTable.build('v1', layers, layers.get))
+    rows = [row for row, _ in index.similar(index.table.code_position['5200100'], k=3)]
+    assert [index.table.codes[row] for row in rows] == ['5200001', '5200050', '5200209']
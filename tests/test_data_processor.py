@@ -0,0 +1,112 @@
+import json
+import os
+
+import pytest
+
+# app primeiro: data_processor e routes se importam mutuamente a partir dele
+from app import db
+import data_processor
+from data_processor import parse_municipality_code, process_ibge_data, save_processed_data_to_json
+
+
+@pytest.fixture
+def database(app, tmp_path, monkeypatch):
+    # save_processed_data_to_json grava em data/ relativo ao diretório atual
+    monkeypatch.chdir(tmp_path)
+    with app.app_context():
+        import models
+        db.create_all()
+        yield db
+
+
+@pytest.mark.parametrize('value, expected', [
+    (3550308, '3550308'),
+    (3550308.0, '3550308'),
+    (' 5100102 ', '5100102'),
+    (float('nan'), None),
+    (None, None),
+    ('Fonte: IBGE', None),
+    (35503, None),
+    (3550308.5, None),
+])
+def test_parse_municipality_code(value, expected):
+    assert parse_municipality_code(value) == expected
+
+
+def test_rows_without_a_code_are_skipped(database, tmp_path):
+    import pandas as pd
+
+    path = tmp_path / 'ibge.xlsx'
+    pd.DataFrame({
+        'CÓDIGO IBGE': [5100102, None, 5103403, None, 'Fonte: IBGE'],
+        'MUNICÍPIO - UF': ['Acorizal (MT)', 'Total', 'Cuiabá (MT)', 'Nota', ''],
+        'Soja': [1000, 5000, '-', 3, None],
+        'Milho': ['200,5', 1, 4, 2, None],
+    }).to_excel(path, index=False)
+
+    result = process_ibge_data(str(path))
+    assert result['success'], result
+    assert result['skipped_rows'] == 3
+    assert result['processed'] == 3
+    with open('data/processed_data.json', encoding='utf-8') as f:
+        saved = json.load(f)
+    assert saved['Milho'] == {
+        '5100102': {'municipality_name': 'Acorizal', 'state_code': 'MT', 'harvested_area': 200.5},
+        '5103403': {'municipality_name': 'Cuiabá', 'state_code': 'MT', 'harvested_area': 4.0}}
+
+
+def test_failed_export_raises_and_leaves_no_temporary_file(database, crop_data, tmp_path, monkeypatch):
+    assert data_processor.import_crop_data_json(crop_data)['success']
+
+    def fail(*args):
+        raise OSError('disco cheio')
+
+    monkeypatch.setattr(data_processor.BinarySnapshotWriter, 'add', fail)
+    json_path = str(tmp_path / 'out' / 'processed_data.json')
+    with pytest.raises(OSError):
+        save_processed_data_to_json(json_path, binary_path=str(tmp_path / 'out' / 'crop_data.snapshot'))
+    assert os.listdir(tmp_path / 'out') == []
+
+
+def stored_rows():
+    from models import CropData, ProcessingLog
+    statuses = [log.status for log in ProcessingLog.query.order_by(ProcessingLog.id).all()]
+    return CropData.query.count(), statuses
+
+
+def write_workbook(path):
+    import pandas as pd
+
+    pd.DataFrame({
+        'CÓDIGO IBGE': [5100102, 5103403],
+        'MUNICÍPIO - UF': ['Acorizal (MT)', 'Cuiabá (MT)'],
+        'Soja': [1000, 500],
+    }).to_excel(path, index=False)
+
+
+def test_failed_fact_insert_keeps_the_previous_data(database, crop_data, monkeypatch):
+    assert data_processor.import_crop_data_json(crop_data)['success']
+    before = stored_rows()
+
+    def fail(facts, batch_size=None):
+        raise RuntimeError('conexão perdida')
+
+    monkeypatch.setattr(data_processor, 'insert_crop_facts', fail)
+    assert not data_processor.import_crop_data_json(crop_data)['success']
+    assert stored_rows() == before
+    assert data_processor.get_available_crops() == sorted(crop_data)
+
+
+def test_failed_export_records_one_outcome(database, crop_data, tmp_path, monkeypatch):
+    assert data_processor.import_crop_data_json(crop_data)['success']
+    facts, statuses = stored_rows()
+    write_workbook(tmp_path / 'ibge.xlsx')
+
+    def fail(*args, **kwargs):
+        raise OSError('disco cheio')
+
+    monkeypatch.setattr(data_processor, 'save_processed_data_to_json', fail)
+    result = process_ibge_data(str(tmp_path / 'ibge.xlsx'))
+    assert result == {'success': False, 'error': 'disco cheio'}
+    # Dados antigos intactos e um único registro novo, de erro
+    assert stored_rows() == (facts, statuses + ['error'])
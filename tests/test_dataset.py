@@ -0,0 +1,86 @@
+import json
+import os
+
+import pytest
+
+from dataset import DatasetHolder, VersionedCache
+
+
+@pytest.fixture
+def holder(tmp_path, crop_data):
+    path = tmp_path / 'crop_data_static.json'
+    path.write_text(json.dumps(crop_data), encoding='utf-8')
+    return DatasetHolder(str(path), reload_interval=0)
+
+
+def rewrite(path, content):
+    # Tamanho diferente garante nova impressão digital mesmo com mtime de baixa resolução
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def test_reload_swaps_only_when_the_file_changes(holder, crop_data):
+    first = holder.current()
+    assert first.crops == sorted(crop_data)
+    assert holder.reload() is False
+    assert holder.current() is first
+
+    del crop_data['Arroz (em casca)']
+    rewrite(holder.path, json.dumps(crop_data))
+    assert holder.reload() is True
+    assert holder.current().version != first.version
+    assert 'Arroz (em casca)' not in holder.current().crops
+
+
+def test_missing_file_keeps_the_current_snapshot(holder):
+    first = holder.current()
+    os.remove(holder.path)
+    assert holder.reload() is False
+    assert holder.current() is first
+
+
+def test_missing_file_on_first_load_is_empty(tmp_path):
+    holder = DatasetHolder(str(tmp_path / 'missing.json'), reload_interval=0)
+    assert holder.current().version == 'empty'
+    assert holder.current().crops == []
+
+
+def test_corrupt_file_keeps_the_current_snapshot(holder):
+    first = holder.current()
+    rewrite(holder.path, '{"Soja": {')
+    assert holder.reload() is False
+    assert holder.current() is first
+
+
+def test_versioned_cache_drops_entries_of_old_versions():
+    cache = VersionedCache('test_versions')
+    cache.set('v1', 'a', 1)
+    assert cache.get('v1', 'a') == 1
+    assert cache.get('v2', 'a') is None
+
+    cache.set('v2', 'b', 2)
+    assert cache.get('v1', 'a') is None
+    assert cache.memory_stats()['entries'] == 1
+
+
+def test_versioned_cache_keeps_none_results():
+    cache = VersionedCache('test_none')
+    calls = []
+
+    def compute():
+        calls.append(True)
+        return None
+
+    assert cache.get_or_compute('v1', 'empty', compute) is None
+    assert cache.get_or_compute('v1', 'empty', compute) is None
+    assert len(calls) == 1
+
+
+def test_versioned_cache_max_entries_evicts_least_recently_used():
+    cache = VersionedCache('test_lru', max_entries=2)
+    cache.set('v1', 'a', 1)
+    cache.set('v1', 'b', 2)
+    cache.get('v1', 'a')
+    cache.set('v1', 'c', 3)
+    assert cache.get('v1', 'b') is None
+    assert (cache.get('v1', 'a'), cache.get('v1', 'c')) == (1, 3)
@@ -0,0 +1,96 @@
+import json
+import os
+
+import pytest
+
+from feature_index import CLASS_COUNT, FeatureIndex, build_feature_collection, log_scale, properties_end
+
+FEATURES = [
+    {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [[[0, 0], [2, 0], [2, 2], [0, 2], [0, 0]]]},
+     'properties': {'CD_MUN': '5100102', 'NM_MUN': 'Acorizal', 'harvested_area': 'antigo',
+                    'notes': {'text': '"properties": {'}}},
+    {'properties': {'CD_MUN': '5103403', 'NM_MUN': 'Cuiabá', 'SIGLA_UF': 'MT'}, 'type': 'Feature',
+     'geometry': {'type': 'Polygon', 'coordinates': [[[2, 0], [4, 0], [4, 2], [2, 2], [2, 0]]]}},
+    {'type': 'Feature', 'geometry': None, 'properties': {'CD_MUN': 5208707, 'NM_MUN': 'Goiânia'}},
+    {'type': 'Feature', 'geometry': None, 'properties': {'NM_MUN': 'Sem código'}},
+]
+
+
+@pytest.fixture
+def geojson(tmp_path):
+    path = tmp_path / 'municipalities.geojson'
+    # Espaços e quebras de linha como nos arquivos do IBGE
+    body = ',\n'.join(json.dumps(feature, ensure_ascii=False, indent=1) for feature in FEATURES)
+    path.write_text(f'{{"type": "FeatureCollection", "features": [\n{body}\n]}}', encoding='utf-8')
+    return str(path)
+
+
+def expected_collection(index, positions, crop_municipalities, **metadata):
+    """The collection built by parsing every feature, as the endpoint did before"""
+    areas = {index.entries[position][0]: crop_municipalities[index.entries[position][0]]['harvested_area']
+             for position in positions if index.entries[position][0] in crop_municipalities}
+    minimum, maximum = min(areas.values()), max(areas.values())
+    features = []
+    for entry, raw in index.read_features(positions):
+        feature = json.loads(raw)
+        area = areas.get(entry[0])
+        normalized = log_scale(area, minimum, maximum) if area else None
+        feature['properties'].update(
+            harvested_area=area, normalized=round(normalized, 4) if area else None,
+            value_class=min(CLASS_COUNT - 1, int(normalized * CLASS_COUNT)) if area else None)
+        features.append(feature)
+    return {'type': 'FeatureCollection', **metadata, 'min': minimum, 'max': maximum, 'classes': CLASS_COUNT,
+            'features': features}
+
+
+def test_index_entries(geojson):
+    index = FeatureIndex.build(geojson)
+    assert [entry[:3] for entry in index.entries] == [
+        ['5100102', 'Acorizal', 'MT'], ['5103403', 'Cuiabá', 'MT'], ['5208707', 'Goiânia', 'GO']]
+    assert index.entries[0][5] == [0, 0, 2, 2] and index.entries[0][6] == [1, 1]
+    assert index.positions_for_states(['GO', 'MT']) == [0, 1, 2]
+
+
+def test_spliced_collection_matches_parsed_features(geojson):
+    index = FeatureIndex.build(geojson)
+    crop_municipalities = {'5100102': {'harvested_area': 10.0}, '5208707': {'harvested_area': 5000.0}}
+    payload = build_feature_collection(index, [0, 1, 2], crop_municipalities, crop='Soja', states=['GO', 'MT'])
+
+    collection = json.loads(payload)
+    assert collection == expected_collection(index, [0, 1, 2], crop_municipalities, crop='Soja', states=['GO', 'MT'])
+    # O valor da cultura prevalece sobre a propriedade homônima do arquivo
+    assert collection['features'][0]['properties']['harvested_area'] == 10.0
+
+
+@pytest.mark.parametrize('raw, expected', [
+    (b'{"properties":{"a":1}}', 20),
+    (b'{"properties" : { } ,"type":"Feature"}', 18),
+    (b'{"properties":null}', None),
+    (b'{"type":"properties","geometry":{"properties":{}}}', None),
+])
+def test_properties_end(raw, expected):
+    assert properties_end(raw) == expected
+
+
+def test_persisted_index_is_reused_until_the_file_changes(geojson, tmp_path):
+    index_path = str(tmp_path / 'index.json')
+    built = FeatureIndex.load_or_build(geojson, index_path)
+    loaded = FeatureIndex.load_or_build(geojson, index_path)
+    assert loaded.entries == built.entries and loaded.version == built.version
+
+    with open(geojson, 'a', encoding='utf-8') as f:
+        f.write('\n')
+    assert FeatureIndex.load_or_build(geojson, index_path).version != built.version
+
+
+def test_reads_come_from_the_indexed_file(geojson, tmp_path):
+    index = FeatureIndex.load_or_build(geojson, str(tmp_path / 'index.json'))
+    before = [raw for _, raw in index.read_features([0, 1, 2])]
+
+    replacement = f'{geojson}.new'
+    with open(replacement, 'w', encoding='utf-8') as f:
+        f.write('{"type": "FeatureCollection", "features": []}')
+    os.replace(replacement, geojson)
+
+    assert [raw for _, raw in index.read_features([0, 1, 2])] == before
+    assert json.loads(before[1])['properties']['NM_MUN'] == 'Cuiabá'
@@ -0,0 +1,116 @@
+import json
+import os
+import struct
+
+import pytest
+
+import routes
+from app import db
+from data_processor import import_crop_data_json
+from dataset import dataset
+from http_cache import data_version
+from routes import BINARY_MIMETYPE, COLUMNAR_MIMETYPE
+
+SOY = 'Soja (em grão)'
+
+
+@pytest.fixture(params=['json', 'db'])
+def backend(request, app, monkeypatch, crop_data):
+    """Run the test against the JSON snapshot and against the database backend"""
+    if request.param == 'db':
+        monkeypatch.setitem(app.config, 'DATA_BACKEND', 'db')
+        monkeypatch.setattr(routes, 'DATA_BACKEND', 'db')
+        with app.app_context():
+            # Registra as tabelas no metadata antes do create_all
+            import models
+            db.create_all()
+            assert import_crop_data_json(crop_data)['success']
+    return request.param
+
+
+def change_data(app, backend, crop_data):
+    """Publish a new data version through the backend under test"""
+    crop_data[SOY]['5100102']['harvested_area'] = 1234.0
+    if backend == 'db':
+        with app.app_context():
+            import_crop_data_json(crop_data)
+        return
+    with open(os.environ['CROP_DATA_PATH'], 'w', encoding='utf-8') as f:
+        json.dump(crop_data, f, ensure_ascii=False)
+    assert dataset.reload()
+
+
+@pytest.fixture
+def restore_snapshot():
+    path = os.environ['CROP_DATA_PATH']
+    with open(path, 'r', encoding='utf-8') as f:
+        original = f.read()
+    yield
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(original)
+    dataset.reload()
+
+
+def current_version(app):
+    with app.app_context():
+        return data_version()
+
+
+def test_columnar_layer_carries_the_data_version(app, client, backend):
+    response = client.get(f'/api/crop-data/{SOY}', headers={'Accept': COLUMNAR_MIMETYPE})
+    payload = response.get_json(force=True)
+    assert response.status_code == 200 and response.mimetype == COLUMNAR_MIMETYPE
+    assert payload['version'] == current_version(app)
+    assert dict(zip(payload['codes'], payload['areas'])) == {
+        5100102: 1000.0, 5103403: 500.0, 5208707: 2000.0, 4106902: 300.0}
+
+
+def test_binary_layer_decodes_to_the_same_columns(app, client, backend):
+    response = client.get(f'/api/crop-data/{SOY}', headers={'Accept': BINARY_MIMETYPE})
+    assert response.headers['X-Dataset-Version'] == current_version(app)
+    raw = response.data
+    (count,) = struct.unpack_from('<I', raw)
+    codes = struct.unpack_from(f'<{count}i', raw, 4)
+    areas = struct.unpack_from(f'<{count}f', raw, 4 + 4 * count)
+    assert dict(zip(codes, areas)) == {5100102: 1000.0, 5103403: 500.0, 5208707: 2000.0, 4106902: 300.0}
+
+
+@pytest.mark.parametrize('url', ['/api/statistics', f'/api/crop-data/{SOY}', '/api/municipalities/metadata'])
+def test_conditional_request_answers_304(client, backend, url):
+    first = client.get(url)
+    assert first.status_code == 200 and first.headers.get('ETag')
+
+    second = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == first.headers['ETag']
+
+
+def test_etag_varies_with_accept(client, backend):
+    json_response = client.get(f'/api/crop-data/{SOY}')
+    columnar = client.get(f'/api/crop-data/{SOY}', headers={'Accept': COLUMNAR_MIMETYPE})
+    assert json_response.headers['ETag'] != columnar.headers['ETag']
+    assert 'Accept' in columnar.headers['Vary']
+
+
+def test_metadata_etag_is_the_data_version(app, client, backend):
+    response = client.get('/api/municipalities/metadata')
+    assert response.headers['ETag'] == f'"{current_version(app)}"'
+    assert response.get_json()['version'] == current_version(app)
+
+
+@pytest.mark.usefixtures('restore_snapshot')
+@pytest.mark.parametrize('url', ['/api/statistics', f'/api/crop-data/{SOY}', '/api/municipalities/metadata'])
+def test_new_data_version_invalidates_etag(app, client, backend, crop_data, url):
+    first = client.get(url)
+    change_data(app, backend, crop_data)
+
+    second = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
+
+
+def test_error_responses_are_not_cached(client, backend):
+    response = client.get('/api/crop-data/Trigo')
+    assert response.get_json()['success'] is False
+    assert 'ETag' not in response.headers
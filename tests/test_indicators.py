@@ -0,0 +1,51 @@
+import math
+
+import pytest
+
+from indicators import CropIndicators
+
+SOY = 'Soja (em grão)'
+
+
+@pytest.fixture
+def indicators(crop_table):
+    return CropIndicators(crop_table)
+
+
+def test_diversity_of_one_municipality(indicators):
+    goiania = indicators.municipality(indicators.table.code_position['5208707'])
+    assert goiania['hhi'] == pytest.approx(29 / 49)
+    assert goiania['shannon'] == pytest.approx(-(5 / 7 * math.log(5 / 7) + 2 / 7 * math.log(2 / 7)))
+    assert goiania['crop_count'] == 2
+    assert goiania['dominant_crop'] == SOY and goiania['dominant_share'] == pytest.approx(5 / 7)
+
+
+def test_location_quotients(indicators):
+    layer = indicators.layer('location_quotient', SOY)
+    # Cuiabá: 100% soja contra 3800 / 4960 no país
+    assert layer['5103403']['value'] == pytest.approx(4960 / 3800, abs=1e-5)
+    assert layer['3550308']['value'] == 0
+    state_layer = indicators.layer('state_location_quotient', SOY, ['MT'])
+    assert set(state_layer) == {'5100102', '5103403'}
+    assert state_layer['5103403']['value'] == pytest.approx(1700 / 1500, abs=1e-5)
+
+
+def test_indicator_route_filters_by_state(client):
+    payload = client.get('/api/indicators/hhi?state=mt').get_json()
+    assert payload['success'] and payload['states'] == ['MT']
+    assert set(payload['data']) == {'5100102', '5103403'}
+    assert set(client.get('/api/indicators/hhi?region=sul').get_json()['data']) == {'4106902'}
+
+
+@pytest.mark.parametrize('url', [
+    '/api/indicators/hhi?state=XX',
+    '/api/indicators/hhi?state=MT,ZZ',
+    '/api/indicators/hhi?region=lua',
+    '/api/municipalities/search?q=sao&state=XX',
+    '/api/municipality/5103403/similar?region=lua',
+])
+def test_unknown_states_and_regions_are_rejected(client, url):
+    response = client.get(url)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+    assert 'ETag' not in response.headers
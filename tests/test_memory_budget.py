@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+import dataset
+from dataset import VersionedCache
+from memory_budget import MemoryBudget, deep_sizeof
+
+MB = 1024 * 1024
+
+
+def block(megabytes):
+    return np.zeros(int(megabytes * MB) // 8)
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    """A 1 MB budget of its own, used by the caches created in the test"""
+    budget = MemoryBudget(limit=MB)
+    monkeypatch.setattr(dataset, 'budget', budget)
+    return budget
+
+
+def keys(cache, version='v1'):
+    return [key for key in ('cheap', 'medium', 'expensive', 'late', 'old', 'young') if cache.get(version, key) is not None]
+
+
+def test_cheapest_per_byte_is_evicted_first(budget):
+    first, second = VersionedCache('budget_a'), VersionedCache('budget_b')
+    first.set('v1', 'cheap', block(0.4), cost=0.001)
+    first.set('v1', 'expensive', block(0.4), cost=1.0)
+    second.set('v1', 'medium', block(0.4), cost=0.1)
+
+    assert keys(first) == ['expensive'] and keys(second) == ['medium']
+    assert first.evictions == 1
+    # O relógio passa a ser a prioridade da entrada removida
+    assert budget.clock == pytest.approx(0.001 / 0.4, rel=0.01)
+
+    second.set('v1', 'late', block(0.4), cost=0.5)
+    assert keys(first) == ['expensive'] and keys(second) == ['late']
+    assert first.nbytes + second.nbytes <= MB
+
+
+def test_hits_refresh_priority(budget):
+    cache = VersionedCache('budget_hits')
+    cache.set('v1', 'old', block(0.4), cost=0.1)
+    cache.set('v1', 'young', block(0.4), cost=0.1)
+    budget.clock = 10.0
+    assert cache.get('v1', 'old') is not None
+
+    cache.set('v1', 'medium', block(0.4), cost=0.1)
+    # Mesmo custo e tamanho: sai a entrada que não foi usada depois do avanço do relógio
+    assert keys(cache) == ['medium', 'old']
+
+
+def test_structures_and_transient_buffers_count(budget):
+    structure = {'layer': block(0.5)}
+    budget.register('snapshot', lambda: structure)
+    cache = VersionedCache('budget_transient')
+    cache.set('v1', 'cheap', block(0.3), cost=1.0)
+    assert keys(cache) == ['cheap']
+
+    buffer = budget.buffer('export', b'x' * int(0.3 * MB))
+    assert keys(cache) == []
+    assert budget.report()['transient'] == [{'name': 'export', 'bytes': int(0.3 * MB)}]
+    buffer.close()
+    assert budget.report()['transient'] == [{'name': 'export', 'bytes': 0}]
+
+
+def test_zero_limit_only_accounts(monkeypatch):
+    budget = MemoryBudget(limit=0)
+    monkeypatch.setattr(dataset, 'budget', budget)
+    cache = VersionedCache('budget_unlimited')
+    for key in ('cheap', 'medium', 'expensive'):
+        cache.set('v1', key, block(1), cost=0)
+    assert keys(cache) == ['cheap', 'medium', 'expensive']
+    assert budget.report()['accounted_bytes'] >= 3 * MB
+
+
+def test_deep_sizeof_counts_shared_objects_once():
+    array = block(0.1)
+    single = deep_sizeof([array])
+    assert deep_sizeof([array, array, {'again': array}]) < single + 1024
+    assert deep_sizeof(array[:10]) >= array.nbytes
@@ -0,0 +1,69 @@
+import pytest
+
+from municipality_search import MunicipalitySearch, trigrams
+
+RECORDS = [
+    ('3550308', 'São Paulo', 'SP', [-46.6, -23.5]),
+    ('3549904', 'São José dos Campos', 'SP', None),
+    ('3549805', 'São José do Rio Preto', 'SP', None),
+    ('4216602', 'São José', 'SC', None),
+    ('5218805', 'Rio Verde', 'GO', None),
+    ('3304557', 'Rio de Janeiro', 'RJ', None),
+    ('2927408', 'Salvador', 'BA', None),
+    ('3106200', 'Belo Horizonte', 'MG', None),
+]
+
+
+@pytest.fixture(scope='module')
+def index():
+    return MunicipalitySearch('v1', RECORDS)
+
+
+def names(results):
+    return [result['municipality_name'] for result in results]
+
+
+def test_trigrams_are_padded_like_pg_trgm():
+    assert trigrams('rio') == {'  r', ' ri', 'rio', 'io '}
+    assert trigrams('rio verde') == trigrams('rio') | trigrams('verde')
+
+
+def test_exact_name_then_prefixes_by_length(index):
+    results = index.search('sao jose')
+    assert names(results) == ['São José', 'São José dos Campos', 'São José do Rio Preto']
+    assert [result['match'] for result in results] == [0, 1, 1]
+
+
+def test_name_prefix_ranks_before_inner_word(index):
+    results = index.search('rio')
+    assert names(results) == ['Rio Verde', 'Rio de Janeiro', 'São José do Rio Preto']
+    assert [result['match'] for result in results] == [1, 1, 2]
+
+
+def test_accents_case_and_punctuation_are_ignored(index):
+    result, = index.search('  SÃO-PAULO ')
+    assert result == {'municipality_code': '3550308', 'municipality_name': 'São Paulo', 'state_code': 'SP',
+                      'centroid': [-46.6, -23.5], 'match': 0, 'score': 1.0}
+
+
+def test_state_filter_and_limit(index):
+    assert names(index.search('sao jose', states=['SC'])) == ['São José']
+    assert names(index.search('sao', limit=2)) == ['São José', 'São Paulo']
+
+
+def test_typos_fall_back_to_trigrams(index):
+    result, = index.search('salvdor')
+    assert result['municipality_name'] == 'Salvador'
+    assert result['match'] == 3
+    assert 0.3 <= result['score'] < 1
+
+
+def test_trigrams_fill_after_prefix_matches(index):
+    results = index.search('belo horizont', limit=5)
+    assert names(results)[0] == 'Belo Horizonte' and results[0]['match'] == 1
+    assert all(result['match'] == 3 for result in results[1:])
+
+
+@pytest.mark.parametrize('query', ['', '  ', '--', 'xyzw'])
+def test_no_match(index, query):
+    assert index.search(query) == []
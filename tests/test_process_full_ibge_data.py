@@ -0,0 +1,129 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from process_full_ibge_data import (DEFAULT_VARIABLE, detect_year_and_variable, merge_sheet_results, parse_ibge_sheet,
+                                    process_ibge_directory)
+
+
+def write_workbook(path, sheets):
+    """Excel workbook with one sheet per {name: DataFrame}"""
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        for sheet_name, frame in sheets.items():
+            frame.to_excel(writer, sheet_name=sheet_name, index=False)
+    return str(path)
+
+
+def ibge_sheet(rows, crops):
+    """Sheet in the IBGE layout: code, 'MUNICÍPIO (UF)', one column per crop"""
+    return pd.DataFrame({'CÓDIGO IBGE': [code for code, _ in rows],
+                         'MUNICÍPIO - UF': [info for _, info in rows], **crops})
+
+
+@pytest.mark.parametrize('labels, expected', [
+    (('IBGE - 2023 - BRASIL HECTARES COLHIDOS_1752980032040.xlsx',), (2023, 'harvested_area')),
+    (('pam_1752980032040_2022.xlsx', 'Área plantada'), (2022, 'planted_area')),
+    (('export_20231.xlsx', 'Produção 1998'), (1998, 'production')),
+    (('valor da produção.xlsx', None, 'Tabela 5457'), (None, 'value')),
+    (('planilha.xlsx', 'Notas'), (None, DEFAULT_VARIABLE)),
+])
+def test_detect_year_and_variable(labels, expected):
+    assert detect_year_and_variable(*labels) == expected
+
+
+def test_first_label_with_a_year_wins():
+    assert detect_year_and_variable('PAM 2021 quantidade produzida.xlsx', 'Área colhida 2019') == (2021, 'production')
+
+
+def test_directory_without_harvested_area_fails(tmp_path):
+    input_dir, output_dir = tmp_path / 'in', tmp_path / 'out'
+    input_dir.mkdir()
+    write_workbook(input_dir / 'PAM 2023 area plantada.xlsx',
+                   {'Tabela': ibge_sheet([(5100102, 'Acorizal (MT)')], {'Soja': [1000]})})
+
+    result = process_ibge_directory(str(input_dir), str(output_dir), workers=1)
+
+    assert result['success'] is False and 'harvested_area' in result['error']
+    assert result['sheets'] == 1 and result['crops'] == 0
+    assert sorted(os.listdir(output_dir)) == ['ibge_consolidated.json']
+
+
+def test_directory_writes_the_harvested_area_snapshot(tmp_path):
+    input_dir, output_dir = tmp_path / 'in', tmp_path / 'out'
+    input_dir.mkdir()
+    write_workbook(input_dir / 'PAM 2023 hectares colhidos.xlsx',
+                   {'Tabela': ibge_sheet([(5100102, 'Acorizal (MT)')], {'Soja': [1000]})})
+
+    result = process_ibge_directory(str(input_dir), str(output_dir), workers=1)
+
+    assert result['success'] is True and result['error'] is None
+    with open(output_dir / 'crop_data_static.json', encoding='utf-8') as f:
+        assert json.load(f) == {'Soja': {'5100102': {
+            'municipality_name': 'Acorizal', 'state_code': 'MT', 'harvested_area': 1000.0}}}
+    assert os.path.exists(output_dir / 'crop_data.snapshot')
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    table = ibge_sheet(
+        [(5100102, 'Acorizal (MT)'), (1100015, "Alta Floresta D'Oeste (RO)"), (110001, 'Sem UF'),
+         (None, 'Fonte: IBGE - Produção Agrícola Municipal'), (5103403, None)],
+        {'Soja': [1000, '-', '12,5', 3, 7],
+         'Milho': [0, ' 250 ', -4, None, 9],
+         'Trigo': ['-', '-', 0, None, None]})
+    notes = pd.DataFrame({'Notas': ['Valores em hectares']})
+    return write_workbook(tmp_path / 'PAM_1752980032040_2022 hectares colhidos.xlsx',
+                          {'Tabela': table, 'Notas': notes})
+
+
+def test_parse_ibge_sheet(workbook):
+    result = parse_ibge_sheet(workbook, 'Tabela')
+
+    assert (result['year'], result['variable']) == (2022, 'harvested_area')
+    # Linhas sem código ou sem município (rodapé, notas) ficam de fora; códigos com zeros à esquerda
+    assert result['municipalities'] == {
+        '5100102': {'municipality_name': 'Acorizal', 'state_code': 'MT'},
+        '1100015': {'municipality_name': "Alta Floresta D'Oeste", 'state_code': 'RO'},
+        '0110001': {'municipality_name': 'Sem UF', 'state_code': 'XX'},
+    }
+    # '-', zero, negativos e vazios não são registros; vírgula decimal e espaços são aceitos
+    assert result['crops'] == {
+        'Soja': {'5100102': 1000.0, '0110001': 12.5},
+        'Milho': {'1100015': 250.0},
+    }
+    assert result['records'] == 3 and 'skipped' not in result
+
+
+def test_parse_ibge_sheet_skips_sheets_without_the_ibge_header(workbook):
+    result = parse_ibge_sheet(workbook, 'Notas')
+    assert result['skipped'] is True and result['crops'] == {} and result['records'] == 0
+
+
+def sheet_result(path, crops, year=2023, variable='harvested_area', municipalities=None, sheet='Tabela'):
+    return {'path': path, 'sheet': sheet, 'year': year, 'variable': variable, 'crops': crops,
+            'municipalities': municipalities or {}, 'records': sum(len(values) for values in crops.values())}
+
+
+def test_merge_sheet_results_later_files_override_duplicates(caplog):
+    older = sheet_result('in/a_2023.xlsx', {'Soja': {'5100102': 1.0, '5103403': 2.0}, 'Milho': {'5100102': 3.0}},
+                         municipalities={'5100102': {'municipality_name': 'Acorizal (antigo)', 'state_code': 'MT'}})
+    newer = sheet_result('in/b_2023.xlsx', {'Soja': {'5100102': 10.0}},
+                         municipalities={'5100102': {'municipality_name': 'Acorizal', 'state_code': 'MT'}})
+    planted = sheet_result('in/c_2022.xlsx', {'Soja': {'5100102': 5.0}}, year=2022, variable='planted_area')
+    unknown_year = sheet_result('in/d.xlsx', {'Arroz': {'4106902': 4.0}}, year=None)
+    skipped = dict(sheet_result('in/e_2023.xlsx', {'Soja': {'5100102': 99.0}}), skipped=True)
+
+    # A ordem de chegada dos workers não importa: vale a ordem dos arquivos
+    merged = merge_sheet_results([newer, skipped, planted, unknown_year, older])
+
+    assert merged['series'] == {
+        'harvested_area': {
+            '2023': {'Soja': {'5100102': 10.0, '5103403': 2.0}, 'Milho': {'5100102': 3.0}},
+            'desconhecido': {'Arroz': {'4106902': 4.0}},
+        },
+        'planted_area': {'2022': {'Soja': {'5100102': 5.0}}},
+    }
+    assert merged['municipalities'] == {'5100102': {'municipality_name': 'Acorizal', 'state_code': 'MT'}}
+    assert 'sobrescritas por in/b_2023.xlsx' in caplog.text
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from query_engine import (QUERY_DEFAULT_LIMIT, QUERY_MAX_LIMIT, QueryError, compile_query, normalize_query,
+                          query_key, query_rows)
+
+
+def run(table, params, centroids=None):
+    query_filter, page = normalize_query(params, table.crops)
+    plan = compile_query(table, query_filter, centroids)
+    return plan, query_rows(table, plan, page['offset'], page['limit'])
+
+
+def test_normalize_is_canonical(crop_table):
+    first, _ = normalize_query({'crops': ['soja', 'Milho (em grão)'], 'states': 'go, mt,MT'}, crop_table.crops)
+    second, _ = normalize_query({'crops': 'Milho (em grão),Soja (em grão)', 'states': ['MT', 'GO']}, crop_table.crops)
+    assert first['crops'] == ['Milho (em grão)', 'Soja (em grão)']
+    assert first['states'] == ['GO', 'MT']
+    assert query_key(first) == query_key(second)
+
+
+def test_normalize_defaults_and_region(crop_table):
+    query_filter, page = normalize_query({'region': 'Centro Oeste'}, crop_table.crops)
+    assert query_filter['states'] == ['DF', 'GO', 'MS', 'MT']
+    assert query_filter['sort'] == '-harvested_area'
+    assert query_filter['min_area'] is None and query_filter['bbox'] is None
+    assert page == {'limit': QUERY_DEFAULT_LIMIT, 'offset': 0}
+
+
+def test_limit_is_capped(crop_table):
+    _, page = normalize_query({'limit': str(QUERY_MAX_LIMIT + 1), 'offset': '3'}, crop_table.crops)
+    assert page == {'limit': QUERY_MAX_LIMIT, 'offset': 3}
+
+
+@pytest.mark.parametrize('params', [
+    {'crops': ['Trigo']},
+    {'states': 'XX'},
+    {'region': 'lua'},
+    {'code_prefixes': '51a'},
+    {'code_prefixes': '12345678'},
+    {'bbox': [-50, -10, -60, -5]},
+    {'bbox': '1,2,3'},
+    {'sort': 'area'},
+    {'min_area': 'muito'},
+    {'limit': '-1'},
+    {'offset': 'x'},
+])
+def test_invalid_filters_raise(crop_table, params):
+    with pytest.raises(QueryError):
+        normalize_query(params, crop_table.crops)
+
+
+def test_crop_and_state_filter_sorted_by_area(crop_table):
+    plan, rows = run(crop_table, {'crops': ['Soja (em grão)'], 'states': 'MT'})
+    assert [row['municipality_code'] for row in rows] == ['5100102', '5103403']
+    assert plan.total_area == 1500.0
+    assert plan.municipality_count == 2
+
+
+def test_area_range_and_prefixes(crop_table):
+    _, rows = run(crop_table, {'min_area': 100, 'max_area': 800, 'code_prefixes': '51,52'})
+    assert [(row['crop'], row['municipality_code']) for row in rows] == [
+        ('Milho (em grão)', '5208707'), ('Soja (em grão)', '5103403'), ('Milho (em grão)', '5100102')]
+
+
+def test_sort_by_name_and_pagination(crop_table):
+    plan, rows = run(crop_table, {'crops': 'Soja (em grão)', 'sort': 'municipality_name', 'limit': 2, 'offset': 1})
+    assert len(plan.indices) == 4
+    assert [row['municipality_name'] for row in rows] == ['Cuiabá', 'Curitiba']
+
+
+def test_bbox_uses_centroids(crop_table):
+    codes = crop_table.codes.tolist()
+    lon = np.full(len(codes), np.nan)
+    lat = np.full(len(codes), np.nan)
+    lon[codes.index('5103403')], lat[codes.index('5103403')] = -56.1, -15.6
+    lon[codes.index('5208707')], lat[codes.index('5208707')] = -49.3, -16.7
+    _, rows = run(crop_table, {'bbox': '-57,-17,-55,-15'}, (lon, lat))
+    assert [row['municipality_code'] for row in rows] == ['5103403']
@@ -0,0 +1,55 @@
+import pytest
+
+import shared_snapshot
+from dataset import Snapshot
+from shared_snapshot import ArraySnapshot
+from snapshot_format import write_binary_snapshot
+
+
+@pytest.fixture
+def mixed_crop_data(crop_data):
+    """The test crops plus the rows the IBGE sheets carry besides municipalities"""
+    crop_data['Soja (em grão)']['0000051'] = {'municipality_name': 'Mato Grosso', 'state_code': 'MT',
+                                              'harvested_area': 1500.0}
+    crop_data['Milho (em grão)']['5200000'] = {'municipality_name': 'Região Centro-Oeste', 'state_code': 'GO',
+                                               'harvested_area': 800.0}
+    crop_data['Arroz (em casca)']['4100103'] = {'municipality_name': '', 'state_code': 'PR', 'harvested_area': 1.0}
+    return crop_data
+
+
+def snapshots(crop_data, tmp_path):
+    path = tmp_path / 'crop_data.snapshot'
+    write_binary_snapshot(crop_data, str(path))
+    return (Snapshot(crop_data, 'v1'), ArraySnapshot.from_crop_data(crop_data, 'v1'),
+            ArraySnapshot.from_binary(path.read_bytes(), 'v1'))
+
+
+def test_array_snapshot_matches_dict_snapshot(mixed_crop_data, tmp_path):
+    expected, *shared = snapshots(mixed_crop_data, tmp_path)
+    for snapshot in shared:
+        assert snapshot.crops == expected.crops
+        assert snapshot.municipality_count == expected.municipality_count == 8
+        assert snapshot.municipalities == expected.municipalities
+        for crop_name in expected.crops:
+            assert snapshot.has_crop(crop_name)
+            assert snapshot.layer(crop_name) == expected.layer(crop_name)
+            assert dict(snapshot.crop_data[crop_name]) == expected.crop_data[crop_name]
+            assert snapshot.columnar(crop_name) == expected.columnar(crop_name)
+        assert dict(snapshot.layers) == expected.layers
+        assert snapshot.layer('Trigo') is None and not snapshot.has_crop('Trigo')
+
+
+@pytest.mark.parametrize('query', ['Soja (em grão)', 'milho', 'ARROZ', 'Trigo'])
+def test_find_crop_matches(crop_data, tmp_path, query):
+    expected, *shared = snapshots(crop_data, tmp_path)
+    assert {snapshot.find_crop(query) for snapshot in shared} == {expected.find_crop(query)}
+
+
+def test_layers_survive_lru_eviction(crop_data, tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_snapshot, 'LAYER_CACHE_SIZE', 1)
+    expected, snapshot, _ = snapshots(crop_data, tmp_path)
+    for _ in range(2):
+        for crop_name in expected.crops:
+            assert snapshot.layer(crop_name) == expected.layer(crop_name)
+            assert snapshot.columnar(crop_name) == expected.columnar(crop_name)
+    assert len(snapshot._cache) == 1
@@ -0,0 +1,94 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dataset import VersionedCache
+from single_flight import SingleFlight, SingleFlightTimeout
+
+CALLERS = 8
+
+
+def run_concurrently(call, count=CALLERS):
+    with ThreadPoolExecutor(count) as executor:
+        futures = [executor.submit(call) for _ in range(count)]
+        return [future.exception() or future.result() for future in futures]
+
+
+def wait_for_followers(flight, key, count):
+    """Hold the leader until every other caller is waiting on the same call"""
+    for _ in range(500):
+        with flight._lock:
+            call = flight._calls.get(key)
+            if call is not None and call.followers == count:
+                return
+        time.sleep(0.01)
+    raise AssertionError('seguidores não chegaram')
+
+
+def test_concurrent_callers_share_one_computation():
+    flight = SingleFlight('test_share')
+    calls = []
+
+    def compute():
+        calls.append(True)
+        wait_for_followers(flight, 'key', CALLERS - 1)
+        return {'value': 42}
+
+    results = run_concurrently(lambda: flight.do('key', compute))
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight._calls == {}
+
+
+def test_followers_receive_the_leader_exception():
+    flight = SingleFlight('test_error')
+    calls = []
+
+    def compute():
+        calls.append(True)
+        wait_for_followers(flight, 'key', CALLERS - 1)
+        raise ValueError('falhou')
+
+    results = run_concurrently(lambda: flight.do('key', compute))
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    # A chave sai do mapa: a próxima chamada tenta de novo
+    assert flight.do('key', lambda: 'ok') == 'ok'
+
+
+def test_follower_times_out():
+    flight = SingleFlight('test_timeout', timeout=0.05)
+    release = threading.Event()
+    leader = threading.Thread(target=flight.do, args=('key', release.wait))
+    leader.start()
+    try:
+        wait_for_followers(flight, 'key', 0)
+        with pytest.raises(SingleFlightTimeout):
+            flight.do('key', lambda: 'nunca')
+    finally:
+        release.set()
+        leader.join()
+
+
+def test_distinct_keys_do_not_wait_for_each_other():
+    flight = SingleFlight('test_keys')
+    assert [flight.do(key, lambda key=key: key * 2) for key in (1, 2, 3)] == [2, 4, 6]
+
+
+def test_versioned_cache_coalesces_concurrent_misses():
+    cache = VersionedCache('test_coalesce')
+    calls = []
+
+    def compute():
+        calls.append(True)
+        wait_for_followers(cache._flight, ('v1', 'layer'), CALLERS - 1)
+        return [1, 2, 3]
+
+    results = run_concurrently(lambda: cache.get_or_compute('v1', 'layer', compute))
+    assert len(calls) == 1
+    assert all(result == [1, 2, 3] for result in results)
+    assert cache.get('v1', 'layer') == [1, 2, 3]
+    # Nova versão: novo cálculo
+    assert cache.get_or_compute('v2', 'layer', lambda: 'v2') == 'v2'
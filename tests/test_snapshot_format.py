@@ -0,0 +1,55 @@
+import struct
+
+import pytest
+
+from snapshot_format import (MAGIC, BinarySnapshotWriter, binary_snapshot_to_crop_data, layer_to_columns,
+                             pack_layer_columns, read_binary_snapshot, write_binary_snapshot)
+
+
+def test_binary_snapshot_round_trip(tmp_path, crop_data):
+    path = tmp_path / 'crop_data.snapshot'
+    write_binary_snapshot(crop_data, str(path), version='abc')
+    raw = path.read_bytes()
+
+    assert raw.startswith(MAGIC)
+    assert not (tmp_path / 'crop_data.snapshot.tmp').exists()
+    header, rows, areas = read_binary_snapshot(raw)
+    assert header['version'] == 'abc'
+    assert header['crops'] == list(crop_data)
+    assert header['records'] == len(rows) == len(areas) == 9
+    # Cada município aparece uma vez na tabela de municípios
+    assert len(header['municipalities']['codes']) == 5
+    assert binary_snapshot_to_crop_data(raw) == crop_data
+
+
+def test_empty_snapshot(tmp_path):
+    path = tmp_path / 'empty.snapshot'
+    BinarySnapshotWriter().write(str(path))
+    header, rows, areas = read_binary_snapshot(path.read_bytes())
+    assert header['crops'] == [] and header['crop_offsets'] == [0]
+    assert binary_snapshot_to_crop_data(path.read_bytes()) == {}
+
+
+def test_writer_requires_crop_order():
+    writer = BinarySnapshotWriter()
+    writer.add('Soja', '5100102', 'Acorizal', 'MT', 1.0)
+    writer.add('Milho', '5100102', 'Acorizal', 'MT', 2.0)
+    with pytest.raises(ValueError):
+        writer.add('Soja', '5103403', 'Cuiabá', 'MT', 3.0)
+
+
+def test_rejects_other_files():
+    with pytest.raises(ValueError):
+        read_binary_snapshot(b'{"Soja": {}}')
+
+
+def test_layer_columns_round_trip(crop_data):
+    codes, areas = layer_to_columns(crop_data['Milho (em grão)'])
+    assert codes == [5100102, 5208707, 3550308]
+    assert areas == [200.0, 800.0, 50.0]
+
+    packed = pack_layer_columns(codes, areas)
+    assert len(packed) == 4 + 8 * len(codes)
+    (count,) = struct.unpack_from('<I', packed)
+    assert list(struct.unpack_from(f'<{count}i', packed, 4)) == codes
+    assert list(struct.unpack_from(f'<{count}f', packed, 4 + 4 * count)) == areas
@@ -0,0 +1,89 @@
+import math
+
+import numpy as np
+import pytest
+
+import spatial_stats
+from spatial_stats import _permutation_chunk, hotspot_class, hotspot_label, spatial_autocorrelation, subgraph
+
+# Caminho 0 - 1 - 2 - 3 - 4 em CSR
+PATH_INDPTR = np.array([0, 1, 3, 5, 7, 8])
+PATH_INDICES = np.array([1, 0, 2, 1, 3, 2, 4, 3])
+
+
+@pytest.fixture(autouse=True)
+def inline_permutations(monkeypatch):
+    monkeypatch.setattr(spatial_stats, 'WORKERS', 0)
+
+
+def test_worked_example_on_a_path():
+    result = spatial_autocorrelation(PATH_INDPTR, PATH_INDICES, [1, 2, 3, 4, 5], permutations=99)
+
+    # z = [-2, -1, 0, 1, 2]; defasagem padronizada = [-1, -1, 0, 1, 1]; I = 6 / 10
+    assert result['moran']['I'] == pytest.approx(0.6)
+    assert result['moran']['expected'] == pytest.approx(-0.25)
+    assert result['moran']['n'] == 5 and result['moran']['permutations'] == 99
+    assert 0 < result['moran']['p_value'] <= 0.5
+
+    # Gi* = [1.5, 2, 3, 4, 4.5] com média 3 e desvio sqrt(2)
+    root3 = math.sqrt(3)
+    assert result['gi_z'] == pytest.approx([-root3, -root3, 0, root3, root3])
+    assert np.all((result['p_values'] > 0) & (result['p_values'] <= 0.5))
+
+
+def test_results_are_reproducible():
+    first = spatial_autocorrelation(PATH_INDPTR, PATH_INDICES, [5, 1, 4, 2, 3], permutations=250)
+    second = spatial_autocorrelation(PATH_INDPTR, PATH_INDICES, [5, 1, 4, 2, 3], permutations=250)
+    assert first['moran'] == second['moran']
+    assert np.array_equal(first['p_values'], second['p_values'])
+
+
+def test_degenerate_inputs():
+    assert spatial_autocorrelation(PATH_INDPTR, PATH_INDICES, [2, 2, 2, 2, 2]) is None
+    assert spatial_autocorrelation(np.array([0, 1, 2]), np.array([1, 0]), [1, 2]) is None
+
+
+def test_conditional_permutations_exclude_the_node_itself():
+    values = np.array([0.0, 1.0, 1.0, 1.0, 1.0])
+    degree = np.diff(PATH_INDPTR)
+    self_weights = 1.0 / (degree + 1)
+    gi_weights = np.repeat(self_weights, degree)
+    weights = np.repeat(1.0 / degree, degree)
+    observed = self_weights * values + np.add.reduceat(values[PATH_INDICES] * gi_weights, PATH_INDPTR[:-1])
+
+    _, larger = _permutation_chunk(PATH_INDPTR, PATH_INDICES, weights, gi_weights, self_weights, values,
+                                   observed, seed=1, count=200)
+    # Os vizinhos do nó 0 vêm só dos outros quatro valores (todos 1): o Gi* sorteado
+    # é sempre igual ao observado
+    assert larger[0] == 200
+
+
+def test_subgraph_drops_nodes_and_their_edges():
+    indptr, indices, nodes = subgraph(PATH_INDPTR, PATH_INDICES, np.array([True, True, False, True, True]))
+    assert nodes.tolist() == [0, 1, 3, 4]
+    assert indptr.tolist() == [0, 1, 2, 3, 4]
+    assert indices.tolist() == [1, 0, 3, 2]
+
+
+@pytest.mark.parametrize('z_score, p_value, value_class, label', [
+    (2.5, 0.005, 3, 'Hotspot 99%'),
+    (2.0, 0.03, 2, 'Hotspot 95%'),
+    (-1.7, 0.08, -1, 'Coldspot 90%'),
+    (1.0, 0.2, 0, 'Não significativo'),
+])
+def test_hotspot_classes(z_score, p_value, value_class, label):
+    assert hotspot_class(z_score, p_value) == value_class
+    assert hotspot_label(value_class) == label
+
+
+def test_process_pool_matches_inline(monkeypatch, caplog):
+    values = [5, 1, 4, 2, 3]
+    inline = spatial_autocorrelation(PATH_INDPTR, PATH_INDICES, values, permutations=250)
+    monkeypatch.setattr(spatial_stats, 'WORKERS', 2)
+    try:
+        pooled = spatial_autocorrelation(PATH_INDPTR, PATH_INDICES, values, permutations=250)
+    finally:
+        spatial_stats._discard_pool()
+    assert 'Pool de permutações indisponível' not in caplog.text
+    assert pooled['moran'] == inline['moran']
+    assert np.array_equal(pooled['p_values'], inline['p_values'])
@@ -0,0 +1,187 @@
+import json
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+import pytest
+
+from feature_index import FeatureIndex
+from tile_renderer import EMPTY_TILE, FIRST_CLASS, NO_DATA, PALETTE, TileCache, TileRenderer, encode_png, rasterize
+
+
+def ring_edges(*points):
+    """Edges (x0, y0, x1, y1) of a closed ring, in pixel coordinates"""
+    closed = list(points) + [points[0]]
+    return np.array([[*start, *end] for start, end in zip(closed, closed[1:])], dtype=np.float64)
+
+
+def square_edges(x0, y0, x1, y1):
+    return ring_edges((x0, y0), (x1, y0), (x1, y1), (x0, y1))
+
+
+def decode_png(data):
+    """(width, height, palette, pixels) of an indexed PNG written by encode_png"""
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    chunks, offset = {}, 8
+    while offset < len(data):
+        length, kind = struct.unpack('>I4s', data[offset:offset + 8])
+        body = data[offset + 8:offset + 8 + length]
+        assert struct.unpack('>I', data[offset + 8 + length:offset + 12 + length])[0] == zlib.crc32(kind + body)
+        chunks[kind] = body
+        offset += length + 12
+    width, height, depth, color_type = struct.unpack('>IIBB', chunks[b'IHDR'][:10])
+    assert (depth, color_type) == (8, 3)
+    raw = np.frombuffer(zlib.decompress(chunks[b'IDAT']), dtype=np.uint8).reshape(height, width + 1)
+    assert not raw[:, 0].any()  # filtro 0 em todas as linhas
+    assert b'IEND' in chunks and len(chunks[b'tRNS']) == len(PALETTE)
+    return width, height, chunks[b'PLTE'], raw[:, 1:]
+
+
+def test_polygon_with_hole_leaves_the_hole_empty():
+    edges = np.vstack([square_edges(1, 1, 7, 7), square_edges(3, 3, 5, 5)])
+    image = rasterize(edges, np.zeros(len(edges), dtype=np.int64), np.array([4]), 0, 0, 1, size=8)
+
+    expected = np.zeros((8, 8), dtype=np.uint8)
+    expected[1:7, 1:7] = 4
+    expected[3:5, 3:5] = 0
+    assert np.array_equal(image, expected)
+
+
+def test_adjacent_polygons_never_share_a_pixel():
+    edges = np.vstack([square_edges(0, 0, 4, 8), square_edges(4, 0, 8, 8)])
+    owners = np.repeat([0, 1], 4)
+    image = rasterize(edges, owners, np.array([2, 5]), 0, 0, 1, size=8)
+
+    # A borda comum cai entre colunas: cada pixel recebe um único município, sem soma de valores
+    assert (image[:, :4] == 2).all() and (image[:, 4:] == 5).all()
+
+
+def test_rasterize_applies_origin_and_scale():
+    # Triângulo em coordenadas normalizadas, visto de um tile deslocado e ampliado
+    edges = ring_edges((0.5, 0.5), (0.75, 0.5), (0.5, 0.75))
+    image = rasterize(edges, np.zeros(3, dtype=np.int64), np.array([3]), 0.5, 0.5, 16, size=4)
+
+    # Centro do pixel (c + 0.5, r + 0.5) dentro da hipotenusa x + y < 4
+    rows, columns = np.indices((4, 4))
+    assert np.array_equal(image, np.where(rows + columns < 3, 3, 0))
+
+
+def test_png_round_trip():
+    pixels = np.arange(12, dtype=np.uint8).reshape(3, 4) % len(PALETTE)
+    width, height, palette, decoded = decode_png(encode_png(pixels))
+
+    assert (width, height) == (4, 3)
+    assert palette == b''.join(bytes(color) for color in PALETTE)
+    assert np.array_equal(decoded, pixels)
+    assert not decode_png(EMPTY_TILE)[3].any()
+
+
+def put_tiles(cache, version, count, size=100):
+    paths = [cache.path(version, 'Soja', 3, 1, y) for y in range(count)]
+    for age, path in enumerate(paths):
+        cache.put(version, path, b'x' * size)
+        # mtimes distintos e crescentes, independentes da resolução do sistema de arquivos
+        os.utime(path, (1000 + age, 1000 + age))
+    return paths
+
+
+def recorded_bytes(cache, version):
+    with open(os.path.join(cache._version_dir(version), '.bytes'), 'rb') as f:
+        return int(f.read())
+
+
+def test_cache_evicts_least_recently_used_tiles_under_the_cap(tmp_path):
+    cache = TileCache(str(tmp_path), max_bytes=1000, grace=3600)
+    paths = put_tiles(cache, 'v1', 10)
+    assert recorded_bytes(cache, 'v1') == 1000 and all(os.path.exists(path) for path in paths)
+
+    # Um acerto renova o mtime do tile mais antigo
+    assert cache.get('v1', paths[0]) == b'x' * 100
+    extra = cache.path('v1', 'Milho', 0, 0, 0)
+    cache.put('v1', extra, b'y' * 100)
+
+    # 1100 bytes passam do limite: saem os dois menos usados, até 90% do limite
+    assert [os.path.exists(path) for path in paths[:4]] == [True, False, False, True]
+    assert os.path.exists(extra)
+    assert recorded_bytes(cache, 'v1') == 900
+    assert cache.get('v1', paths[1]) is None
+
+
+def test_rewriting_a_tile_counts_only_the_difference(tmp_path):
+    cache = TileCache(str(tmp_path), max_bytes=1000, grace=3600)
+    path = put_tiles(cache, 'v1', 1)[0]
+    cache.put('v1', path, b'z' * 40)
+    assert recorded_bytes(cache, 'v1') == 40
+
+
+def set_created(cache, version, seconds_ago):
+    created = time.time() - seconds_ago
+    os.utime(os.path.join(cache._version_dir(version), '.created'), (created, created))
+
+
+def test_stale_versions_are_removed_after_the_grace_period(tmp_path):
+    directory = str(tmp_path)
+    old, current, ahead = TileCache(directory, grace=10), TileCache(directory, grace=10), TileCache(directory, grace=10)
+    put_tiles(old, 'v1', 1)
+    set_created(old, 'v1', 30)
+    put_tiles(current, 'v2', 1)
+    put_tiles(ahead, 'v3', 1)
+
+    # v2 acabou de aparecer: os outros workers podem ainda estar em v1
+    assert os.path.isdir(current._version_dir('v1'))
+
+    set_created(current, 'v2', 20)
+    set_created(ahead, 'v3', 0)
+    later = TileCache(directory, grace=10)
+    later.get('v2', later.path('v2', 'Soja', 3, 1, 0))
+
+    # Só a versão anterior sai; a de um worker adiantado fica
+    assert sorted(os.listdir(directory)) == sorted(
+        os.path.basename(later._version_dir(version)) for version in ('v2', 'v3'))
+
+
+@pytest.fixture
+def feature_index(tmp_path):
+    """Two neighbouring municipalities around (-50, -15)"""
+    features = [
+        {'type': 'Feature', 'properties': {'CD_MUN': code, 'NM_MUN': code, 'SIGLA_UF': 'GO'},
+         'geometry': {'type': 'Polygon', 'coordinates': [[[lon, -16], [lon + 2, -16], [lon + 2, -14], [lon, -14],
+                                                          [lon, -16]]]}}
+        for code, lon in (('5208707', -52), ('5200050', -50))
+    ]
+    path = tmp_path / 'municipalities.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': features}), encoding='utf-8')
+    return FeatureIndex.build(str(path))
+
+
+def test_render_classes_municipalities_and_caches_the_tile(tmp_path, feature_index):
+    renderer = TileRenderer(TileCache(str(tmp_path / 'tiles'), grace=3600))
+    layer = {'5208707': {'harvested_area': 100.0}}
+    # Tile z=6 com parte dos dois municípios (lon -52..-48 vai de x=22.8 a 23.5, lat -16..-14 fica em y=34)
+    data = renderer.render('v1', feature_index, 'Soja', layer, 6, 23, 34)
+
+    pixels = decode_png(data)[3]
+    assert set(np.unique(pixels)) == {0, NO_DATA, FIRST_CLASS}
+    assert renderer.render('v1', feature_index, 'Soja', layer, 6, 23, 34) == data
+    assert os.path.exists(renderer.cache.path('v1', 'Soja', 6, 23, 34))
+    assert renderer.render('v1', feature_index, 'Soja', layer, 6, 0, 0) == EMPTY_TILE
+
+
+@pytest.mark.parametrize('path', [
+    '/tiles/Soja/2/4/0.png',      # x fora do nível de zoom
+    '/tiles/Soja/1/0/2.png',      # y fora do nível de zoom
+    '/tiles/Soja/15/0/0.png',     # acima de MAX_ZOOM
+])
+def test_tile_route_rejects_invalid_tiles(client, path):
+    response = client.get(path)
+    assert response.status_code == 404
+    assert response.get_json() == {'success': False, 'error': 'Tile inválido'}
+    assert 'ETag' not in response.headers
+
+
+def test_tile_route_unknown_crop(client):
+    response = client.get('/tiles/Cacau/0/0/0.png')
+    assert response.status_code == 404
+    assert response.get_json() == {'success': False, 'error': 'Cultura não encontrada'}
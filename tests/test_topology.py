@@ -0,0 +1,99 @@
+import pytest
+
+from topology import OBJECT_NAME, build_topology, simplify_arc
+
+
+def square(x, y, size=1):
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+
+
+def collection(*geometries):
+    return {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'CD_MUN': str(index)}, 'geometry': geometry}
+        for index, geometry in enumerate(geometries)
+    ]}
+
+
+def decoded_arcs(topology):
+    """Absolute coordinates of each arc (undo the quantization and the delta coding)"""
+    (sx, sy), (tx, ty) = topology['transform']['scale'], topology['transform']['translate']
+    arcs = []
+    for arc in topology['arcs']:
+        x = y = 0
+        points = []
+        for dx, dy in arc:
+            x, y = x + dx, y + dy
+            points.append((x * sx + tx, y * sy + ty))
+        arcs.append(points)
+    return arcs
+
+
+def ring_points(arcs, indexes):
+    points = []
+    for index in indexes:
+        arc = arcs[index] if index >= 0 else arcs[~index][::-1]
+        points.extend(arc if not points else arc[1:])
+    return points
+
+
+def same_ring(points, expected):
+    """Equal closed rings, regardless of the starting point"""
+    body, expected_body = points[:-1], [tuple(point) for point in expected[:-1]]
+    return points[0] == points[-1] and any(body[i:] + body[:i] == expected_body for i in range(len(body)))
+
+
+def test_shared_border_becomes_one_arc():
+    left, right = square(0, 0), square(1, 0)
+    topology = build_topology(collection(
+        {'type': 'Polygon', 'coordinates': [left]},
+        {'type': 'Polygon', 'coordinates': [right]}
+    ), quantization=3)
+
+    geometries = topology['objects'][OBJECT_NAME]['geometries']
+    assert [geometry['properties']['CD_MUN'] for geometry in geometries] == ['0', '1']
+    # Quatro lados externos em dois arcos + a fronteira comum, usada uma vez em cada sentido
+    assert len(topology['arcs']) == 3
+    left_arcs, right_arcs = geometries[0]['arcs'][0], geometries[1]['arcs'][0]
+    shared = {index if index >= 0 else ~index for index in left_arcs} & \
+             {index if index >= 0 else ~index for index in right_arcs}
+    assert len(shared) == 1
+
+    arcs = decoded_arcs(topology)
+    assert same_ring(ring_points(arcs, left_arcs), left)
+    assert same_ring(ring_points(arcs, right_arcs), right)
+
+
+def test_island_and_multipolygon_round_trip():
+    island, hole, other = square(0, 0, 4), square(1, 1, 2)[::-1], square(10, 10)
+    topology = build_topology(collection(
+        {'type': 'MultiPolygon', 'coordinates': [[island, hole], [other]]},
+        {'type': 'Point', 'coordinates': [0, 0]}
+    ), quantization=12)
+
+    multipolygon, point = topology['objects'][OBJECT_NAME]['geometries']
+    assert multipolygon['type'] == 'MultiPolygon'
+    assert point['type'] is None and 'arcs' not in point
+    # Anéis sem vizinhos viram um arco fechado cada
+    assert len(topology['arcs']) == 3
+    arcs = decoded_arcs(topology)
+    rings = [ring_points(arcs, indexes) for polygon in multipolygon['arcs'] for indexes in polygon]
+    for points, expected in zip(rings, [island, hole, other]):
+        assert same_ring(points, expected)
+
+
+def test_arcs_are_delta_coded():
+    topology = build_topology(collection({'type': 'Polygon', 'coordinates': [square(0, 0)]}), quantization=2)
+    assert topology['transform'] == {'scale': [1.0, 1.0], 'translate': [0, 0]}
+    assert topology['arcs'] == [[[0, 0], [1, 0], [0, 1], [-1, 0], [0, -1]]]
+
+
+def test_simplify_drops_collinear_points_only():
+    line = [(0, 0), (1, 0), (2, 0), (3, 1), (4, 0)]
+    assert simplify_arc(line, 0.5) == [(0, 0), (2, 0), (3, 1), (4, 0)]
+    assert simplify_arc(line, 0) == line
+
+
+@pytest.mark.parametrize('tolerance', [0.5, 100])
+def test_simplified_closed_arc_keeps_a_ring(tolerance):
+    ring = [(0, 0), (5, 0), (5, 5), (0, 5), (0, 0)]
+    assert len(simplify_arc(ring, tolerance)) >= 4
@@ -0,0 +1,33 @@
+import pytest
+
+from metrics import metrics
+from warmup import WARMUP_GLOBAL_PATHS, WARMUP_PATHS, warm_caches
+
+CROP = 'Soja (em grão)'
+
+
+def request_metrics():
+    """Exported lines of the per-request metrics (HTTP and cache lookups)"""
+    return sorted(line for line in metrics.render().splitlines()
+                  if line.startswith(('http_', 'cache_requests_total')))
+
+
+def test_warmup_requests_are_left_out_of_the_metrics(client):
+    before = request_metrics()
+    warm_caches(client.application, crops=[CROP])
+
+    assert request_metrics() == before
+    assert any(line.startswith('cache_warmup_seconds ') for line in metrics.render().splitlines())
+
+    # Requisições comuns continuam sendo contadas
+    client.get('/api/crops')
+    labels = {'endpoint': '/api/crops', 'method': 'GET', 'status': '200'}
+    counted = metrics.counter_value('http_requests_total', labels)
+    client.get('/api/crops')
+    assert metrics.counter_value('http_requests_total', labels) == counted + 1
+
+
+@pytest.mark.parametrize('path', list(WARMUP_GLOBAL_PATHS) + [path.format(crop=CROP) for path in WARMUP_PATHS])
+def test_warmup_paths_answer(client, path):
+    response = client.get(path)
+    assert response.status_code == 200 and response.get_json()['success'] is True
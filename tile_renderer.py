@@ -0,0 +1,438 @@
+"""Raster choropleth tiles (Web Mercator, 256 px) rendered with numpy.
+
+Uso (pré-geração dos níveis de zoom baixos):
+    python tile_renderer.py --max-zoom 6 [--crop "Soja (em grão)" ...]
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from dataset import RELOAD_INTERVAL, VersionedCache
+from feature_index import CLASS_COUNT, log_scale
+from memory_budget import budget
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 256
+TILE_CACHE_DIR = os.environ.get('TILE_CACHE_DIR', 'data/tiles')
+TILE_CACHE_MAX_BYTES = int(os.environ.get('TILE_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# Tempo para todos os workers trocarem de versão antes de apagar os tiles da anterior;
+# deve ser bem maior que o intervalo de recarga do dataset
+TILE_CACHE_GRACE = float(os.environ.get('TILE_CACHE_GRACE', str(max(300.0, 10 * RELOAD_INTERVAL))))
+MAX_ZOOM = 14
+MAX_LATITUDE = 85.0511287798
+
+# Paleta indexada: 0 transparente, 1 município sem dados, 2.. classes (verde sequencial)
+NO_DATA_COLOR = (0xE8, 0xE8, 0xE8)
+CLASS_COLORS = [(0xED, 0xF8, 0xE9), (0xC7, 0xE9, 0xC0), (0xA1, 0xD9, 0x9B), (0x74, 0xC4, 0x76),
+                (0x41, 0xAB, 0x5D), (0x23, 0x8B, 0x45), (0x00, 0x5A, 0x32)]
+NO_DATA = 1
+FIRST_CLASS = 2
+
+
+def class_palette(count):
+    """RGB palette with ``count`` classes, interpolating CLASS_COLORS"""
+    colors = np.array(CLASS_COLORS, dtype=np.float64)
+    positions = np.linspace(0, len(colors) - 1, count)
+    return [tuple(int(round(np.interp(p, np.arange(len(colors)), colors[:, channel]))) for channel in range(3))
+            for p in positions]
+
+
+PALETTE = [(0, 0, 0), NO_DATA_COLOR] + class_palette(CLASS_COUNT)
+# Transparência: fundo invisível, municípios levemente translúcidos como no mapa vetorial
+ALPHA = bytes([0, 153] + [178] * CLASS_COUNT)
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+
+def encode_png(pixels):
+    """Encode a 2-D uint8 array of palette indexes as an indexed-colour PNG"""
+    height, width = pixels.shape
+    raw = np.zeros((height, width + 1), dtype=np.uint8)
+    raw[:, 1:] = pixels  # filtro 0 (None) em cada linha
+    header = struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)
+    palette = b''.join(bytes(color) for color in PALETTE)
+    return (b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', header) + _png_chunk(b'PLTE', palette) +
+            _png_chunk(b'tRNS', ALPHA) + _png_chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) +
+            _png_chunk(b'IEND', b''))
+
+
+EMPTY_TILE = encode_png(np.zeros((TILE_SIZE, TILE_SIZE), dtype=np.uint8))
+
+
+def project(lon, lat):
+    """Lon/lat (degrees) to normalized Web Mercator [0, 1] x [0, 1], y growing southwards"""
+    lat = np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE)
+    x = (np.asarray(lon) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(np.radians(lat)) + 1.0 / np.cos(np.radians(lat))) / math.pi) / 2.0
+    return x, y
+
+
+class GeometryStore:
+    """Every municipality ring as projected edges, grouped by feature"""
+
+    def __init__(self, feature_index):
+        self.version = feature_index.version
+        self.codes = [entry[0] for entry in feature_index.entries]
+
+        edges = []
+        edge_counts = np.zeros(len(self.codes), dtype=np.int64)
+        for position, (entry, raw) in enumerate(feature_index.read_features(range(len(self.codes)))):
+            geometry = json.loads(raw).get('geometry') or {}
+            if geometry.get('type') == 'Polygon':
+                polygons = [geometry['coordinates']]
+            elif geometry.get('type') == 'MultiPolygon':
+                polygons = geometry['coordinates']
+            else:
+                polygons = []
+            for polygon in polygons:
+                for ring in polygon:
+                    if len(ring) < 3:
+                        continue
+                    points = np.asarray(ring, dtype=np.float64)[:, :2]
+                    if not np.array_equal(points[0], points[-1]):
+                        points = np.vstack([points, points[:1]])
+                    x, y = project(points[:, 0], points[:, 1])
+                    edges.append(np.column_stack([x[:-1], y[:-1], x[1:], y[1:]]))
+                    edge_counts[position] += len(points) - 1
+
+        # Arestas ordenadas por feature; feature i ocupa edges[offsets[i]:offsets[i + 1]]
+        self.edges = np.vstack(edges) if edges else np.zeros((0, 4))
+        self.offsets = np.concatenate([[0], np.cumsum(edge_counts)])
+        self.bounds = np.full((len(self.codes), 4), np.nan)
+        for position in range(len(self.codes)):
+            feature_edges = self.edges[self.offsets[position]:self.offsets[position + 1]]
+            if len(feature_edges):
+                xs = feature_edges[:, [0, 2]]
+                ys = feature_edges[:, [1, 3]]
+                self.bounds[position] = (xs.min(), ys.min(), xs.max(), ys.max())
+
+    def features_in(self, min_x, min_y, max_x, max_y):
+        """Positions of the features whose bounds intersect a normalized rectangle"""
+        bounds = self.bounds
+        with np.errstate(invalid='ignore'):
+            mask = (bounds[:, 0] < max_x) & (bounds[:, 2] > min_x) & (bounds[:, 1] < max_y) & (bounds[:, 3] > min_y)
+        return np.nonzero(mask)[0]
+
+    def edges_of(self, positions):
+        """(edges, feature position of each edge) for the given features"""
+        starts = self.offsets[positions]
+        counts = self.offsets[positions + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            return np.zeros((0, 4)), np.zeros(0, dtype=np.int64)
+        owners = np.repeat(positions, counts)
+        index = np.repeat(starts - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts) + np.arange(total)
+        return self.edges[index], owners
+
+
+def rasterize(edges, owners, values, origin_x, origin_y, scale, size=TILE_SIZE):
+    """Even-odd scanline fill of many polygons at once; returns a (size, size) uint8 image
+
+    ``values`` maps each edge owner to its palette index. Pixel centres are sampled, so
+    neighbouring municipalities never paint the same pixel and one span pass suffices.
+    """
+    image = np.zeros((size, size), dtype=np.uint8)
+    if not len(edges):
+        return image
+
+    x0 = (edges[:, 0] - origin_x) * scale
+    y0 = (edges[:, 1] - origin_y) * scale
+    x1 = (edges[:, 2] - origin_x) * scale
+    y1 = (edges[:, 3] - origin_y) * scale
+
+    # Linhas cujo centro (r + 0.5) está em [min(y0, y1), max(y0, y1))
+    first_row = np.clip(np.ceil(np.minimum(y0, y1) - 0.5), 0, size).astype(np.int64)
+    last_row = np.clip(np.ceil(np.maximum(y0, y1) - 0.5), 0, size).astype(np.int64)
+    counts = np.where(y0 != y1, last_row - first_row, 0)
+    counts = np.maximum(counts, 0)
+    total = int(counts.sum())
+    if total == 0:
+        return image
+
+    edge = np.repeat(np.arange(len(edges)), counts)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rows = first_row[edge] + np.arange(total) - starts[edge]
+    centers = rows + 0.5
+    crossings = x0[edge] + (centers - y0[edge]) * (x1[edge] - x0[edge]) / (y1[edge] - y0[edge])
+    owner = owners[edge]
+
+    # Ordenar por (município, linha, x): cruzamentos consecutivos formam os intervalos preenchidos
+    order = np.lexsort((crossings, rows, owner))
+    crossings, rows, owner = crossings[order], rows[order], owner[order]
+    span_rows = rows[0::2]
+    span_start = np.clip(np.ceil(crossings[0::2] - 0.5), 0, size).astype(np.int64)
+    span_end = np.clip(np.ceil(crossings[1::2] - 0.5), 0, size).astype(np.int64)
+    span_value = values[owner[0::2]].astype(np.int32)
+    keep = span_end > span_start
+    span_rows, span_start, span_end, span_value = span_rows[keep], span_start[keep], span_end[keep], span_value[keep]
+
+    # Diferenças por linha: +valor no início e -valor no fim de cada intervalo
+    diff = np.zeros((size, size + 1), dtype=np.int32)
+    np.add.at(diff, (span_rows, span_start), span_value)
+    np.add.at(diff, (span_rows, span_end), -span_value)
+    filled = np.cumsum(diff[:, :size], axis=1)
+    np.clip(filled, 0, len(PALETTE) - 1, out=filled)
+    return filled.astype(np.uint8)
+
+
+class TileCache:
+    """PNG tiles on disk under <dir>/<version>/<crop>/<z>/<x>/<y>.png with a size cap shared by all workers
+
+    O total de bytes de cada versão fica em <versão>/.bytes, atualizado sob flock por
+    todos os processos; passando do limite, os tiles de mtime mais antigo (renovado a
+    cada acerto) saem até EVICT_TARGET do limite. Workers recarregam o dataset em
+    momentos diferentes: uma versão só é apagada se for anterior a uma versão criada
+    há mais de TILE_CACHE_GRACE segundos, nunca a versão em uso por um worker adiantado.
+    """
+
+    EVICT_TARGET = 0.9
+
+    def __init__(self, directory=TILE_CACHE_DIR, max_bytes=TILE_CACHE_MAX_BYTES, grace=TILE_CACHE_GRACE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.grace = grace
+        self._version = None
+        self._next_cleanup = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(text):
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+    def _version_dir(self, version):
+        return os.path.join(self.directory, self._key(version))
+
+    def _use_version(self, version):
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            version_dir = self._version_dir(version)
+            os.makedirs(version_dir, exist_ok=True)
+            try:
+                # mtime de .created = quando a versão apareceu pela primeira vez em qualquer worker
+                os.close(os.open(os.path.join(version_dir, '.created'), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                pass
+            self._version = version
+            self._next_cleanup = 0.0
+
+    def _add_bytes(self, version_dir, delta):
+        """Add delta to the size recorded in <version>/.bytes; returns the new total"""
+        with open(os.path.join(version_dir, '.bytes'), 'a+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            total = max(0, int(f.read() or 0) + delta)
+            f.seek(0)
+            f.truncate()
+            f.write(str(total).encode('ascii'))
+            return total
+
+    def _evict(self, version_dir):
+        """Remove the least recently used tiles until the version fits in EVICT_TARGET of the cap"""
+        with open(os.path.join(version_dir, '.evict.lock'), 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # outro worker já está removendo
+            tiles = []
+            for root, _, files in os.walk(version_dir):
+                for name in files:
+                    if name.endswith('.png'):
+                        try:
+                            stat = os.stat(os.path.join(root, name))
+                        except FileNotFoundError:
+                            continue
+                        tiles.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+            tiles.sort()
+            excess = sum(size for _, size, _ in tiles) - int(self.max_bytes * self.EVICT_TARGET)
+            removed = 0
+            for _, size, path in tiles:
+                if removed >= excess:
+                    break
+                try:
+                    os.remove(path)
+                    removed += size
+                except FileNotFoundError:
+                    pass
+            self._add_bytes(version_dir, -removed)
+
+    def _remove_stale_versions(self):
+        """Delete versions older than the current one once it has existed for the grace period"""
+        now = time.monotonic()
+        if now < self._next_cleanup or self._version is None:
+            return
+        self._next_cleanup = now + min(self.grace, 60)
+        current_key = self._key(self._version)
+        try:
+            created = os.stat(os.path.join(self.directory, current_key, '.created')).st_mtime
+        except FileNotFoundError:
+            return
+        if time.time() - created < self.grace:
+            return
+        for name in os.listdir(self.directory):
+            if name == current_key:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                other_created = os.stat(os.path.join(path, '.created')).st_mtime
+            except FileNotFoundError:
+                other_created = os.stat(path).st_mtime if os.path.isdir(path) else created
+            if other_created < created:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def path(self, version, crop_name, z, x, y):
+        return os.path.join(self._version_dir(version), self._key(crop_name), str(z), str(x), f'{y}.png')
+
+    def get(self, version, path):
+        self._use_version(version)
+        self._remove_stale_versions()
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # mtime marca o último uso, base da remoção por tamanho
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def put(self, version, path, data):
+        self._use_version(version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            previous = os.path.getsize(path)
+        except FileNotFoundError:
+            previous = 0
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        version_dir = self._version_dir(version)
+        if self._add_bytes(version_dir, len(data) - previous) > self.max_bytes:
+            self._evict(version_dir)
+        self._remove_stale_versions()
+
+
+class TileRenderer:
+    """Renders and caches choropleth tiles for the current dataset and geometry versions"""
+
+    def __init__(self, cache=None):
+        self.cache = cache or TileCache()
+        self._store = None
+        self._store_lock = threading.Lock()
+        self._values = VersionedCache('tile_classes', max_entries=32)
+
+    def geometry(self, feature_index):
+        store = self._store
+        if store is None or store.version != feature_index.version:
+            with self._store_lock:
+                if self._store is None or self._store.version != feature_index.version:
+                    self._store = GeometryStore(feature_index)
+                store = self._store
+        return store
+
+    def class_values(self, version, store, crop_name, crop_municipalities):
+        """Palette index per feature: class of the log scale, or NO_DATA"""
+        def build():
+            areas = np.array([
+                float((crop_municipalities.get(code) or {}).get('harvested_area') or 0) for code in store.codes
+            ])
+            values = np.full(len(store.codes), NO_DATA, dtype=np.uint8)
+            present = areas > 0
+            if present.any():
+                minimum, maximum = areas[present].min(), areas[present].max()
+                normalized = np.array([log_scale(area, minimum, maximum) for area in areas[present]])
+                values[present] = FIRST_CLASS + np.minimum(CLASS_COUNT - 1, (normalized * CLASS_COUNT).astype(int))
+            return values
+        return self._values.get_or_compute(version, crop_name, build)
+
+    def render(self, version, feature_index, crop_name, crop_municipalities, z, x, y):
+        """PNG bytes for one tile, from the disk cache when available"""
+        path = self.cache.path(version, crop_name, z, x, y)
+        cached = self.cache.get(version, path)
+        if cached is not None:
+            return cached
+
+        store = self.geometry(feature_index)
+        tiles = 2 ** z
+        min_x, min_y = x / tiles, y / tiles
+        positions = store.features_in(min_x, min_y, (x + 1) / tiles, (y + 1) / tiles)
+        if not len(positions):
+            return EMPTY_TILE
+
+        values = self.class_values(version, store, crop_name, crop_municipalities)
+        edges, owners = store.edges_of(positions)
+        image = rasterize(edges, owners, values, min_x, min_y, tiles * TILE_SIZE)
+        data = encode_png(image)
+        self.cache.put(version, path, data)
+        return data
+
+    def tiles_for_bounds(self, store, z):
+        """(x, y) of every tile at zoom z that intersects the geometry"""
+        if not len(store.codes):
+            return []
+        tiles = 2 ** z
+        min_x, min_y = np.nanmin(store.bounds[:, 0]), np.nanmin(store.bounds[:, 1])
+        max_x, max_y = np.nanmax(store.bounds[:, 2]), np.nanmax(store.bounds[:, 3])
+        return [(tx, ty)
+                for tx in range(int(min_x * tiles), min(tiles - 1, int(max_x * tiles)) + 1)
+                for ty in range(int(min_y * tiles), min(tiles - 1, int(max_y * tiles)) + 1)]
+
+    def seed(self, version, feature_index, layers, max_zoom):
+        """Pre-render zoom levels 0..max_zoom for {crop: layer}; returns the number of tiles"""
+        store = self.geometry(feature_index)
+        rendered = 0
+        for crop_name, crop_municipalities in layers.items():
+            for z in range(max_zoom + 1):
+                for x, y in self.tiles_for_bounds(store, z):
+                    self.render(version, feature_index, crop_name, crop_municipalities, z, x, y)
+                    rendered += 1
+        return rendered
+
+
+renderer = TileRenderer()
+budget.register('tile_geometry', lambda: renderer._store)
+
+
+def main():
+    from dataset import dataset
+    from feature_index import get_feature_index
+
+    parser = argparse.ArgumentParser(description="Pré-gerar tiles dos níveis de zoom baixos")
+    parser.add_argument('--max-zoom', type=int, default=6)
+    parser.add_argument('--crop', action='append', help="Cultura (repetível); padrão: todas")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    snapshot = dataset.current()
+    feature_index = get_feature_index()
+    if not feature_index.entries:
+        print("Geometrias dos municípios indisponíveis")
+        return 1
+
+    crops = args.crop or snapshot.crops
+    layers = {crop_name: snapshot.layer(crop_name) for crop_name in crops if snapshot.has_crop(crop_name)}
+    started = time.perf_counter()
+    rendered = renderer.seed(f'{snapshot.version}:{feature_index.version}', feature_index, layers, args.max_zoom)
+    print(f"{rendered} tiles gerados em {time.perf_counter() - started:.1f}s ({len(layers)} culturas)")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,242 @@
+"""TopoJSON-style encoding of the municipality boundaries.
+
+Fronteiras compartilhadas entre municípios vizinhos viram um único arco;
+coordenadas são quantizadas em uma grade inteira e codificadas por diferença.
+Com --tolerance > 0 cada arco é simplificado (Douglas-Peucker, em passos da
+grade); como os arcos são compartilhados, vizinhos continuam sem frestas.
+
+Uso (executado também ao final de combine_geojson.py e no estágio simplify de build_data.py):
+    python topology.py [entrada.geojson] [saida.topo.json] [--quantization 100000] [--tolerance 0]
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUANTIZATION = 100000
+OBJECT_NAME = 'municipalities'
+
+
+def topology_path(geojson_path):
+    """static/data/x.geojson -> static/data/x.topo.json"""
+    root, _ = os.path.splitext(geojson_path)
+    return f'{root}.topo.json'
+
+
+def _polygons(geometry):
+    if not geometry:
+        return None, []
+    if geometry.get('type') == 'Polygon':
+        return 'Polygon', [geometry['coordinates']]
+    if geometry.get('type') == 'MultiPolygon':
+        return 'MultiPolygon', geometry['coordinates']
+    return None, []
+
+
+class _Quantizer:
+    def __init__(self, bbox, quantization):
+        min_x, min_y, max_x, max_y = bbox
+        self.translate = [min_x, min_y]
+        self.scale = [
+            (max_x - min_x) / (quantization - 1) if max_x > min_x else 1,
+            (max_y - min_y) / (quantization - 1) if max_y > min_y else 1
+        ]
+
+    def ring(self, ring):
+        """Integer points without consecutive duplicates, closed"""
+        (tx, ty), (sx, sy) = self.translate, self.scale
+        points = []
+        for x, y, *_ in ring:
+            point = (round((x - tx) / sx), round((y - ty) / sy))
+            if not points or points[-1] != point:
+                points.append(point)
+        if points and points[0] != points[-1]:
+            points.append(points[0])
+        return points
+
+
+def _bbox(features):
+    min_x = min_y = float('inf')
+    max_x = max_y = float('-inf')
+    for feature in features:
+        for polygon in _polygons(feature.get('geometry'))[1]:
+            for ring in polygon:
+                for x, y, *_ in ring:
+                    min_x, max_x = min(min_x, x), max(max_x, x)
+                    min_y, max_y = min(min_y, y), max(max_y, y)
+    return min_x, min_y, max_x, max_y
+
+
+def _junctions(rings):
+    """Points where a border forks: seen with different neighbour pairs"""
+    neighbours = {}
+    junctions = set()
+    for ring in rings:
+        count = len(ring) - 1
+        for i in range(count):
+            point = ring[i]
+            pair = frozenset((ring[i - 1] if i else ring[count - 1], ring[i + 1]))
+            seen = neighbours.setdefault(point, pair)
+            if seen != pair:
+                junctions.add(point)
+    return junctions
+
+
+def _rotate_closed(ring, start):
+    # Anel fechado reiniciado no índice start (o último ponto repete o primeiro)
+    body = ring[:-1]
+    body = body[start:] + body[:start]
+    return body + [body[0]]
+
+
+class _ArcTable:
+    def __init__(self):
+        self.arcs = []
+        self._index = {}
+
+    def add(self, points):
+        """Arc index, or ~index when the arc already exists reversed"""
+        key = tuple(points)
+        index = self._index.get(key)
+        if index is not None:
+            return index
+        index = self._index.get(key[::-1])
+        if index is not None:
+            return ~index
+        self._index[key] = len(self.arcs)
+        self.arcs.append(points)
+        return len(self.arcs) - 1
+
+    def encoded(self, tolerance=0):
+        """Arcs delta-coded: first point absolute, then differences"""
+        result = []
+        for arc in self.arcs:
+            arc = simplify_arc(arc, tolerance)
+            previous_x = previous_y = 0
+            coded = []
+            for x, y in arc:
+                coded.append([x - previous_x, y - previous_y])
+                previous_x, previous_y = x, y
+            result.append(coded)
+        return result
+
+
+def simplify_arc(points, tolerance):
+    """Douglas-Peucker keeping both ends; closed arcs keep at least 4 points"""
+    if tolerance <= 0 or len(points) <= 3:
+        return points
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        (ax, ay), (bx, by) = points[start], points[end]
+        dx, dy = bx - ax, by - ay
+        length = (dx * dx + dy * dy) ** 0.5
+        farthest, distance = None, tolerance
+        for i in range(start + 1, end):
+            px, py = points[i]
+            # Distância ao segmento AB (ou ao ponto A, se o arco for fechado)
+            d = abs(dx * (ay - py) - dy * (ax - px)) / length if length else ((px - ax) ** 2 + (py - ay) ** 2) ** 0.5
+            if d > distance:
+                farthest, distance = i, d
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((start, farthest))
+            stack.append((farthest, end))
+    simplified = [point for point, kept in zip(points, keep) if kept]
+    if points[0] == points[-1] and len(simplified) < 4:
+        return points
+    return simplified
+
+
+def _ring_arcs(ring, junctions, table):
+    if len(ring) < 4:
+        return [table.add(ring)]
+    cuts = [i for i, point in enumerate(ring[:-1]) if point in junctions]
+    if not cuts:
+        # Anel sem junções (ilha ou enclave): início canônico para casar com o vizinho
+        smallest = min(range(len(ring) - 1), key=lambda i: ring[i])
+        return [table.add(_rotate_closed(ring, smallest))]
+
+    ring = _rotate_closed(ring, cuts[0])
+    offset = cuts[0]
+    count = len(ring) - 1
+    positions = sorted((cut - offset) % count for cut in cuts) + [count]
+    return [table.add(ring[start:end + 1]) for start, end in zip(positions, positions[1:])]
+
+
+def build_topology(collection, quantization=DEFAULT_QUANTIZATION, tolerance=0):
+    """TopoJSON dict with every feature in one GeometryCollection"""
+    features = collection.get('features', [])
+    quantizer = _Quantizer(_bbox(features), quantization)
+
+    shapes = []
+    rings = []
+    for feature in features:
+        kind, polygons = _polygons(feature.get('geometry'))
+        quantized = [[quantizer.ring(ring) for ring in polygon] for polygon in polygons]
+        quantized = [[ring for ring in polygon if len(ring) >= 2] for polygon in quantized]
+        shapes.append((feature, kind, quantized))
+        rings.extend(ring for polygon in quantized for ring in polygon)
+
+    junctions = _junctions(rings)
+    table = _ArcTable()
+    geometries = []
+    for feature, kind, quantized in shapes:
+        geometry = {'type': kind, 'properties': feature.get('properties') or {}}
+        arcs = [[_ring_arcs(ring, junctions, table) for ring in polygon] for polygon in quantized if polygon]
+        if kind is None:
+            geometry['type'] = None
+        elif kind == 'Polygon':
+            geometry['arcs'] = arcs[0] if arcs else []
+        else:
+            geometry['arcs'] = arcs
+        geometries.append(geometry)
+
+    return {
+        'type': 'Topology',
+        'transform': {'scale': quantizer.scale, 'translate': quantizer.translate},
+        'objects': {OBJECT_NAME: {'type': 'GeometryCollection', 'geometries': geometries}},
+        'arcs': table.encoded(tolerance)
+    }
+
+
+def build_topology_file(geojson_path, output_path=None, quantization=DEFAULT_QUANTIZATION, tolerance=0):
+    """Write the topology next to the GeoJSON (atomic replace); returns the output path"""
+    output_path = output_path or topology_path(geojson_path)
+    started = time.perf_counter()
+    with open(geojson_path, 'r', encoding='utf-8') as f:
+        collection = json.load(f)
+
+    topology = build_topology(collection, quantization, tolerance)
+    tmp_path = f'{output_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(topology, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, output_path)
+
+    source_size = os.path.getsize(geojson_path)
+    output_size = os.path.getsize(output_path)
+    logger.info(f"Topologia gerada em {time.perf_counter() - started:.1f}s: {len(topology['arcs'])} arcos, "
+                f"{source_size / 1024:.0f} KB -> {output_size / 1024:.0f} KB "
+                f"({100 * output_size / max(source_size, 1):.0f}%)")
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerar a topologia (arcos compartilhados) dos municípios")
+    parser.add_argument('input', nargs='?', default='static/data/brazil_municipalities_all.geojson')
+    parser.add_argument('output', nargs='?')
+    parser.add_argument('--quantization', type=int, default=DEFAULT_QUANTIZATION)
+    parser.add_argument('--tolerance', type=float, default=0, help="Simplificação, em passos da grade (0 desliga)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    build_topology_file(args.input, args.output, args.quantization, args.tolerance)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Cache warming: request the heaviest read endpoints of the main crops once.
+
+Sem histórico de acessos persistido, as culturas "mais pedidas" são as de
+maior área colhida nacional (soja, milho, cana...), ou a lista em WARMUP_CROPS.
+As requisições passam pelo test_client, preenchendo os mesmos VersionedCache
+usados pelas rotas (tabela colunar, indicadores, camadas, metadados); só entram
+rotas cujo resultado fica em cache no servidor. Elas são marcadas no environ WSGI
+e não entram nas métricas HTTP nem nas contagens de acerto de cache.
+
+Variáveis de ambiente:
+    CACHE_WARMUP       background (padrão), sync ou off
+    WARMUP_CROPS       culturas separadas por vírgula (substitui o ranking por área)
+    WARMUP_TOP_CROPS   quantas culturas aquecer pelo ranking (padrão 5)
+"""
+import logging
+import os
+import threading
+import time
+from urllib.parse import quote
+
+from metrics import WARMUP_ENVIRON_KEY, metrics
+
+logger = logging.getLogger(__name__)
+
+WARMUP_MODE = os.environ.get('CACHE_WARMUP', 'background')
+WARMUP_CROPS = [crop.strip() for crop in os.environ.get('WARMUP_CROPS', '').split(',') if crop.strip()]
+WARMUP_TOP_CROPS = int(os.environ.get('WARMUP_TOP_CROPS', '5'))
+
+# Rotas por cultura com resultado em cache no servidor; gráficos e resumos são
+# recalculados a cada requisição a partir da tabela colunar, já aquecida por crop-data.
+# Geometria e hotspots ficam de fora (exigem a malha e um pool de processos)
+WARMUP_PATHS = (
+    '/api/crop-data/{crop}',
+    '/api/indicators/location_quotient?crop={crop}',
+)
+WARMUP_GLOBAL_PATHS = ('/api/crops', '/api/statistics', '/api/municipalities/metadata')
+
+
+def top_crops(app, count=WARMUP_TOP_CROPS):
+    """Crops with the largest national harvested area"""
+    import routes
+
+    with app.app_context():
+        table = routes.crop_table()
+    order = table.crop_totals.argsort()[::-1][:count]
+    return [table.crops[position] for position in order.tolist()]
+
+
+def warm_caches(app, crops=None):
+    """Fill the route caches for the given crops (default: WARMUP_CROPS or the top crops by area)"""
+    started = time.perf_counter()
+    try:
+        crops = crops or WARMUP_CROPS or top_crops(app)
+        paths = list(WARMUP_GLOBAL_PATHS) + [path.format(crop=quote(crop)) for crop in crops
+                                             for path in WARMUP_PATHS]
+        failed = 0
+        with app.test_client() as client:
+            client.environ_base[WARMUP_ENVIRON_KEY] = True
+            for path in paths:
+                response = client.get(path)
+                if response.status_code != 200 or (response.is_json and response.get_json().get('success') is False):
+                    failed += 1
+                    logger.warning(f"Aquecimento de cache falhou em {path} ({response.status_code})")
+    except Exception as e:
+        logger.error(f"Erro no aquecimento de cache: {e}")
+        return
+
+    elapsed = time.perf_counter() - started
+    metrics.set_gauge('cache_warmup_seconds', elapsed, help_text='Duration of the last cache warm-up')
+    logger.info(f"Cache aquecido em {elapsed:.2f}s ({len(crops)} culturas, {len(paths)} rotas, {failed} falhas)")
+
+
+def start(app, mode=WARMUP_MODE):
+    """Warm the caches now ('sync'), in a thread ('background') or not at all ('off')"""
+    if mode == 'sync':
+        warm_caches(app)
+    elif mode == 'background':
+        threading.Thread(target=warm_caches, args=(app,), name='cache-warmup', daemon=True).start()